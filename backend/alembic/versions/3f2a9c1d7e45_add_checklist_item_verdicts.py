@@ -0,0 +1,40 @@
+"""Add checklist item verdict cache
+
+Revision ID: 3f2a9c1d7e45
+Revises: 8b7c505a696a
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2a9c1d7e45'
+down_revision: Union[str, None] = '8b7c505a696a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('checklist_item_verdicts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cache_key', sa.String(), nullable=True),
+    sa.Column('document_hash', sa.String(), nullable=True),
+    sa.Column('item_key', sa.String(), nullable=True),
+    sa.Column('verdict_json', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_checklist_item_verdicts_cache_key'), 'checklist_item_verdicts', ['cache_key'], unique=False)
+    op.create_index(op.f('ix_checklist_item_verdicts_document_hash'), 'checklist_item_verdicts', ['document_hash'], unique=False)
+    op.create_index(op.f('ix_checklist_item_verdicts_id'), 'checklist_item_verdicts', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_checklist_item_verdicts_id'), table_name='checklist_item_verdicts')
+    op.drop_index(op.f('ix_checklist_item_verdicts_document_hash'), table_name='checklist_item_verdicts')
+    op.drop_index(op.f('ix_checklist_item_verdicts_cache_key'), table_name='checklist_item_verdicts')
+    op.drop_table('checklist_item_verdicts')
@@ -0,0 +1,40 @@
+"""Add code file review cache
+
+Revision ID: 5d8e2b4a9c13
+Revises: 3f2a9c1d7e45
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8e2b4a9c13'
+down_revision: Union[str, None] = '3f2a9c1d7e45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('code_file_reviews',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cache_key', sa.String(), nullable=True),
+    sa.Column('content_hash', sa.String(), nullable=True),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('review_json', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_code_file_reviews_cache_key'), 'code_file_reviews', ['cache_key'], unique=False)
+    op.create_index(op.f('ix_code_file_reviews_content_hash'), 'code_file_reviews', ['content_hash'], unique=False)
+    op.create_index(op.f('ix_code_file_reviews_id'), 'code_file_reviews', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_code_file_reviews_id'), table_name='code_file_reviews')
+    op.drop_index(op.f('ix_code_file_reviews_content_hash'), table_name='code_file_reviews')
+    op.drop_index(op.f('ix_code_file_reviews_cache_key'), table_name='code_file_reviews')
+    op.drop_table('code_file_reviews')
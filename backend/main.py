@@ -6,7 +6,7 @@ and AI analysis.
 """
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 load_dotenv()
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -29,7 +29,8 @@ from config.logging_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
-# Import security utilities
+# Import shared utilities
+from utils.env import is_truthy_env, safe_int_env
 from utils.security import mask_api_key
 
 # Rate limiting setup
@@ -39,32 +40,40 @@ from slowapi.errors import RateLimitExceeded
 
 limiter = Limiter(key_func=get_remote_address)
 
-from database import engine, Base, get_db
-from models import DocumentReview, AIConnection
+from database import engine, Base, get_db, AsyncSessionLocal
+from models import DocumentReview, AIConnection, ChecklistItemVerdict, CodeFileReviewCache
 from services.parser import parse_file
-from services.ai_engine import AIEngine
+from services.ai_engine import AIEngine, CODE_REVIEW_PROMPT_VERSION
 from services.checklist_loader import loader
+from services.item_verdict_cache import (
+    build_document_hash,
+    build_item_key,
+    build_profile_hash,
+    build_verdict_cache_key,
+    is_cacheable_verdict,
+)
+from services.code_diff import build_change_segments, diff_file_sets, get_diff_context_lines, parse_unified_diff
+from services.code_static_analysis import analyze_code_files, get_static_analysis_settings, merge_cross_file_findings
+from services.code_review_cache import (
+    build_code_content_hash,
+    build_code_review_cache_key,
+    compute_overall_score,
+    is_cacheable_file_review,
+)
+from services.metrics import metrics
+from services.llm_resilience import circuit_breakers
+from services.single_flight import SingleFlight
 
 app = FastAPI(title="Document Scorer API")
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 REQUEST_FINGERPRINT_PREFIX_LEN = 12
+# Identical analyses already in progress are awaited instead of re-run.
+analysis_flights = SingleFlight("document_analysis")
 ANALYSIS_FINGERPRINT_VERSION = os.getenv("ANALYSIS_FINGERPRINT_VERSION", "analysis_v6")
 
 
-def _is_truthy_env(value: str) -> bool:
-    return str(value).strip().lower() in {"1", "true", "yes", "on"}
-
-
-def _safe_int_env(name: str, default: int) -> int:
-    raw = os.getenv(name, str(default))
-    try:
-        return int(raw)
-    except (TypeError, ValueError):
-        return default
-
-
 def _sha256_text(value: str) -> str:
     return hashlib.sha256(value.encode("utf-8")).hexdigest()
 
@@ -233,6 +242,13 @@ class CodeFile(BaseModel):
 
 class CodeAnalysisRequest(BaseModel):
     files: List[CodeFile]
+    force_refresh: Optional[bool] = False
+
+class CodeDiffAnalysisRequest(BaseModel):
+    diff: Optional[str] = None
+    base_files: Optional[List[CodeFile]] = None
+    head_files: Optional[List[CodeFile]] = None
+    context_lines: Optional[int] = None
 
 class CodeAutoFixRequest(BaseModel):
     filename: str
@@ -247,6 +263,16 @@ class CodeAutoFixBatchRequest(BaseModel):
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Return in-process request and LLM call metrics for this worker."""
+    return metrics.snapshot()
+
+@app.get("/api/llm/circuit-breakers")
+async def get_circuit_breakers():
+    """Return the state of every LLM provider/model circuit breaker in this worker."""
+    return {"circuit_breakers": circuit_breakers.snapshot()}
+
 @app.get("/api/checklists")
 async def get_checklists():
     return {"categories": loader.get_categories()}
@@ -441,144 +467,462 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
         # Don't expose stack traces to users
         raise HTTPException(status_code=500, detail="File upload failed. Please check the file format and try again.")
 
-@app.post("/api/analyze")
-@limiter.limit("10/minute")
-async def analyze_document(request: Request, analysis_request: AnalysisRequest, db: AsyncSession = Depends(get_db)):
-    """Analyze a document with proper error handling and API key decryption."""
-    try:
-        # Fetch active connection
-        result = await db.execute(select(AIConnection).where(AIConnection.is_active == True))
-        active_conn = result.scalars().first()
+async def _prepare_document_analysis(
+    analysis_request: AnalysisRequest,
+    db: AsyncSession
+) -> Dict[str, object]:
+    """Resolve the active connection, engine and cache fingerprint for a document analysis."""
+    # Fetch active connection
+    result = await db.execute(select(AIConnection).where(AIConnection.is_active == True))
+    active_conn = result.scalars().first()
+
+    if not active_conn:
+        raise HTTPException(
+            status_code=400,
+            detail="No active AI connection found. Please configure one in Settings."
+        )
 
-        if not active_conn:
-            raise HTTPException(
-                status_code=400,
-                detail="No active AI connection found. Please configure one in Settings."
-            )
+    # Bug #2 guard: explicitly empty list means user deselected all items — reject it
+    # None is the accepted default meaning "use full checklist"
+    if analysis_request.enabled_checks is not None and len(analysis_request.enabled_checks) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="No checklist items selected. Please select at least one item before running the analysis."
+        )
 
-        # Bug #2 guard: explicitly empty list means user deselected all items — reject it
-        # None is the accepted default meaning "use full checklist"
-        if analysis_request.enabled_checks is not None and len(analysis_request.enabled_checks) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="No checklist items selected. Please select at least one item before running the analysis."
-            )
+    # Use API key directly
+    api_key = ""
+    if active_conn.api_key:
+        api_key = active_conn.api_key
+
+    provider = active_conn.provider
+    model_name = active_conn.model_name
+
+    engine = AIEngine(provider=provider, model_name=model_name, api_key=api_key)
+    deterministic_profile = engine.get_deterministic_profile_metadata()
+    checklist_snapshot_hash = _get_checklist_snapshot_hash(analysis_request.document_category)
+    request_fingerprint = _build_request_fingerprint(
+        analysis_request=analysis_request,
+        provider=provider,
+        model_name=model_name,
+        deterministic_profile=deterministic_profile,
+        checklist_snapshot_hash=checklist_snapshot_hash
+    )
+
+    cache_mode = os.getenv("LLM_CACHE_MODE", "exact_input").strip().lower()
+    document_hash = build_document_hash(
+        analysis_request.text,
+        analysis_request.images,
+        analysis_request.file_type,
+        analysis_request.custom_instructions,
+        analysis_request.pagination_metadata
+    )
+    profile_hash = build_profile_hash(provider, model_name, deterministic_profile, ANALYSIS_FINGERPRINT_VERSION)
+    return {
+        "engine": engine,
+        "provider": provider,
+        "model_name": model_name,
+        "request_fingerprint": request_fingerprint,
+        "fingerprint_short": request_fingerprint[:REQUEST_FINGERPRINT_PREFIX_LEN],
+        "cache_mode": cache_mode,
+        "use_exact_cache": cache_mode == "exact_input",
+        "force_refresh": bool(analysis_request.force_refresh),
+        "cache_ttl_days": safe_int_env("LLM_CACHE_MAX_AGE_DAYS", 30),
+        "deterministic_mode": bool(deterministic_profile.get("deterministic_mode", False)),
+        "use_item_cache": is_truthy_env(os.getenv("LLM_ITEM_CACHE_ENABLED", "true")),
+        "document_hash": document_hash,
+        "profile_hash": profile_hash,
+    }
 
-        # Use API key directly
-        api_key = ""
-        if active_conn.api_key:
-            api_key = active_conn.api_key
 
-        provider = active_conn.provider
-        model_name = active_conn.model_name
+def _build_analysis_metadata(
+    analysis_context: Dict[str, object],
+    cache_hit: bool,
+    item_cache_hits: int = 0,
+    coalesced: bool = False
+) -> Dict[str, object]:
+    return {
+        "cache_hit": cache_hit,
+        "item_cache_hits": item_cache_hits,
+        "coalesced": coalesced,
+        "request_fingerprint": analysis_context["fingerprint_short"],
+        "deterministic_mode": analysis_context["deterministic_mode"],
+        "cache_mode": analysis_context["cache_mode"],
+        "provider": analysis_context["provider"],
+        "model_name": analysis_context["model_name"]
+    }
 
-        engine = AIEngine(provider=provider, model_name=model_name, api_key=api_key)
-        deterministic_profile = engine.get_deterministic_profile_metadata()
-        checklist_snapshot_hash = _get_checklist_snapshot_hash(analysis_request.document_category)
-        request_fingerprint = _build_request_fingerprint(
-            analysis_request=analysis_request,
-            provider=provider,
-            model_name=model_name,
-            deterministic_profile=deterministic_profile,
-            checklist_snapshot_hash=checklist_snapshot_hash
+
+async def _load_cached_review(db: AsyncSession, analysis_context: Dict[str, object]) -> Optional[dict]:
+    """Return a cached review payload for the request fingerprint, or None on a miss."""
+    if not analysis_context["use_exact_cache"] or analysis_context["force_refresh"]:
+        return None
+
+    fingerprint_short = analysis_context["fingerprint_short"]
+    cache_ttl_days = analysis_context["cache_ttl_days"]
+    cache_query = (
+        select(DocumentReview)
+        .where(DocumentReview.content_hash == analysis_context["request_fingerprint"])
+        .order_by(DocumentReview.created_at.desc(), DocumentReview.id.desc())
+        .limit(1)
+    )
+    if cache_ttl_days > 0:
+        cutoff = datetime.utcnow() - timedelta(days=cache_ttl_days)
+        cache_query = cache_query.where(DocumentReview.created_at >= cutoff)
+
+    cache_result = await db.execute(cache_query)
+    cached_review = cache_result.scalars().first()
+    if not cached_review or not isinstance(cached_review.full_response_json, dict):
+        return None
+
+    cached_payload = _json_deepcopy(cached_review.full_response_json)
+    if _looks_like_error_review_payload(cached_payload):
+        logger.warning(
+            f"Skipping cached error payload for analysis_fingerprint={fingerprint_short}"
         )
-        fingerprint_short = request_fingerprint[:REQUEST_FINGERPRINT_PREFIX_LEN]
-
-        cache_mode = os.getenv("LLM_CACHE_MODE", "exact_input").strip().lower()
-        use_exact_cache = cache_mode == "exact_input"
-        force_refresh = bool(analysis_request.force_refresh)
-        cache_ttl_days = _safe_int_env("LLM_CACHE_MAX_AGE_DAYS", 30)
-        deterministic_mode = bool(deterministic_profile.get("deterministic_mode", False))
-
-        if use_exact_cache and not force_refresh:
-            cache_query = (
-                select(DocumentReview)
-                .where(DocumentReview.content_hash == request_fingerprint)
-                .order_by(DocumentReview.created_at.desc(), DocumentReview.id.desc())
-                .limit(1)
+        return None
+
+    metadata = cached_payload.get("analysis_metadata", {})
+    if not isinstance(metadata, dict):
+        metadata = {}
+
+    metadata.update(_build_analysis_metadata(analysis_context, cache_hit=True))
+    cached_payload["analysis_metadata"] = metadata
+
+    logger.info(
+        f"analysis_fingerprint={fingerprint_short} cache_hit=True "
+        f"force_refresh={analysis_context['force_refresh']} "
+        f"provider={analysis_context['provider']}/{analysis_context['model_name']} "
+        f"deterministic_mode={analysis_context['deterministic_mode']}"
+    )
+    return cached_payload
+
+
+async def _save_review_result(
+    db: AsyncSession,
+    analysis_context: Dict[str, object],
+    analysis_request: AnalysisRequest,
+    review_result: dict
+) -> None:
+    """Persist a fresh review in the exact-input cache unless it is an error payload."""
+    fingerprint_short = analysis_context["fingerprint_short"]
+    if analysis_context["use_exact_cache"] and not _looks_like_error_review_payload(review_result):
+        try:
+            review_record = DocumentReview(
+                filename=analysis_request.filename or "",
+                content_hash=analysis_context["request_fingerprint"],
+                score=float(review_result.get("score", 0)),
+                full_response_json=_json_deepcopy(review_result)
             )
-            if cache_ttl_days > 0:
-                cutoff = datetime.utcnow() - timedelta(days=cache_ttl_days)
-                cache_query = cache_query.where(DocumentReview.created_at >= cutoff)
-
-            cache_result = await db.execute(cache_query)
-            cached_review = cache_result.scalars().first()
-            if cached_review and isinstance(cached_review.full_response_json, dict):
-                cached_payload = _json_deepcopy(cached_review.full_response_json)
-                if _looks_like_error_review_payload(cached_payload):
-                    logger.warning(
-                        f"Skipping cached error payload for analysis_fingerprint={fingerprint_short}"
-                    )
-                else:
-                    metadata = cached_payload.get("analysis_metadata", {})
-                    if not isinstance(metadata, dict):
-                        metadata = {}
-
-                    metadata.update({
-                        "cache_hit": True,
-                        "request_fingerprint": fingerprint_short,
-                        "deterministic_mode": deterministic_mode,
-                        "cache_mode": cache_mode,
-                        "provider": provider,
-                        "model_name": model_name
-                    })
-                    cached_payload["analysis_metadata"] = metadata
-
-                    logger.info(
-                        f"analysis_fingerprint={fingerprint_short} cache_hit=True force_refresh={force_refresh} "
-                        f"provider={provider}/{model_name} deterministic_mode={deterministic_mode}"
-                    )
-                    return cached_payload
+            db.add(review_record)
+            await db.commit()
+        except Exception as cache_save_error:
+            await db.rollback()
+            logger.warning(f"Failed to save analysis cache entry: {cache_save_error}")
+    elif analysis_context["use_exact_cache"]:
+        logger.warning(
+            f"Not caching error/fallback analysis payload for analysis_fingerprint={fingerprint_short}"
+        )
+
+    logger.info(
+        f"analysis_fingerprint={fingerprint_short} cache_hit=False "
+        f"force_refresh={analysis_context['force_refresh']} "
+        f"provider={analysis_context['provider']}/{analysis_context['model_name']} "
+        f"deterministic_mode={analysis_context['deterministic_mode']}"
+    )
+
+
+async def _load_cached_item_verdicts(
+    db: AsyncSession,
+    analysis_context: Dict[str, object],
+    analysis_request: AnalysisRequest
+) -> Dict[str, dict]:
+    """Return cached final verdicts for the selected checklist items, keyed by item key."""
+    if not analysis_context["use_item_cache"] or analysis_context["force_refresh"]:
+        return {}
+    if not analysis_request.document_category:
+        return {}
+
+    selected_items = loader.get_selected_checklist_items(
+        analysis_request.document_category,
+        analysis_request.enabled_checks
+    )
+    cache_keys_by_item: Dict[str, str] = {}
+    for checklist_item in selected_items:
+        item_key = build_item_key(checklist_item.get("section"), checklist_item.get("checklist_item"))
+        cache_keys_by_item[item_key] = build_verdict_cache_key(
+            analysis_context["document_hash"], item_key, analysis_context["profile_hash"]
+        )
+    if not cache_keys_by_item:
+        return {}
 
-        review_result = await engine.analyze_document(
+    try:
+        verdict_query = (
+            select(ChecklistItemVerdict)
+            .where(ChecklistItemVerdict.document_hash == analysis_context["document_hash"])
+            .where(ChecklistItemVerdict.cache_key.in_(list(cache_keys_by_item.values())))
+            .order_by(ChecklistItemVerdict.created_at.desc(), ChecklistItemVerdict.id.desc())
+        )
+        cache_ttl_days = analysis_context["cache_ttl_days"]
+        if cache_ttl_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=cache_ttl_days)
+            verdict_query = verdict_query.where(ChecklistItemVerdict.created_at >= cutoff)
+        verdict_result = await db.execute(verdict_query)
+        verdict_rows = verdict_result.scalars().all()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Failed to read item verdict cache: {e}")
+        return {}
+
+    cached_verdicts: Dict[str, dict] = {}
+    for row in verdict_rows:
+        # Rows are newest first; keep only the latest verdict per item.
+        if row.item_key in cached_verdicts or not is_cacheable_verdict(row.verdict_json):
+            continue
+        cached_verdicts[row.item_key] = _json_deepcopy(row.verdict_json)
+
+    logger.info(
+        f"analysis_fingerprint={analysis_context['fingerprint_short']} "
+        f"item_cache_hits={len(cached_verdicts)}/{len(cache_keys_by_item)}"
+    )
+    return cached_verdicts
+
+
+async def _save_item_verdicts(
+    db: AsyncSession,
+    analysis_context: Dict[str, object],
+    review_result: dict,
+    cached_verdicts: Dict[str, dict]
+) -> None:
+    """Store freshly computed per-item verdicts so later requests can reuse them."""
+    if not analysis_context["use_item_cache"] or _looks_like_error_review_payload(review_result):
+        return
+
+    new_rows = []
+    for item in review_result.get("checklist", []):
+        if not is_cacheable_verdict(item):
+            continue
+        item_key = build_item_key(item.get("section"), item.get("item"))
+        if item_key in cached_verdicts and not analysis_context["force_refresh"]:
+            continue
+        new_rows.append(ChecklistItemVerdict(
+            cache_key=build_verdict_cache_key(
+                analysis_context["document_hash"], item_key, analysis_context["profile_hash"]
+            ),
+            document_hash=analysis_context["document_hash"],
+            item_key=item_key,
+            verdict_json=_json_deepcopy(item)
+        ))
+
+    if not new_rows:
+        return
+    try:
+        db.add_all(new_rows)
+        await db.commit()
+    except Exception as verdict_save_error:
+        await db.rollback()
+        logger.warning(f"Failed to save item verdict cache entries: {verdict_save_error}")
+
+
+async def _run_document_analysis(
+    analysis_context: Dict[str, object],
+    analysis_request: AnalysisRequest
+) -> dict:
+    """Run a full (non-streamed) analysis and persist its caches.
+
+    Uses its own session because it may outlive the request that started it
+    when other requests are coalesced onto it.
+    """
+    async with AsyncSessionLocal() as flight_db:
+        cached_verdicts = await _load_cached_item_verdicts(flight_db, analysis_context, analysis_request)
+        review_result = await analysis_context["engine"].analyze_document(
             analysis_request.text,
             analysis_request.images or [],
             analysis_request.custom_instructions,
             analysis_request.document_category,
             analysis_request.file_type,
             analysis_request.enabled_checks,
-            analysis_request.pagination_metadata
+            analysis_request.pagination_metadata,
+            cached_verdicts
         )
 
-        review_result["analysis_metadata"] = {
-            "cache_hit": False,
-            "request_fingerprint": fingerprint_short,
-            "deterministic_mode": deterministic_mode,
-            "cache_mode": cache_mode,
-            "provider": provider,
-            "model_name": model_name
-        }
-
-        if use_exact_cache and not _looks_like_error_review_payload(review_result):
-            try:
-                review_record = DocumentReview(
-                    filename=analysis_request.filename or "",
-                    content_hash=request_fingerprint,
-                    score=float(review_result.get("score", 0)),
-                    full_response_json=_json_deepcopy(review_result)
-                )
-                db.add(review_record)
-                await db.commit()
-            except Exception as cache_save_error:
-                await db.rollback()
-                logger.warning(f"Failed to save analysis cache entry: {cache_save_error}")
-        elif use_exact_cache:
-            logger.warning(
-                f"Not caching error/fallback analysis payload for analysis_fingerprint={fingerprint_short}"
-            )
-
+        review_result["analysis_metadata"] = _build_analysis_metadata(
+            analysis_context, cache_hit=False, item_cache_hits=len(cached_verdicts)
+        )
+        await _save_item_verdicts(flight_db, analysis_context, review_result, cached_verdicts)
+        await _save_review_result(flight_db, analysis_context, analysis_request, review_result)
+    return review_result
+
+
+async def _run_coalesced_document_analysis(
+    analysis_context: Dict[str, object],
+    analysis_request: AnalysisRequest
+) -> dict:
+    """Run the analysis, or await an identical one that is already in flight."""
+    shared_result, coalesced = await analysis_flights.run(
+        analysis_context["request_fingerprint"],
+        lambda: _run_document_analysis(analysis_context, analysis_request)
+    )
+    # The leader and every follower share one result object; hand out copies.
+    review_result = _json_deepcopy(shared_result)
+    metadata = review_result.get("analysis_metadata")
+    if isinstance(metadata, dict):
+        metadata["coalesced"] = coalesced
+    if coalesced:
         logger.info(
-            f"analysis_fingerprint={fingerprint_short} cache_hit=False force_refresh={force_refresh} "
-            f"provider={provider}/{model_name} deterministic_mode={deterministic_mode}"
+            f"analysis_fingerprint={analysis_context['fingerprint_short']} coalesced=True "
+            f"provider={analysis_context['provider']}/{analysis_context['model_name']}"
         )
+    return review_result
 
-        return review_result
+
+def _format_sse_event(event: str, data: object) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/analyze")
+@limiter.limit("10/minute")
+async def analyze_document(request: Request, analysis_request: AnalysisRequest, db: AsyncSession = Depends(get_db)):
+    """Analyze a document with proper error handling and API key decryption."""
+    try:
+        analysis_context = await _prepare_document_analysis(analysis_request, db)
+        cached_payload = await _load_cached_review(db, analysis_context)
+        if cached_payload is not None:
+            return cached_payload
+
+        return await _run_coalesced_document_analysis(analysis_context, analysis_request)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Document analysis failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Document analysis failed. Please try again.")
 
+@app.post("/api/analyze/stream")
+@limiter.limit("10/minute")
+async def analyze_document_stream(request: Request, analysis_request: AnalysisRequest, db: AsyncSession = Depends(get_db)):
+    """Analyze a document and stream per-batch results as server-sent events.
+
+    Emits a `batch` event as each checklist batch or CAR chunk completes, then a
+    single `result` event with the merged, scored review (the same payload
+    `/api/analyze` returns). Failures after the stream starts are reported as an
+    `error` event.
+    """
+    try:
+        analysis_context = await _prepare_document_analysis(analysis_request, db)
+        cached_payload = await _load_cached_review(db, analysis_context)
+        cached_verdicts = (
+            await _load_cached_item_verdicts(db, analysis_context, analysis_request)
+            if cached_payload is None else {}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Document analysis failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Document analysis failed. Please try again.")
+
+    async def event_stream():
+        if cached_payload is not None:
+            yield _format_sse_event("result", cached_payload)
+            return
+
+        request_key = analysis_context["request_fingerprint"]
+        if analysis_flights.get(request_key) is not None:
+            # An identical analysis is already running; wait for its final result only.
+            try:
+                review_result = await _run_coalesced_document_analysis(analysis_context, analysis_request)
+                yield _format_sse_event("result", review_result)
+            except Exception as e:
+                logger.error(f"Streaming document analysis failed: {e}", exc_info=True)
+                yield _format_sse_event("error", {"detail": "Document analysis failed. Please try again."})
+            return
+
+        flight = analysis_flights.begin(request_key)
+        try:
+            async for event in analysis_context["engine"].analyze_document_stream(
+                analysis_request.text,
+                analysis_request.images or [],
+                analysis_request.custom_instructions,
+                analysis_request.document_category,
+                analysis_request.file_type,
+                analysis_request.enabled_checks,
+                analysis_request.pagination_metadata,
+                cached_verdicts
+            ):
+                if event["event"] == "result":
+                    review_result = event["data"]
+                    review_result["analysis_metadata"] = _build_analysis_metadata(
+                        analysis_context, cache_hit=False, item_cache_hits=len(cached_verdicts)
+                    )
+                    # The request-scoped session may already be closed once streaming starts.
+                    async with AsyncSessionLocal() as stream_db:
+                        await _save_item_verdicts(stream_db, analysis_context, review_result, cached_verdicts)
+                        await _save_review_result(stream_db, analysis_context, analysis_request, review_result)
+                    analysis_flights.finish(request_key, flight, review_result)
+                yield _format_sse_event(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Streaming document analysis failed: {e}", exc_info=True)
+            yield _format_sse_event("error", {"detail": "Document analysis failed. Please try again."})
+        finally:
+            # No-op once finished; otherwise followers fall back to running the analysis themselves.
+            analysis_flights.abandon(request_key, flight)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _load_cached_code_reviews(db: AsyncSession, cache_keys: List[str]) -> Dict[str, dict]:
+    """Return cached per-file code reviews, keyed by cache key."""
+    if not cache_keys:
+        return {}
+    try:
+        review_query = (
+            select(CodeFileReviewCache)
+            .where(CodeFileReviewCache.cache_key.in_(cache_keys))
+            .order_by(CodeFileReviewCache.created_at.desc(), CodeFileReviewCache.id.desc())
+        )
+        cache_ttl_days = safe_int_env("LLM_CACHE_MAX_AGE_DAYS", 30)
+        if cache_ttl_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=cache_ttl_days)
+            review_query = review_query.where(CodeFileReviewCache.created_at >= cutoff)
+        review_result = await db.execute(review_query)
+        review_rows = review_result.scalars().all()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Failed to read code review cache: {e}")
+        return {}
+
+    cached_reviews: Dict[str, dict] = {}
+    for row in review_rows:
+        # Newest first; keep the first row seen per key.
+        if row.cache_key not in cached_reviews and is_cacheable_file_review(row.review_json):
+            cached_reviews[row.cache_key] = row.review_json
+    return cached_reviews
+
+
+async def _save_code_reviews(db: AsyncSession, fresh_reviews: List[tuple]) -> None:
+    """Store freshly computed per-file reviews as (cache_key, content_hash, review) tuples."""
+    new_rows = [
+        CodeFileReviewCache(
+            cache_key=cache_key,
+            content_hash=content_hash,
+            filename=review.get("filename"),
+            review_json=_json_deepcopy(review)
+        )
+        for cache_key, content_hash, review in fresh_reviews
+        if is_cacheable_file_review(review)
+    ]
+    if not new_rows:
+        return
+    try:
+        db.add_all(new_rows)
+        await db.commit()
+    except Exception as review_save_error:
+        await db.rollback()
+        logger.warning(f"Failed to save code review cache entries: {review_save_error}")
+
+
 @app.post("/api/analyze-code")
 @limiter.limit("10/minute")
 async def analyze_code(request: Request, code_request: CodeAnalysisRequest, db: AsyncSession = Depends(get_db)):
@@ -636,14 +980,138 @@ async def analyze_code(request: Request, code_request: CodeAnalysisRequest, db:
 
         engine = AIEngine(provider=provider, model_name=model_name, api_key=api_key)
         files_data = [{"filename": f.filename, "content": f.content} for f in code_request.files]
-        review_result = await engine.analyze_code(files_data)
-        return review_result
+
+        # Unchanged files reuse their stored review; only the rest go to the model.
+        use_code_cache = is_truthy_env(os.getenv("LLM_CODE_REVIEW_CACHE_ENABLED", "true"))
+        profile = engine.get_deterministic_profile_metadata()
+        code_profile = {key: profile.get(key) for key in ("version", "deterministic_mode", "temperature", "top_p", "seed", "top_k", "code_static_analysis")}
+        file_keys = []
+        for file_data in files_data:
+            content_hash = build_code_content_hash(file_data["content"])
+            file_keys.append((
+                build_code_review_cache_key(
+                    content_hash, file_data["filename"], provider, model_name, code_profile, CODE_REVIEW_PROMPT_VERSION
+                ),
+                content_hash,
+            ))
+        cached_reviews = (
+            await _load_cached_code_reviews(db, [cache_key for cache_key, _ in file_keys])
+            if use_code_cache and not code_request.force_refresh else {}
+        )
+
+        files_to_review = [
+            file_data
+            for file_data, (cache_key, _) in zip(files_data, file_keys)
+            if cache_key not in cached_reviews
+        ]
+        # Static analysis covers every submitted file, so duplicates against unchanged files are still found.
+        static_analyses = analyze_code_files(files_data) if get_static_analysis_settings()["mode"] == "on" else {}
+        fresh_result = (
+            await engine.analyze_code(files_to_review, static_analyses)
+            if files_to_review else {"files": []}
+        )
+        fresh_by_filename = {
+            review.get("filename"): review
+            for review in fresh_result.get("files", [])
+            if isinstance(review, dict)
+        }
+        file_reviews = []
+        fresh_reviews = []
+        for file_data, (cache_key, content_hash) in zip(files_data, file_keys):
+            cached_review = cached_reviews.get(cache_key)
+            if cached_review is not None:
+                review = _json_deepcopy(cached_review)
+                review["filename"] = file_data["filename"]
+                file_reviews.append(review)
+                continue
+            review = fresh_by_filename.get(file_data["filename"])
+            if review is not None:
+                file_reviews.append(review)
+                fresh_reviews.append((cache_key, content_hash, review))
+        # Error rows such as "System Error" do not belong to a submitted file; keep them visible.
+        submitted_filenames = {file_data["filename"] for file_data in files_data}
+        file_reviews.extend(
+            review for filename, review in fresh_by_filename.items() if filename not in submitted_filenames
+        )
+
+        if use_code_cache:
+            await _save_code_reviews(db, fresh_reviews)
+        # Duplicates of other files depend on what else was submitted; attach them after caching.
+        merge_cross_file_findings(file_reviews, static_analyses)
+        metrics.increment("code_review_cache_hits_total", len(files_data) - len(files_to_review))
+        metrics.increment("code_review_cache_misses_total", len(files_to_review))
+        logger.info(
+            "Code review cache: "
+            f"files={len(files_data)} "
+            f"reused={len(files_data) - len(files_to_review)} "
+            f"reviewed={len(files_to_review)}"
+        )
+        return {
+            "overall_score": compute_overall_score(file_reviews),
+            "files": file_reviews,
+            "analysis_metadata": {
+                "cache_hits": len(files_data) - len(files_to_review),
+                "files_reviewed": len(files_to_review),
+            },
+        }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Code analysis failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Code analysis failed. Please try again.")
 
+@app.post("/api/analyze-code-diff")
+@limiter.limit("10/minute")
+async def analyze_code_diff(request: Request, diff_request: CodeDiffAnalysisRequest, db: AsyncSession = Depends(get_db)):
+    """Review only the changed regions of a unified diff or of base/head file sets."""
+    try:
+        result = await db.execute(select(AIConnection).where(AIConnection.is_active == True))
+        active_conn = result.scalars().first()
+
+        if not active_conn:
+            raise HTTPException(
+                status_code=400,
+                detail="No active AI connection found. Please configure one in Settings."
+            )
+
+        head_files = [{"filename": f.filename, "content": f.content} for f in diff_request.head_files or []]
+        if diff_request.diff and diff_request.diff.strip():
+            changes = parse_unified_diff(diff_request.diff)
+        elif head_files:
+            base_files = [{"filename": f.filename, "content": f.content} for f in diff_request.base_files or []]
+            changes = diff_file_sets(base_files, head_files)
+        else:
+            raise HTTPException(status_code=400, detail="Provide either a unified diff or head_files to compare.")
+
+        context_lines = (
+            max(0, diff_request.context_lines) if diff_request.context_lines is not None else get_diff_context_lines()
+        )
+        segments = build_change_segments(changes, head_files, context_lines)
+        if not segments:
+            return {
+                "overall_score": 0,
+                "files": [],
+                "analysis_metadata": {"files_changed": 0, "changed_lines": 0, "context_lines": context_lines},
+            }
+
+        engine = AIEngine(
+            provider=active_conn.provider,
+            model_name=active_conn.model_name,
+            api_key=active_conn.api_key or ""
+        )
+        review_result = await engine.analyze_code_changes(segments)
+        review_result["analysis_metadata"] = {
+            "files_changed": len(segments),
+            "changed_lines": sum(segment["changed_line_count"] for segment in segments),
+            "context_lines": context_lines,
+        }
+        return review_result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Code diff analysis failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Code diff analysis failed. Please try again.")
+
 @app.post("/api/auto-fix-code")
 @limiter.limit("5/minute")
 async def auto_fix_code(request: Request, auto_fix_request: CodeAutoFixRequest, db: AsyncSession = Depends(get_db)):
@@ -683,6 +1151,26 @@ async def auto_fix_code(request: Request, auto_fix_request: CodeAutoFixRequest,
         logger.error(f"Code auto-fix failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Code auto-fix failed. Please try again.")
 
+def _auto_fix_files_data(files: List[CodeAutoFixRequest]) -> List[dict]:
+    return [
+        {
+            "filename": f.filename,
+            "content": f.content,
+            "selected_suggestions": f.selected_suggestions
+        }
+        for f in files
+    ]
+
+
+def _untouched_fix_files(batch_request: CodeAutoFixBatchRequest) -> List[dict]:
+    """Files submitted without selected suggestions, returned as they are."""
+    return [
+        {"filename": f.filename, "status": "unchanged", "fixed_code": f.content}
+        for f in batch_request.files
+        if not f.selected_suggestions
+    ]
+
+
 @app.post("/api/auto-fix-code-batch")
 @limiter.limit("5/minute")
 async def auto_fix_code_batch(request: Request, batch_request: CodeAutoFixBatchRequest, db: AsyncSession = Depends(get_db)):
@@ -700,50 +1188,76 @@ async def auto_fix_code_batch(request: Request, batch_request: CodeAutoFixBatchR
 
         valid_files = [f for f in batch_request.files if f.selected_suggestions]
         if not valid_files:
-            return {
-                "fixed_files": [
-                    {"filename": f.filename, "fixed_code": f.content}
-                    for f in batch_request.files
-                ]
-            }
+            return {"fixed_files": _untouched_fix_files(batch_request)}
 
-        # Use API key directly
-        api_key = ""
-        if active_conn.api_key:
-            api_key = active_conn.api_key
-
-        provider = active_conn.provider
-        model_name = active_conn.model_name
-
-        engine = AIEngine(provider=provider, model_name=model_name, api_key=api_key)
+        engine = AIEngine(
+            provider=active_conn.provider,
+            model_name=active_conn.model_name,
+            api_key=active_conn.api_key or ""
+        )
+        fixed_result = await engine.auto_fix_code_batch(_auto_fix_files_data(valid_files))
 
-        files_data = [
-            {
-                "filename": f.filename,
-                "content": f.content,
-                "selected_suggestions": f.selected_suggestions
-            }
-            for f in valid_files
-        ]
+        # Merge untouched files back into result
+        fixed_result.setdefault("fixed_files", []).extend(_untouched_fix_files(batch_request))
+        return fixed_result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch code auto-fix failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Batch code auto-fix failed. Please try again.")
 
-        fixed_result = await engine.auto_fix_code_batch(files_data)
+@app.post("/api/auto-fix-code-batch/stream")
+@limiter.limit("5/minute")
+async def auto_fix_code_batch_stream(request: Request, batch_request: CodeAutoFixBatchRequest, db: AsyncSession = Depends(get_db)):
+    """Auto-fix code files in parallel and stream each file as server-sent events.
+
+    Emits a `file` event as each file finishes (in completion order), then a
+    single `result` event with every file in submitted order (the same payload
+    `/api/auto-fix-code-batch` returns). Failures after the stream starts are
+    reported as an `error` event.
+    """
+    try:
+        result = await db.execute(select(AIConnection).where(AIConnection.is_active == True))
+        active_conn = result.scalars().first()
 
-        # Merge untouched files back into result
-        untouched_files = [f for f in batch_request.files if not f.selected_suggestions]
-        if untouched_files:
-            for f in untouched_files:
-                fixed_result.get("fixed_files", []).append({
-                    "filename": f.filename,
-                    "fixed_code": f.content
-                })
+        if not active_conn:
+            raise HTTPException(
+                status_code=400,
+                detail="No active AI connection found. Please configure one in Settings."
+            )
 
-        return fixed_result
+        engine = AIEngine(
+            provider=active_conn.provider,
+            model_name=active_conn.model_name,
+            api_key=active_conn.api_key or ""
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Batch code auto-fix failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Batch code auto-fix failed. Please try again.")
 
+    valid_files = [f for f in batch_request.files if f.selected_suggestions]
+
+    async def event_stream():
+        try:
+            if not valid_files:
+                yield _format_sse_event("result", {"fixed_files": _untouched_fix_files(batch_request)})
+                return
+            async for event in engine.auto_fix_code_batch_stream(_auto_fix_files_data(valid_files)):
+                if event["event"] == "result":
+                    event["data"]["fixed_files"].extend(_untouched_fix_files(batch_request))
+                yield _format_sse_event(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Streaming batch code auto-fix failed: {e}", exc_info=True)
+            yield _format_sse_event("error", {"detail": "Batch code auto-fix failed. Please try again."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 # Security Headers Middleware
 @app.middleware("http")
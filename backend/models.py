@@ -28,3 +28,25 @@ class AIConnection(Base):
     model_name = Column(String)
     api_key = Column(String, nullable=True)
     is_active = Column(Boolean, default=False)
+
+class ChecklistItemVerdict(Base):
+    """Model for caching individual checklist item verdicts across analyses."""
+    __tablename__ = "checklist_item_verdicts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, index=True)
+    document_hash = Column(String, index=True)
+    item_key = Column(String)
+    verdict_json = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class CodeFileReviewCache(Base):
+    """Model for caching per-file code review results across analyses."""
+    __tablename__ = "code_file_reviews"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, index=True)
+    content_hash = Column(String, index=True)
+    filename = Column(String)
+    review_json = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
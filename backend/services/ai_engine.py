@@ -3,40 +3,117 @@ from langchain_community.chat_models import ChatOllama
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable
 import json
 import os
 import logging
 import asyncio
+import hashlib
 import math
 import re
 import tiktoken
 from config.logging_config import get_logger
+from services.document_markers import DocumentMarkers, scan_document_markers
+from services.page_reference_index import PageReferenceIndex
+from services.symbol_map import global_symbol_maps
+from services.vision_prepass import (
+    VISION_DESCRIPTION_PROMPT,
+    format_image_descriptions,
+    get_vision_prepass_mode,
+    hash_image,
+    image_descriptions,
+    normalize_image_description,
+)
+from services.code_batching import (
+    build_file_segments,
+    get_code_batching_settings,
+    merge_file_part_reviews,
+    pack_segments,
+    render_numbered_lines,
+)
+from services.code_patches import (
+    apply_line_edits,
+    build_fix_regions,
+    edits_within_regions,
+    get_auto_fix_concurrency,
+    get_auto_fix_output_mode,
+    get_auto_fix_region_settings,
+    parse_suggestion_ranges,
+)
+from services.code_static_analysis import analyze_code_files, get_static_analysis_settings, render_static_context
+from services.code_validation import get_validation_settings, has_validator, validate_code
+from services.json_salvage import (
+    IncrementalJsonParser,
+    RepairingJsonOutputParser,
+    get_json_salvage_settings,
+    parse_llm_json,
+)
+from services.code_diff import suggestion_in_regions
+from services.figure_regions import describe_image_source
+from services.image_renditions import get_image_pyramid_settings, image_previews
+from services.vision_page_selection import get_vision_page_selection_mode, select_page_images
+from services.page_retrieval import PageRetrievalPlanner, get_page_retrieval_settings
+from services.item_verdict_cache import build_item_key
+from services.llm_scheduler import ScheduledChain, llm_scheduler
+from services.car_routing import CarChecklistRouter, build_routed_out_result, is_car_routing_enabled
+from services.checklist_merge import (
+    format_review_status,
+    merge_batch_results,
+    merge_chunk_results,
+    normalize_review_status,
+)
+from services.llm_resilience import (
+    CircuitOpenError,
+    classify_llm_error,
+    compute_retry_delay,
+    get_retry_after_seconds,
+    is_retryable,
+)
+from services.metrics import metrics
+from utils.env import is_truthy_env, safe_float_env, safe_int_env
 
 logger = get_logger(__name__)
 DETERMINISTIC_PROFILE_VERSION = "det_profile_v4"
-
-
-def _is_truthy_env(value: str) -> bool:
-    return value.strip().lower() in {"1", "true", "yes", "on"}
-
-
-def _safe_float_env(name: str, default: float) -> float:
-    raw = os.getenv(name, str(default))
-    try:
-        return float(raw)
-    except (TypeError, ValueError):
-        return default
-
-
-def _safe_int_env(name: str, default: int) -> int:
-    raw = os.getenv(name, str(default))
-    try:
-        return int(raw)
-    except (TypeError, ValueError):
-        return default
+# Bump when the code review prompt or batching changes what a file review looks like.
+CODE_REVIEW_PROMPT_VERSION = "code_review_prompt_v2"
+
+CODE_STATIC_ANALYSIS_NOTE = (
+    "\n        STATIC ANALYSIS:\n"
+    "        Some files are preceded by a STATIC ANALYSIS block with metrics, a symbol outline and findings that were "
+    "already detected mechanically (long functions, unused imports, duplicated blocks and similar). Those findings are "
+    "added to the review automatically: do NOT repeat them. Use the outline instead of re-deriving structure, let the "
+    "findings inform the score, and spend your suggestions on what static analysis cannot decide: correctness, design, "
+    "error handling, security and performance.\n"
+)
+
+CODE_PATCH_FORMAT_INSTRUCTIONS = """
+        CRITICAL INSTRUCTIONS:
+        1. Apply the user's selected suggestions accurately and completely, changing nothing else.
+        2. The source is shown with line numbers ('line_number | code'). Do NOT return the whole file. Return only edits, each replacing the original lines start_line..end_line (inclusive) with `replacement`.
+        3. `original` must be the exact original text of those lines, without the line number prefixes. `replacement` is raw code without line numbers or markdown fences, with the original indentation preserved.
+        4. To insert without replacing, set end_line to start_line - 1 (the new lines go before start_line) and leave `original` empty. To delete lines, use an empty `replacement`.
+        5. Edits must not overlap; merge neighbouring changes into one edit. Keep the updated code valid and runnable.
+"""
+
+CODE_DIFF_REVIEW_NOTE = (
+    "\n        DIFF REVIEW MODE:\n"
+    "        The input contains only the changed regions of each file, shown with their head line numbers. "
+    "Lines marked '+|' were added or modified; lines marked ' |' are unchanged context. "
+    "Review and score ONLY the changed lines, use the context solely to understand them, and start every suggestion "
+    "with the head line number or range shown. Do not comment on code that is not shown.\n"
+)
+
+VISION_PREVIEW_NOTE = (
+    "The attached images are reduced-resolution previews. If a verdict depends on visual detail you cannot "
+    "make out in them (small labels, dense diagrams, screenshot text), still give your best verdict, but add "
+    '"needs_visual_detail": true and "detail_pages": [<page numbers of the images concerned>] to that checklist entry.'
+)
+VISION_ESCALATION_NOTE = (
+    "The attached images are full-resolution renditions of the pages an earlier review could not read clearly. "
+    "Re-evaluate each checklist item in this call using them."
+)
 
 
 def _safe_csv_env(name: str, default: List[str]) -> List[str]:
@@ -75,12 +152,14 @@ class CodeAnalysisResponse_Schema(BaseModel):
 class CodeAutoFixResponse(BaseModel):
     fixed_code: str = Field(description="The rewritten source code with suggestions applied")
 
-class FixedCodeFile(BaseModel):
-    filename: str = Field(description="The name of the fixed file")
-    fixed_code: str = Field(description="The rewritten source code")
+class CodeLineEdit(BaseModel):
+    start_line: int = Field(description="First original line replaced (1-based)")
+    end_line: int = Field(description="Last original line replaced; start_line - 1 inserts before start_line")
+    original: str = Field(description="Exact original text of the replaced lines")
+    replacement: str = Field(description="New text for the range; empty to delete")
 
-class CodeAutoFixBatchResponse(BaseModel):
-    fixed_files: List[FixedCodeFile] = Field(description="List of fixed code files")
+class CodePatchResponse(BaseModel):
+    edits: List[CodeLineEdit] = Field(description="Line-range replacements against the original file")
 
 # Token counting helper function
 def count_tokens(text: str, model: str = "gpt-4") -> int:
@@ -92,9 +171,36 @@ def count_tokens(text: str, model: str = "gpt-4") -> int:
         # Fallback for non-OpenAI models - estimate 4 chars per token
         return len(text) // 4
 
+def estimate_message_tokens(chain_input: Any) -> int:
+    """Pre-computes the token cost of one LLM call for scheduler budgeting.
+
+    Counts text parts with `count_tokens`, charges a flat allowance per image
+    part and adds the expected completion size.
+    """
+    image_tokens = max(0, safe_int_env("LLM_SCHEDULER_IMAGE_TOKEN_ESTIMATE", 1100))
+    total = max(0, safe_int_env("LLM_SCHEDULER_OUTPUT_TOKEN_ESTIMATE", 1500))
+
+    messages = chain_input if isinstance(chain_input, list) else [chain_input]
+    for message in messages:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            total += count_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    total += image_tokens
+                elif isinstance(part, dict):
+                    total += count_tokens(str(part.get("text") or ""))
+                else:
+                    total += count_tokens(str(part))
+        elif content:
+            total += count_tokens(json.dumps(content, default=str))
+    return total
+
 # Token-based chunking function
 MAX_TOKENS = 6000  # Leave room for system prompt and response
-CHECKLIST_BATCH_SIZE = max(1, _safe_int_env("LLM_CHECKLIST_BATCH_SIZE", 10))
+CHECKLIST_BATCH_SIZE = max(1, safe_int_env("LLM_CHECKLIST_BATCH_SIZE", 10))
+DIRECT_PAGE_CANDIDATE_PATTERN = re.compile(r'page\s+(\d+)', re.IGNORECASE)
 
 def chunk_text(text: str, max_tokens: int = MAX_TOKENS) -> List[str]:
     """Split text into chunks based on token count."""
@@ -105,7 +211,7 @@ def chunk_text(text: str, max_tokens: int = MAX_TOKENS) -> List[str]:
     if not words:
         return []
 
-    overlap_words = max(0, _safe_int_env("LLM_CHUNK_OVERLAP_WORDS", 120))
+    overlap_words = max(0, safe_int_env("LLM_CHUNK_OVERLAP_WORDS", 120))
     chunks = []
     start = 0
 
@@ -138,40 +244,110 @@ def chunk_text(text: str, max_tokens: int = MAX_TOKENS) -> List[str]:
 
 # Retry wrapper for LLM calls
 async def call_with_retry(chain, messages, retries: int = 3):
-    """Call LLM with exponential backoff retry logic."""
-    delay = 2
-    
-    for attempt in range(retries):
-        try:
-            return await chain.ainvoke(messages)
-        except Exception as e:
-            logger.warning(f"LLM call failed (attempt {attempt + 1}/{retries}): {str(e)}")
-            if attempt == retries - 1:
-                logger.error(f"All {retries} retry attempts failed")
-                return {"error": str(e), "checklist": [], "suggestions": []}
-            await asyncio.sleep(delay)
-            delay *= 2  # Exponential backoff
-    
-    return {"error": "Unexpected retry loop exit", "checklist": [], "suggestions": []}
+    """Call LLM with classified, jittered retries and return an error payload on failure."""
+    try:
+        return await invoke_with_retry_raising(chain, messages, retries)
+    except Exception as e:
+        return {"error": str(e), "checklist": [], "suggestions": []}
 
 
 async def invoke_with_retry_raising(chain, messages, retries: int = 3):
-    """Call LLM with retries and re-raise the final exception."""
-    delay = 2
+    """Call LLM with retries and re-raise the final exception.
 
+    Only transient failures (rate limits, timeouts, server and connection
+    errors, unparseable output) are retried. Waits honor provider Retry-After
+    hints and add jitter; auth failures, context overflow, bad requests and
+    open circuits fail immediately.
+    """
     for attempt in range(retries):
         try:
             return await chain.ainvoke(messages)
         except Exception as exc:
-            logger.warning(f"LLM call failed (attempt {attempt + 1}/{retries}): {str(exc)}")
+            category = classify_llm_error(exc)
+            metrics.increment("llm_call_errors_total", category=category)
+            logger.warning(
+                f"LLM call failed (attempt {attempt + 1}/{retries}, category={category}): {str(exc)}"
+            )
+            if not is_retryable(category):
+                raise
             if attempt == retries - 1:
                 logger.error(f"All {retries} retry attempts failed")
                 raise
+
+            retry_after = get_retry_after_seconds(exc)
+            delay = compute_retry_delay(attempt, retry_after)
+            if delay is None:
+                logger.error(
+                    f"Giving up on LLM call: provider asked to wait {retry_after:.1f}s, "
+                    "above LLM_RETRY_MAX_DELAY_SEC"
+                    if retry_after is not None else
+                    "Giving up on LLM call: backoff exceeds LLM_RETRY_MAX_DELAY_SEC"
+                )
+                raise
             await asyncio.sleep(delay)
-            delay *= 2
+
+
+def _message_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return ""
+
+
+class SalvagingChecklistChain:
+    """Streams a checklist call through the scheduler, parsing JSON as it arrives.
+
+    Malformed output is repaired locally. When the answer is cut off (the
+    stream fails midway or the JSON is truncated), the complete checklist
+    items received so far are returned with ``_salvaged`` set so the caller
+    can ask for only the missing items instead of resending the whole batch.
+    """
+
+    def __init__(self, scheduled_llm: ScheduledChain):
+        self.scheduled_llm = scheduled_llm
+
+    @staticmethod
+    def _salvaged(parser: IncrementalJsonParser, value: Any = None) -> Dict[str, Any]:
+        suggestions = value.get("suggestions") if isinstance(value, dict) else None
+        return {
+            "checklist": list(parser.items),
+            "suggestions": suggestions if isinstance(suggestions, list) else [],
+            "rewritten_content": "",
+            "_salvaged": True,
+        }
+
+    async def ainvoke(self, messages: Any) -> Any:
+        parser = IncrementalJsonParser("checklist")
+        try:
+            await self.scheduled_llm.astream_into(messages, lambda chunk: parser.feed(_message_text(chunk)))
+        except Exception as exc:
+            if not parser.items:
+                raise
+            logger.warning(f"LLM stream failed after {len(parser.items)} complete checklist items; keeping them: {exc}")
+            return self._salvaged(parser)
+
+        try:
+            value, repaired, truncated = parse_llm_json(parser.text)
+        except ValueError:
+            if parser.items:
+                return self._salvaged(parser)
+            raise OutputParserException(f"Invalid json output: {parser.text}", llm_output=parser.text)
+        if truncated:
+            # Closing a truncated answer would pass half-written items off as complete.
+            return self._salvaged(parser, value)
+        if repaired:
+            metrics.increment("llm_json_repairs_total")
+        return value
 
 
 def _looks_like_image_payload_error(exc: Exception) -> bool:
+    if isinstance(exc, CircuitOpenError):
+        return False
     message = str(exc).lower()
     indicators = [
         "image",
@@ -203,12 +379,12 @@ class AIEngine:
         self.provider = provider
         self.model_name = model_name
         self.api_key = api_key
-        self.deterministic_mode = _is_truthy_env(os.getenv("LLM_DETERMINISTIC_MODE", "true"))
+        self.deterministic_mode = is_truthy_env(os.getenv("LLM_DETERMINISTIC_MODE", "true"))
         self.profile_version = DETERMINISTIC_PROFILE_VERSION
-        self.temperature = _safe_float_env("LLM_TEMPERATURE", 0.0)
-        self.top_p = _safe_float_env("LLM_TOP_P", 1.0)
-        self.seed = _safe_int_env("LLM_SEED", 42)
-        self.top_k = _safe_int_env("LLM_TOP_K", 1)
+        self.temperature = safe_float_env("LLM_TEMPERATURE", 0.0)
+        self.top_p = safe_float_env("LLM_TOP_P", 1.0)
+        self.seed = safe_int_env("LLM_SEED", 42)
+        self.top_k = safe_int_env("LLM_TOP_K", 1)
         self.vision_mode = os.getenv("LLM_VISION_MODE", "auto").strip().lower()
         self.vision_allowlist = _safe_csv_env(
             "LLM_VISION_MODEL_ALLOWLIST",
@@ -225,10 +401,10 @@ class AIEngine:
         self.vision_blocklist = _safe_csv_env("LLM_VISION_MODEL_BLOCKLIST", [])
         self.vision_max_images_per_request = max(
             1,
-            _safe_int_env("LLM_VISION_MAX_IMAGES_PER_REQUEST", 6)
+            safe_int_env("LLM_VISION_MAX_IMAGES_PER_REQUEST", 6)
         )
         self.llm = self._get_llm()
-        self.parser = JsonOutputParser(pydantic_object=ReviewResponse)
+        self.parser = RepairingJsonOutputParser(pydantic_object=ReviewResponse)
 
     def _supports_vision(self) -> bool:
         """Resolve vision capability using explicit env config."""
@@ -253,10 +429,111 @@ class AIEngine:
             for index in range(0, len(images), batch_size)
         ]
 
-    def _select_shared_images(self, images: List[str]) -> List[str]:
+    def _select_shared_images(
+        self,
+        images: List[str],
+        markers: DocumentMarkers,
+        checklist: List[Dict[str, Any]],
+        image_sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[str]:
         if not images:
             return []
-        return images[:self.vision_max_images_per_request]
+        image_pages = [source.get("page") for source in image_sources] if image_sources else None
+        selected_indexes = select_page_images(
+            markers, len(images), self.vision_max_images_per_request, checklist, image_pages
+        )
+        if len(images) > self.vision_max_images_per_request:
+            logger.info(
+                "Vision page selection: "
+                f"mode={get_vision_page_selection_mode()} "
+                f"images_available={len(images)} "
+                f"selected_pages={[index + 1 for index in selected_indexes]}"
+            )
+        return [images[index] for index in selected_indexes]
+
+    async def _describe_images(self, images: List[str]) -> List[Dict[str, Any]]:
+        """Describes page images as structured text, reusing cached descriptions.
+
+        Uncached images are described with one vision call per image batch.
+        Images the model skipped are asked for once more; only descriptions the
+        model actually returned are cached.
+
+        Raises:
+            Exception: If a vision call fails or an image is still undescribed after the retry.
+        """
+        keys = [
+            image_descriptions.build_key(self.provider, self.model_name, hash_image(image))
+            for image in images
+        ]
+        descriptions: Dict[str, Dict[str, Any]] = {}
+        missing: Dict[str, str] = {}
+        for key, image in zip(keys, images):
+            cached = image_descriptions.get(key)
+            if cached is not None:
+                descriptions[key] = cached
+            else:
+                missing[key] = image
+
+        metrics.increment("vision_prepass_cache_hits_total", len(set(keys)) - len(missing))
+        metrics.increment("vision_prepass_cache_misses_total", len(missing))
+        chain = self._schedule_chain(self.llm | RepairingJsonOutputParser())
+        batch_size = max(1, self.vision_max_images_per_request)
+        pending_items = list(missing.items())
+        for attempt in range(2):
+            skipped_items = []
+            for start in range(0, len(pending_items), batch_size):
+                batch = pending_items[start:start + batch_size]
+                returned = await self._describe_image_batch(chain, batch)
+                for key, image in batch:
+                    if key in returned:
+                        image_descriptions.put(key, returned[key])
+                        descriptions[key] = returned[key]
+                    else:
+                        skipped_items.append((key, image))
+            if not skipped_items:
+                break
+            logger.warning(f"Vision pre-pass skipped {len(skipped_items)} image(s); attempt={attempt + 1}")
+            pending_items = skipped_items
+        else:
+            raise ValueError(f"Vision pre-pass returned no description for {len(pending_items)} image(s)")
+
+        return [descriptions[key] for key in keys]
+
+    async def _describe_image_batch(self, chain: Any, batch: List[tuple]) -> Dict[str, Dict[str, Any]]:
+        """Describes one batch of ``(cache_key, image)`` pairs; images the model did not return are left out."""
+        user_content_obj = [{"type": "text", "text": f"Describe the {len(batch)} attached page images."}]
+        for _, image in batch:
+            user_content_obj.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image}"}
+            })
+        response = await invoke_with_retry_raising(chain, [
+            SystemMessage(content=VISION_DESCRIPTION_PROMPT),
+            HumanMessage(content=user_content_obj),
+        ])
+        raw_images = response.get("images") if isinstance(response, dict) else None
+        if not isinstance(raw_images, list) or not raw_images:
+            raise ValueError("Vision pre-pass returned no image descriptions")
+
+        raw_by_position: Dict[int, Any] = {}
+        for position, raw_image in enumerate(raw_images, start=1):
+            if not isinstance(raw_image, dict):
+                continue
+            try:
+                image_index = int(raw_image.get("image_index", position))
+            except (TypeError, ValueError):
+                image_index = position
+            raw_by_position.setdefault(image_index, raw_image)
+
+        return {
+            key: normalize_image_description(raw_by_position[position])
+            for position, (key, _) in enumerate(batch, start=1)
+            if position in raw_by_position
+        }
+
+    def _schedule_chain(self, chain) -> ScheduledChain:
+        """Routes a chain's calls through the process-wide LLM call scheduler."""
+        return ScheduledChain(chain, llm_scheduler, self.provider, self.model_name, estimate_message_tokens)
 
     def get_deterministic_profile_metadata(self) -> Dict[str, Any]:
         """Returns deterministic profile metadata used for cache fingerprinting and logging."""
@@ -267,6 +544,11 @@ class AIEngine:
             "top_p": self.top_p,
             "seed": self.seed,
             "top_k": self.top_k if self.provider == "ollama" else None,
+            "page_retrieval": get_page_retrieval_settings(),
+            "vision_prepass": get_vision_prepass_mode(),
+            "vision_page_selection": get_vision_page_selection_mode(),
+            "vision_image_pyramid": get_image_pyramid_settings(),
+            "code_static_analysis": get_static_analysis_settings(),
         }
 
     def _get_llm(self):
@@ -330,45 +612,18 @@ class AIEngine:
         try:
             # For a basic test, we just invoke a very simple prompt
             prompt = ChatPromptTemplate.from_messages([("user", "Hello")])
-            chain = prompt | self.llm
+            chain = self._schedule_chain(prompt | self.llm)
             await chain.ainvoke({})
             return True
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
             raise Exception(f"{str(e)}")
 
-    def _generate_global_symbols_map(self, files: List[Dict[str, str]]) -> str:
-        """Generates a summary of files and key symbols (classes, functions, namespaces)
-        to provide global context for chunked analysis.
+    async def _generate_global_symbols_map(self, files: List[Dict[str, str]]) -> str:
+        """Generates a summary of files and key symbols (classes, functions, namespaces,
+        integrations, connections, lookups) to provide global context for chunked analysis.
         """
-        if not files:
-            return ""
-
-        import re
-        summary_parts = ["GLOBAL CONTEXT (The following files and symbols exist across the entire document/archive):"]
-        for f in files:
-            fname = f.get("filename", "unknown")
-            content = f.get("content", "")
-
-            # XML Elements (common in .car files)
-            xml_elements = re.findall(r'<([\w:-]+)', content[:5000])
-            unique_xml = sorted(list(set(xml_elements)))[:10]
-
-            # Code Classes & Functions
-            classes = re.findall(r'class\s+([\w\d_]+)', content)
-            funcs = re.findall(r'def\s+([\w\d_]+)', content)
-
-            file_summary = f"- File: {fname}"
-            if unique_xml:
-                file_summary += f" [XML Elements: {', '.join(unique_xml)}]"
-            if classes:
-                file_summary += f" [Classes: {', '.join(classes[:5])}]"
-            if funcs:
-                file_summary += f" [Functions: {', '.join(funcs[:5])}]"
-
-            summary_parts.append(file_summary)
-
-        return "\n".join(summary_parts) + "\n\n"
+        return await global_symbol_maps.build(files)
 
     async def analyze_document(
         self,
@@ -378,7 +633,8 @@ class AIEngine:
         document_category: str = None,
         file_type: str = None,
         enabled_checks: List[str] = None,
-        pagination_metadata: Optional[Dict[str, Any]] = None
+        pagination_metadata: Optional[Dict[str, Any]] = None,
+        cached_verdicts: Optional[Dict[str, Dict[str, Any]]] = None
     ) -> dict:
         """Analyzes a document using the AI model and a target checklist.
 
@@ -390,10 +646,48 @@ class AIEngine:
             file_type: The extension of the original file.
             enabled_checks: List of enabled check IDs (format: "index-checklist_text") to filter checklist items.
             pagination_metadata: Optional pagination capabilities from parser/upload step.
+            cached_verdicts: Previously computed final checklist items keyed by
+                `build_item_key(section, item)`. Matching items are reused as-is and
+                are not sent to the model.
 
         Returns:
             A dictionary containing the review results.
         """
+        final_response: Dict[str, Any] = {}
+        async for event in self.analyze_document_stream(
+            text,
+            images,
+            custom_instructions,
+            document_category,
+            file_type,
+            enabled_checks,
+            pagination_metadata,
+            cached_verdicts
+        ):
+            if event["event"] == "result":
+                final_response = event["data"]
+        return final_response
+
+    async def analyze_document_stream(
+        self,
+        text: str,
+        images: List[str] = None,
+        custom_instructions: str = "",
+        document_category: str = None,
+        file_type: str = None,
+        enabled_checks: List[str] = None,
+        pagination_metadata: Optional[Dict[str, Any]] = None,
+        cached_verdicts: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Analyzes a document and yields progress events as each batch completes.
+
+        Takes the same arguments as `analyze_document`. Yields one
+        `{"event": "batch", "data": ...}` per checklist batch or CAR chunk in
+        completion order, carrying that batch's normalized checklist items
+        (cached verdicts arrive first as a single `item_cache` batch),
+        followed by a single `{"event": "result", "data": ...}` with the merged,
+        scored and reference-resolved review.
+        """
         from services.checklist_loader import loader
         images = images or []
         text = text or ""
@@ -416,6 +710,10 @@ class AIEngine:
                 f"{json.dumps(checklist_subset, indent=2)}"
             )
 
+        # Items with a cached verdict keep their place in the ordering but are not re-asked.
+        cached_verdicts = cached_verdicts or {}
+        cached_checklist_items: List[Dict[str, Any]] = []
+        pending_checklist: List[Dict[str, Any]] = []
         expected_checklist_entries: List[Dict[str, str]] = []
         expected_key_order: Dict[tuple[str, str], int] = {}
         for index, checklist_item in enumerate(target_checklist):
@@ -423,11 +721,39 @@ class AIEngine:
             item_text = str(checklist_item.get("checklist_item") or "")
             if not item_text:
                 continue
+            expected_key_order[(section, item_text)] = index
+            cached_verdict = cached_verdicts.get(build_item_key(section, item_text))
+            if cached_verdict:
+                cached_item = dict(cached_verdict)
+                cached_item["section"] = section
+                cached_item["item"] = item_text
+                cached_checklist_items.append(cached_item)
+                continue
+            pending_checklist.append(checklist_item)
             expected_checklist_entries.append({
                 "section": section,
                 "item": item_text
             })
-            expected_key_order[(section, item_text)] = index
+
+        all_items_cached = bool(cached_checklist_items) and not pending_checklist
+        if cached_checklist_items:
+            logger.info(
+                f"Item verdict cache: reused={len(cached_checklist_items)} "
+                f"pending={len(pending_checklist)} of {len(target_checklist)} checklist items"
+            )
+            yield {
+                "event": "batch",
+                "data": {
+                    "task_index": 0,
+                    "task_count": 0,
+                    "mode": "item_cache",
+                    "filename": "document",
+                    "filenames": ["document"],
+                    "scope": "Cached checklist items",
+                    "checklist": [dict(item) for item in cached_checklist_items],
+                    "error": None,
+                },
+            }
 
         # Determine reference format based on file type
         reference_format = "Section"  # Default
@@ -463,9 +789,9 @@ class AIEngine:
                 reference_format = "Sheet"  # Will be formatted as "Sheet: SheetName" in output
 
         is_car_analysis = bool("[CAR_METADATA]" in text and file_type == "car")
+        markers = scan_document_markers(text)
 
         # Extract total page count from document text for validation
-        import re
         total_pages = 0
         parsed_total_pages = 0
         if isinstance(pagination_metadata, dict):
@@ -477,23 +803,18 @@ class AIEngine:
         if reference_enabled and reference_format == "Page":
             total_pages = parsed_total_pages
             # 1. Search for standard PDF/DOCX markers
-            page_matches = re.findall(r'--- Page (\d+) (?:Text|Tables|Visual Metadata|OCR)?', text)
-            if total_pages == 0 and page_matches:
-                total_pages = max([int(p) for p in page_matches], default=0)
+            if total_pages == 0:
+                total_pages = markers.max_page_number
             
             # 2. Fallback for DOCX paragraphs if page markers are missing but reference is enabled
             if total_pages == 0:
-                fallback_matches = re.findall(r'(?:^|\n|--- | )P(\d+): ', text)
-                if fallback_matches:
-                    total_pages = max([int(p) for p in fallback_matches], default=0)
+                total_pages = markers.max_paragraph_number
+                if total_pages:
                     logger.info(f"Using fallback paragraph markers as locations. total={total_pages}")
         elif file_type and file_type.lower().strip('.') in ["pptx", "ppt"]:
-            slide_matches = re.findall(r'--- Slide (\d+) ---', text)
-            if slide_matches:
-                total_pages = max([int(s) for s in slide_matches], default=0)
+            total_pages = markers.max_slide_number
         elif file_type and file_type.lower().strip('.') in ["xlsx", "xls", "csv"]:
-            sheet_matches = re.findall(r'--- Excel Sheet: (.+?) ---', text)
-            total_pages = len(sheet_matches)  # Count of sheets
+            total_pages = len(markers.sheet_names)  # Count of sheets
 
         # Safety: if references are enabled but markers are missing, disable references
         # to prevent fabricated/incorrect location numbers.
@@ -537,14 +858,10 @@ class AIEngine:
         # Build global context map if CAR archive
         global_context_map = ""
         if is_car_analysis:
-            import re as _re
-            _car_file_pattern = r'\n--- File: (.+?) ---\n'
-            _car_file_parts = _re.split(_car_file_pattern, text)
-            _file_infos = []
-            for _i in range(1, len(_car_file_parts), 2):
-                if _i + 1 < len(_car_file_parts):
-                    _file_infos.append({"filename": _car_file_parts[_i], "content": _car_file_parts[_i+1]})
-            global_context_map = self._generate_global_symbols_map(_file_infos)
+            global_context_map = await self._generate_global_symbols_map([
+                {"filename": filename, "content": content}
+                for filename, content in markers.files
+            ])
 
         segmentation_instructions = (
             f"""        - This input may be one segment of a multi-file or chunked document. If the current segment contains no relevant evidence for an item, use status exactly `Not Seen` for this segment instead of `Fail`.
@@ -616,41 +933,87 @@ class AIEngine:
         dispatch_mode = "car_file_chunking" if is_car_analysis else "checklist_batching"
         analysis_tasks: List[Dict[str, Any]] = []
         image_batches: List[List[str]] = []
-
-        if is_car_analysis:
+        routed_out_items: List[Dict[str, Any]] = []
+        vision_prepass_mode = get_vision_prepass_mode()
+        vision_prepass_used = False
+        image_source_labels: Dict[str, str] = {}
+        image_sources: Optional[List[Dict[str, Any]]] = None
+        visual_escalation_ready = False
+
+        if all_items_cached:
+            task_image_batches = []
+        elif is_car_analysis:
             image_batches = self._build_image_batches(images) if supports_vision else []
 
             # Extract individual files from CAR archive
-            import re
-            car_match = re.search(r'\[CAR_METADATA\] total_size=(\d+), file_count=(\d+) \[/CAR_METADATA\]', text)
-            if car_match:
-                file_count = int(car_match.group(2))
-                logger.info(f"Processing .car file with {file_count} embedded files")
-
-            file_pattern = r'\n--- File: (.+?) ---\n'
-            file_parts = re.split(file_pattern, text)
-
-            for i in range(1, len(file_parts), 2):
-                if i + 1 < len(file_parts):
-                    filename = file_parts[i]
-                    content = file_parts[i + 1]
-                    file_chunks = chunk_text(content)
-                    for chunk_index, chunk in enumerate(file_chunks):
-                        analysis_tasks.append({
-                            "mode": "car_chunk",
-                            "filename": filename,
-                            "content": chunk,
-                            "checklist": target_checklist,
-                            "scope_label": f"File segment {chunk_index + 1}/{len(file_chunks)}",
-                        })
-                    logger.info(f"Chunked file: {filename} into {len(file_chunks)} parts")
+            if markers.has_car_metadata:
+                logger.info(f"Processing .car file with {markers.car_file_count} embedded files")
+
+            router = CarChecklistRouter(pending_checklist) if is_car_routing_enabled() else None
+            # Nested archives often repeat byte-identical members; review each distinct one once.
+            unique_files: Dict[str, Dict[str, Any]] = {}
+            for filename, content in markers.files:
+                file_checklist = router.checklist_for_file(filename, content) if router else pending_checklist
+                if not file_checklist:
+                    logger.info(f"Skipped file: {filename} (no routed checklist items)")
+                    continue
+                content_hash = hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+                checklist_ids = ",".join(str(item.get("id", item.get("index", ""))) for item in file_checklist)
+                dedup_key = f"{content_hash}:{checklist_ids}"
+                if dedup_key in unique_files:
+                    unique_files[dedup_key]["filenames"].append(filename)
+                    continue
+                unique_files[dedup_key] = {
+                    "filename": filename,
+                    "filenames": [filename],
+                    "content": content,
+                    "checklist": file_checklist,
+                }
+
+            duplicate_file_count = sum(len(unique_file["filenames"]) - 1 for unique_file in unique_files.values())
+            for unique_file in unique_files.values():
+                filename = unique_file["filename"]
+                file_checklist = unique_file["checklist"]
+                file_chunks = chunk_text(unique_file["content"])
+                for chunk_index, chunk in enumerate(file_chunks):
+                    analysis_tasks.append({
+                        "mode": "car_chunk",
+                        "filename": filename,
+                        "filenames": unique_file["filenames"],
+                        "content": chunk,
+                        "checklist": file_checklist,
+                        "scope_label": f"File segment {chunk_index + 1}/{len(file_chunks)}",
+                    })
+                logger.info(
+                    f"Chunked file: {filename} into {len(file_chunks)} parts "
+                    f"with {len(file_checklist)}/{len(pending_checklist)} checklist items"
+                    + (
+                        f" (shared by {len(unique_file['filenames'])} identical members)"
+                        if len(unique_file["filenames"]) > 1 else ""
+                    )
+                )
+            if duplicate_file_count:
+                metrics.increment("car_duplicate_members_skipped_total", duplicate_file_count)
+
+            if analysis_tasks and router:
+                routed_item_ids = {
+                    id(item)
+                    for task in analysis_tasks
+                    for item in task["checklist"]
+                }
+                routed_out_items = [item for item in pending_checklist if id(item) not in routed_item_ids]
+                if routed_out_items:
+                    logger.info(
+                        f"CAR routing: resolved {len(routed_out_items)} checklist items as Not Seen "
+                        "without a model call (no relevant archive members)"
+                    )
 
             if not analysis_tasks:
                 analysis_tasks = [{
                     "mode": "car_chunk",
                     "filename": "document",
                     "content": "No extractable text was found. Use the available parsed metadata and images if present.",
-                    "checklist": target_checklist,
+                    "checklist": pending_checklist,
                     "scope_label": "Fallback segment",
                 }]
 
@@ -662,6 +1025,7 @@ class AIEngine:
                     analysis_tasks.append({
                         "mode": template["mode"],
                         "filename": template["filename"],
+                        "filenames": template.get("filenames", [template["filename"]]),
                         "content": template["content"],
                         "checklist": template["checklist"],
                         "scope_label": template["scope_label"],
@@ -675,23 +1039,106 @@ class AIEngine:
         else:
             document_content = text or "No extractable text was found. Use the available parsed metadata and images if present."
             checklist_batches = [
-                target_checklist[index:index + CHECKLIST_BATCH_SIZE]
-                for index in range(0, len(target_checklist), CHECKLIST_BATCH_SIZE)
-            ] if target_checklist else [[]]
+                pending_checklist[index:index + CHECKLIST_BATCH_SIZE]
+                for index in range(0, len(pending_checklist), CHECKLIST_BATCH_SIZE)
+            ] if pending_checklist else [[]]
+
+            retrieval_planner = None
+            if reference_enabled and reference_format == "Page" and text:
+                retrieval_planner = PageRetrievalPlanner(text, count_tokens(text), markers)
 
             for batch_index, checklist_batch in enumerate(checklist_batches):
+                batch_content = document_content
+                retrieved_pages: List[int] = []
+                retrieval = retrieval_planner.build_batch_context(checklist_batch) if retrieval_planner else None
+                if retrieval:
+                    batch_content = retrieval["content"]
+                    retrieved_pages = retrieval["pages"]
+
                 analysis_tasks.append({
                     "mode": "checklist_batch",
                     "filename": "document",
-                    "content": document_content,
+                    "content": batch_content,
                     "checklist": checklist_batch,
                     "scope_label": f"Checklist batch {batch_index + 1}/{len(checklist_batches)}",
+                    "retrieved_pages": retrieved_pages,
                 })
 
-            shared_image_batch = self._select_shared_images(images) if supports_vision else []
+            if retrieval_planner and retrieval_planner.enabled:
+                retrieved_task_count = sum(1 for task in analysis_tasks if task["retrieved_pages"])
+                full_chars = len(document_content) * len(analysis_tasks)
+                sent_chars = sum(len(task["content"]) for task in analysis_tasks)
+                logger.info(
+                    "Page retrieval: "
+                    f"pages_indexed={retrieval_planner.index.page_count} "
+                    f"retrieved_tasks={retrieved_task_count}/{len(analysis_tasks)} "
+                    f"top_k={retrieval_planner.top_k} "
+                    f"front_matter_pages={retrieval_planner.front_matter_pages} "
+                    f"document_tokens={retrieval_planner.document_tokens} "
+                    f"content_chars_sent={sent_chars}/{full_chars}"
+                )
+
+            # The parser records where each image came from (page, full page or figure crop).
+            raw_image_sources = pagination_metadata.get("image_sources") if isinstance(pagination_metadata, dict) else None
+            image_sources = (
+                raw_image_sources
+                if isinstance(raw_image_sources, list)
+                and len(raw_image_sources) == len(images)
+                and all(isinstance(source, dict) for source in raw_image_sources)
+                else None
+            )
+            if image_sources:
+                image_source_labels = {
+                    image: describe_image_source(source)
+                    for image, source in zip(images, image_sources)
+                }
+            shared_image_batch = (
+                self._select_shared_images(images, markers, pending_checklist, image_sources)
+                if supports_vision else []
+            )
             image_batches = [shared_image_batch] if shared_image_batch else []
             task_image_batches = [list(shared_image_batch) for _ in analysis_tasks]
 
+            if shared_image_batch and (
+                vision_prepass_mode == "on"
+                or (vision_prepass_mode == "auto" and len(analysis_tasks) > 1)
+            ):
+                try:
+                    descriptions = await self._describe_images(list(shared_image_batch))
+                    image_descriptions_text = format_image_descriptions(
+                        descriptions,
+                        [image_source_labels.get(image, "") for image in shared_image_batch],
+                    )
+                except Exception as exc:
+                    logger.warning(
+                        "Vision pre-pass failed; attaching images to every batch instead. "
+                        f"provider_model={self.provider}/{self.model_name} error={str(exc)}"
+                    )
+                    image_descriptions_text = ""
+                if image_descriptions_text:
+                    for task in analysis_tasks:
+                        task["content"] = f"{task['content']}\n\n{image_descriptions_text}"
+                    task_image_batches = [[] for _ in analysis_tasks]
+                    vision_prepass_used = True
+
+            # Previews go out first; full renditions are only sent for items the model flags.
+            if (
+                shared_image_batch
+                and not vision_prepass_used
+                and get_image_pyramid_settings()["max_escalation_calls"] > 0
+            ):
+                preview_batch = await asyncio.to_thread(
+                    lambda: [image_previews.get_preview(image) for image in shared_image_batch]
+                )
+                visual_escalation_ready = any(
+                    preview != image for preview, image in zip(preview_batch, shared_image_batch)
+                )
+                if visual_escalation_ready:
+                    for preview, image in zip(preview_batch, shared_image_batch):
+                        if image in image_source_labels:
+                            image_source_labels[preview] = image_source_labels[image]
+                    task_image_batches = [list(preview_batch) for _ in analysis_tasks]
+
         if images and not supports_vision and not AIEngine._vision_disabled_warning_logged:
             logger.warning(
                 "Images were extracted but not sent to model because vision is disabled for "
@@ -715,13 +1162,14 @@ class AIEngine:
             f"max_images_per_request={self.vision_max_images_per_request} "
             f"images_sent={images_sent_total} "
             f"image_chars_sent={image_chars_sent} "
+            f"vision_prepass={vision_prepass_mode}/{'used' if vision_prepass_used else 'unused'} "
             f"tasks={len(analysis_tasks)}"
         )
         logger.info(f"Total analysis tasks to process: {len(analysis_tasks)}")
         
         # Configurable concurrency
         default_concurrency = "1" if self.deterministic_mode else "5"
-        MAX_CONCURRENCY = _safe_int_env("LLM_MAX_CONCURRENCY", int(default_concurrency))
+        MAX_CONCURRENCY = safe_int_env("LLM_MAX_CONCURRENCY", int(default_concurrency))
         logger.info(
             "Deterministic profile: "
             f"provider={self.provider}/{self.model_name}, "
@@ -747,12 +1195,24 @@ class AIEngine:
                     if batch_checklist_context else system_prompt
                 )
 
-                content_heading = (
-                    f"Document Content Segment {task_index + 1}:"
-                    if task_data["mode"] == "car_chunk"
-                    else "Full Document Content:"
-                )
-                user_content = f"""File: {task_data['filename']}
+                retrieved_pages = task_data.get("retrieved_pages") or []
+                if task_data["mode"] == "car_chunk":
+                    content_heading = f"Document Content Segment {task_index + 1}:"
+                elif retrieved_pages:
+                    content_heading = (
+                        "Relevant Document Pages "
+                        f"({', '.join(str(page) for page in retrieved_pages)} of {total_pages}; "
+                        "pages not shown were ranked unrelated to the checklist items in this call):"
+                    )
+                else:
+                    content_heading = "Full Document Content:"
+                shared_filenames = [
+                    filename for filename in task_data.get("filenames", []) if filename != task_data["filename"]
+                ]
+                file_label = task_data["filename"]
+                if shared_filenames:
+                    file_label += f" (identical copies also at: {', '.join(shared_filenames)})"
+                user_content = f"""File: {file_label}
 Scope: {task_data['scope_label']}
 
 Custom Instructions: {custom_instructions}
@@ -760,14 +1220,28 @@ Custom Instructions: {custom_instructions}
 {content_heading}
 {task_data['content']}"""
 
-                chain = self.llm | self.parser
+                chain = (
+                    SalvagingChecklistChain(self._schedule_chain(self.llm))
+                    if get_json_salvage_settings()["enabled"]
+                    else self._schedule_chain(self.llm | self.parser)
+                )
                 text_only_messages = [
                     SystemMessage(content=system_msg_content),
                     HumanMessage(content=user_content)
                 ]
 
                 if image_batch and supports_vision:
-                    user_content_obj = [{"type": "text", "text": user_content}]
+                    vision_text = user_content
+                    if image_source_labels:
+                        vision_text += "\n\nAttached images:\n" + "\n".join(
+                            f"Image {image_index}: {image_source_labels.get(img_b64) or 'Document image'}"
+                            for image_index, img_b64 in enumerate(image_batch, start=1)
+                        )
+                    if task_data["mode"] == "visual_escalation":
+                        vision_text += f"\n\n{VISION_ESCALATION_NOTE}"
+                    elif visual_escalation_ready:
+                        vision_text += f"\n\n{VISION_PREVIEW_NOTE}"
+                    user_content_obj = [{"type": "text", "text": vision_text}]
                     for img_b64 in image_batch:
                         user_content_obj.append({
                             "type": "image_url",
@@ -779,60 +1253,123 @@ Custom Instructions: {custom_instructions}
                     ]
 
                     try:
-                        return await invoke_with_retry_raising(chain, vision_messages)
+                        task_result = await invoke_with_retry_raising(chain, vision_messages)
+                        used_messages = vision_messages
                     except Exception as exc:
-                        if _looks_like_image_payload_error(exc):
-                            logger.warning(
-                                "Vision payload rejected; retrying task without images. "
-                                f"provider_model={self.provider}/{self.model_name} "
-                                f"task={task_index + 1} "
-                                f"image_batch_size={len(image_batch)} "
-                                f"error={str(exc)}"
-                            )
-                            return await call_with_retry(chain, text_only_messages)
-                        raise
-
-                return await call_with_retry(chain, text_only_messages)
+                        if not _looks_like_image_payload_error(exc):
+                            raise
+                        logger.warning(
+                            "Vision payload rejected; retrying task without images. "
+                            f"provider_model={self.provider}/{self.model_name} "
+                            f"task={task_index + 1} "
+                            f"image_batch_size={len(image_batch)} "
+                            f"error={str(exc)}"
+                        )
+                        task_result = await call_with_retry(chain, text_only_messages)
+                        used_messages = text_only_messages
+                else:
+                    task_result = await call_with_retry(chain, text_only_messages)
+                    used_messages = text_only_messages
+
+                if isinstance(task_result, dict) and task_result.pop("_salvaged", False):
+                    task_result = await self._complete_salvaged_checklist(
+                        task_result, task_data, used_messages, chain,
+                        lambda missing_items: f"{system_prompt}\n{build_checklist_context(missing_items)}",
+                    )
+                return task_result
 
         try:
             semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
-            tasks = [
-                process_batch(i, task_data, task_image_batches[i], semaphore)
-                for i, task_data in enumerate(analysis_tasks)
+
+            async def run_indexed_task(task_index: int) -> tuple[int, Dict[str, Any]]:
+                task_result = await process_batch(
+                    task_index,
+                    analysis_tasks[task_index],
+                    task_image_batches[task_index],
+                    semaphore
+                )
+                return task_index, task_result
+
+            if routed_out_items:
+                yield {
+                    "event": "batch",
+                    "data": {
+                        "task_index": 0,
+                        "task_count": 0,
+                        "mode": "car_routing",
+                        "filename": "archive",
+                        "filenames": [],
+                        "scope": "Checklist items with no relevant archive members",
+                        "checklist": build_routed_out_result(routed_out_items)["checklist"],
+                        "error": None,
+                    },
+                }
+
+            results: List[Dict[str, Any]] = [{} for _ in analysis_tasks]
+            pending_tasks = [
+                asyncio.ensure_future(run_indexed_task(i))
+                for i in range(len(analysis_tasks))
             ]
-            results = await asyncio.gather(*tasks)
-            
-            def normalize_review_status(raw_status: Any) -> str:
-                status = str(raw_status or "").strip().lower()
-                if not status:
-                    return "not_seen"
-                if "not applicable" in status or status in {"n/a", "na"}:
-                    return "na"
-                if "not seen" in status:
-                    return "not_seen"
-                if "warning" in status:
-                    return "warning"
-                if "fail" in status:
-                    return "fail"
-                if "pass" in status:
-                    return "pass"
-                return "not_seen"
-
-            def format_review_status(normalized_status: str) -> str:
-                if normalized_status == "pass":
-                    return "Pass"
-                if normalized_status == "warning":
-                    return "Warning"
-                if normalized_status == "fail":
-                    return "Fail"
-                if normalized_status == "na":
-                    return "Not Applicable"
-                return "Not Seen"
-
-            def append_unique_comment(target: List[str], value: Any) -> None:
-                comment = str(value or "").strip()
-                if comment and comment not in target:
-                    target.append(comment)
+            try:
+                for completed in asyncio.as_completed(pending_tasks):
+                    task_index, task_result = await completed
+                    results[task_index] = task_result
+                    yield {
+                        "event": "batch",
+                        "data": self._build_batch_event(
+                            task_index,
+                            analysis_tasks,
+                            task_result,
+                            is_car_analysis,
+                            total_pages if reference_enabled else 0,
+                        ),
+                    }
+            finally:
+                # Client disconnects close the generator; do not leave orphaned LLM calls running.
+                for pending_task in pending_tasks:
+                    if not pending_task.done():
+                        pending_task.cancel()
+
+            if visual_escalation_ready:
+                escalations = self._plan_visual_escalations(
+                    analysis_tasks, results, images, image_sources, markers, shared_image_batch
+                )
+                first_escalation_index = len(analysis_tasks)
+                for escalation_task, full_images in escalations:
+                    analysis_tasks.append(escalation_task)
+                    task_image_batches.append(full_images)
+                    results.append({})
+                if escalations:
+                    metrics.increment("vision_escalation_calls_total", len(escalations))
+                    logger.info(
+                        "Vision escalation: "
+                        f"calls={len(escalations)} "
+                        f"items={sum(len(task['checklist']) for task, _ in escalations)} "
+                        f"full_images_sent={sum(len(full_images) for _, full_images in escalations)}"
+                    )
+                pending_tasks = [
+                    asyncio.ensure_future(run_indexed_task(i))
+                    for i in range(first_escalation_index, len(analysis_tasks))
+                ]
+                try:
+                    for completed in asyncio.as_completed(pending_tasks):
+                        task_index, task_result = await completed
+                        # Appended after the preview results, so the re-checked verdicts win the merge.
+                        results[task_index] = task_result
+                        yield {
+                            "event": "batch",
+                            "data": self._build_batch_event(
+                                task_index,
+                                analysis_tasks,
+                                task_result,
+                                is_car_analysis,
+                                total_pages if reference_enabled else 0,
+                            ),
+                        }
+                finally:
+                    for pending_task in pending_tasks:
+                        if not pending_task.done():
+                            pending_task.cancel()
 
             def checklist_sort_key(item: Dict[str, Any]) -> tuple[int, int, str, str]:
                 key = (str(item.get("section", "")), str(item.get("item", "")))
@@ -841,215 +1378,17 @@ Custom Instructions: {custom_instructions}
                     return (0, expected_index, key[0], key[1])
                 return (1, math.inf, key[0], key[1])
 
-            checklist_items: List[Dict[str, Any]] = []
             if is_car_analysis:
-                def finalize_document_status(statuses: List[str]) -> str:
-                    meaningful_statuses = {status for status in statuses if status not in {"not_seen", "na"}}
-                    if "pass" in meaningful_statuses:
-                        if meaningful_statuses == {"pass"}:
-                            return "pass"
-                        return "warning"
-                    if "warning" in meaningful_statuses:
-                        return "warning"
-                    if "fail" in meaningful_statuses:
-                        return "fail"
-                    if "na" in statuses:
-                        return "na"
-                    return "fail"
-
-                def build_merged_comment(final_status: str, comments_by_status: Dict[str, List[str]]) -> str:
-                    combined_comments: List[str] = []
-
-                    if final_status == "pass":
-                        status_order = ["pass", "warning", "fail"]
-                    elif final_status == "warning":
-                        status_order = ["warning", "fail", "pass"]
-                    elif final_status == "fail":
-                        status_order = ["fail", "warning", "pass"]
-                    else:
-                        status_order = ["na", "pass", "warning", "fail"]
-
-                    for status_name in status_order:
-                        for comment in comments_by_status.get(status_name, []):
-                            append_unique_comment(combined_comments, comment)
-
-                    if (
-                        final_status == "warning"
-                        and comments_by_status.get("pass")
-                        and (comments_by_status.get("warning") or comments_by_status.get("fail"))
-                    ):
-                        combined_comments.insert(
-                            0,
-                            "Conflicting chunk-level findings were returned. Evidence was found in at least one chunk, but other chunks raised concerns."
-                        )
-
-                    if combined_comments:
-                        return "\n".join(combined_comments)
-                    if final_status == "fail":
-                        return "No supporting evidence was found anywhere in the analyzed document."
-                    if final_status == "warning":
-                        return "Evidence is partial or conflicting across the analyzed document."
-                    if final_status == "na":
-                        return "This item appears not applicable to the analyzed document."
-                    return "Supporting evidence was found in the analyzed document."
-
-                def normalize_text(s: str) -> str:
-                    import re
-                    # Remove punctuation and normalize whitespace/case for robust matching
-                    return re.sub(r'[^a-z0-9]', '', str(s).lower())
-
-                def get_bucket_key(existing_keys, section: str, item_text: str) -> tuple[str, str]:
-                    norm_sec = normalize_text(section)
-                    norm_item = normalize_text(item_text)
-                    exact_key = (norm_sec, norm_item)
-                    
-                    if exact_key in existing_keys:
-                        return exact_key
-                        
-                    # If exact match fails (e.g., AI changed section name), match just on item text
-                    for k_sec, k_item in existing_keys:
-                        if k_item == norm_item:
-                            return (k_sec, k_item)
-                            
-                    return exact_key
-
-                merged_checklist: Dict[tuple[str, str], Dict[str, Any]] = {}
-                merged_item_state: Dict[tuple[str, str], Dict[str, Any]] = {}
-
-                def ensure_item_bucket(
-                    section: str,
-                    item_text: str,
-                    template: Optional[Dict[str, Any]] = None,
-                ) -> tuple[str, str]:
-                    key = get_bucket_key(merged_checklist.keys(), section, item_text)
-                    if key not in merged_checklist:
-                        base_item = dict(template) if template else {}
-                        base_item["section"] = section
-                        base_item["item"] = item_text
-                        merged_checklist[key] = base_item
-                        merged_item_state[key] = {
-                            "statuses": [],
-                            "comments_by_status": {
-                                "pass": [],
-                                "warning": [],
-                                "fail": [],
-                                "na": [],
-                                "not_seen": [],
-                            },
-                            "page_references": set(),
-                        }
-                    return key
-
-                # Initialize buckets with expected items first
-                for expected_item in expected_checklist_entries:
-                    ensure_item_bucket(expected_item["section"], expected_item["item"])
-
-                for res in results:
-                    for item in res.get("checklist", []):
-                        section = str(item.get("section") or "General").strip()
-                        item_text = str(item.get("item") or "").strip()
-                        if not item_text:
-                            continue
-
-                        # This will match the expected item bucket even if section was modified by AI
-                        key = ensure_item_bucket(section, item_text, item)
-                        normalized_status = normalize_review_status(item.get("status"))
-                        merged_item_state[key]["statuses"].append(normalized_status)
-                        append_unique_comment(
-                            merged_item_state[key]["comments_by_status"][normalized_status],
-                            item.get("comment", ""),
-                        )
-                        
-                        # Merge page references from this chunk
-                        refs = item.get("page_references", [])
-                        if isinstance(refs, list):
-                            for r in refs:
-                                try:
-                                    merged_item_state[key]["page_references"].add(int(r))
-                                except (ValueError, TypeError):
-                                    pass
-
-                for key, merged_item in merged_checklist.items():
-                    state = merged_item_state.get(key, {
-                        "statuses": [],
-                        "comments_by_status": {"pass": [], "warning": [], "fail": [], "na": [], "not_seen": []},
-                    })
-                    
-                    # If the only status we have is empty (e.g. it was an expected item but AI never returned it)
-                    if not state["statuses"]:
-                        merged_item["status"] = "Fail"
-                        merged_item["comment"] = "No result was returned for this checklist item."
-                        checklist_items.append(merged_item)
-                        continue
-
-                    final_status = finalize_document_status(state["statuses"])
-                    merged_item["status"] = format_review_status(final_status)
-                    merged_item["comment"] = build_merged_comment(final_status, state["comments_by_status"])
-                    
-                    # FINAL STEP: Assign merged page references (sorted list)
-                    merged_item["page_references"] = sorted(list(state.get("page_references", set())))
-                    
-                    if final_status == "not_seen":
-                        merged_item["status"] = "Fail"
-                        if not merged_item["comment"] or merged_item["comment"] == "Supporting evidence was found in the analyzed document.":
-                            merged_item["comment"] = "No supporting evidence was found anywhere in the analyzed document."
-                            
-                    checklist_items.append(merged_item)
+                if routed_out_items:
+                    results.append(build_routed_out_result(routed_out_items))
+                checklist_items = merge_chunk_results(results, expected_checklist_entries)
             else:
-                checklist_items_map: Dict[tuple[str, str], Dict[str, Any]] = {}
-                
-                def normalize_text(s: str) -> str:
-                    import re
-                    return re.sub(r'[^a-z0-9]', '', str(s).lower())
-
-                def get_bucket_key(existing_keys, section: str, item_text: str) -> tuple[str, str]:
-                    norm_sec = normalize_text(section)
-                    norm_item = normalize_text(item_text)
-                    exact_key = (norm_sec, norm_item)
-                    
-                    if exact_key in existing_keys:
-                        return exact_key
-                    for k_sec, k_item in existing_keys:
-                        if k_item == norm_item:
-                            return (k_sec, k_item)
-                    return exact_key
-
-                for res in results:
-                    for item in res.get("checklist", []):
-                        section = str(item.get("section") or "General").strip()
-                        item_text = str(item.get("item") or "").strip()
-                        if not item_text:
-                            continue
-
-                        key = get_bucket_key(checklist_items_map.keys(), section, item_text)
-                        normalized_status = normalize_review_status(item.get("status"))
-                        item_copy = dict(item)
-                        item_copy["section"] = section
-                        item_copy["item"] = item_text
-
-                        if normalized_status == "not_seen":
-                            item_copy["status"] = "Fail"
-                            item_copy["comment"] = (
-                                str(item_copy.get("comment") or "").strip()
-                                or "No supporting evidence was found anywhere in the analyzed document."
-                            )
-                        else:
-                            item_copy["status"] = format_review_status(normalized_status)
-                        
-                        checklist_items_map[key] = item_copy
-
-                for expected_item in expected_checklist_entries:
-                    key = get_bucket_key(checklist_items_map.keys(), expected_item["section"], expected_item["item"])
-                    if key not in checklist_items_map:
-                        checklist_items_map[key] = {
-                            "section": expected_item["section"],
-                            "item": expected_item["item"],
-                            "status": "Fail",
-                            "comment": "No result was returned for this checklist item.",
-                        }
-
-                checklist_items = list(checklist_items_map.values())
+                checklist_items = merge_batch_results(results, expected_checklist_entries)
 
+            for item in checklist_items:
+                item.pop("needs_visual_detail", None)
+                item.pop("detail_pages", None)
+            checklist_items.extend(cached_checklist_items)
             checklist_items.sort(key=checklist_sort_key)
 
             merged_suggestions_map: Dict[tuple[str, str], Dict[str, str]] = {}
@@ -1083,7 +1422,7 @@ Custom Instructions: {custom_instructions}
                 for item in final_response.get("checklist", []):
                     item["page_references"] = []
             else:
-                final_response = self._resolve_page_references(final_response, text, reference_format)
+                final_response = self._resolve_page_references(final_response, text, reference_format, markers)
 
             # Validate and correct page numbers in AI response
             final_response = self._validate_page_numbers(final_response, total_pages, reference_format)
@@ -1109,17 +1448,209 @@ Custom Instructions: {custom_instructions}
             else:
                 final_score = int((score / valid_items) * 100)
                 final_response["score"] = final_score
-            return final_response
         except Exception as e:
             # Fallback or error handling
             logger.error(f"AI Error: {e}")
-            return {
+            final_response = {
                 "score": 0,
                 "checklist": [{"section": "General", "item": "AI Analysis", "status": "Fail", "comment": f"Error: {str(e)}"}],
                 "suggestions": [{"type": "Fail", "text": "Check configuration and try again."}],
                 "rewritten_content": ""
             }
 
+        yield {"event": "result", "data": final_response}
+
+    async def _complete_salvaged_checklist(
+        self,
+        task_result: Dict[str, Any],
+        task_data: Dict[str, Any],
+        messages: List[Any],
+        chain: Any,
+        build_system_message: Callable[[List[Dict[str, Any]]], str],
+    ) -> Dict[str, Any]:
+        """Asks only for the checklist items a cut-off answer did not cover and merges them in."""
+        returned_items = {
+            str(row.get("item") or "").strip()
+            for row in task_result.get("checklist") or []
+            if isinstance(row, dict)
+        }
+        missing_items = [
+            item for item in task_data.get("checklist") or []
+            if str(item.get("checklist_item") or "").strip() not in returned_items
+        ]
+        metrics.increment("llm_json_salvaged_items_total", len(returned_items))
+        logger.warning(
+            "Checklist answer was cut off: "
+            f"scope={task_data['scope_label']} "
+            f"salvaged_items={len(returned_items)} "
+            f"missing_items={len(missing_items)}"
+        )
+        if not missing_items or not get_json_salvage_settings()["followup"]:
+            return task_result
+
+        followup_messages = [
+            SystemMessage(content=build_system_message(missing_items)),
+            *messages[1:],
+        ]
+        metrics.increment("llm_json_salvage_followups_total")
+        followup_result = await call_with_retry(chain, followup_messages)
+        if not isinstance(followup_result, dict):
+            logger.warning(
+                "Checklist follow-up returned no JSON object; keeping the salvaged items. "
+                f"scope={task_data['scope_label']} type={type(followup_result).__name__}"
+            )
+            return task_result
+        followup_result.pop("_salvaged", None)
+        followup_checklist = followup_result.get("checklist")
+        followup_suggestions = followup_result.get("suggestions")
+        task_result["checklist"] = list(task_result.get("checklist") or []) + (
+            followup_checklist if isinstance(followup_checklist, list) else []
+        )
+        task_result["suggestions"] = list(task_result.get("suggestions") or []) + [
+            suggestion for suggestion in (followup_suggestions if isinstance(followup_suggestions, list) else [])
+            if suggestion not in (task_result.get("suggestions") or [])
+        ]
+        if followup_result.get("error"):
+            task_result["error"] = followup_result["error"]
+        return task_result
+
+    def _plan_visual_escalations(
+        self,
+        analysis_tasks: List[Dict[str, Any]],
+        results: List[Dict[str, Any]],
+        images: List[str],
+        image_sources: Optional[List[Dict[str, Any]]],
+        markers: DocumentMarkers,
+        shared_images: List[str],
+    ) -> List[tuple[Dict[str, Any], List[str]]]:
+        """Plans follow-up calls with full-resolution images for items flagged on previews.
+
+        Returns:
+            ``(task, full_images)`` per originating batch with flagged items.
+        """
+        if image_sources:
+            image_pages: Optional[List[Any]] = [source.get("page") for source in image_sources]
+        elif markers.max_page_number == len(images):
+            image_pages = list(range(1, len(images) + 1))
+        else:
+            image_pages = None
+
+        max_calls = get_image_pyramid_settings()["max_escalation_calls"]
+        escalations: List[tuple[Dict[str, Any], List[str]]] = []
+        for task_data, task_result in zip(analysis_tasks, results):
+            if len(escalations) >= max_calls:
+                break
+            if task_data["mode"] != "checklist_batch" or not isinstance(task_result, dict):
+                continue
+            items_by_text = {
+                str(item.get("checklist_item") or "").strip(): item
+                for item in task_data["checklist"]
+            }
+            flagged_items: List[Dict[str, Any]] = []
+            detail_pages = set()
+            for row in task_result.get("checklist") or []:
+                if not isinstance(row, dict):
+                    continue
+                # Model output, not a setting: only a literal true (or the string "true") asks for detail.
+                needs_detail = row.get("needs_visual_detail")
+                if not (needs_detail is True or str(needs_detail or "").strip().lower() == "true"):
+                    continue
+                checklist_item = items_by_text.get(str(row.get("item") or "").strip())
+                if checklist_item is None or any(checklist_item is flagged for flagged in flagged_items):
+                    continue
+                flagged_items.append(checklist_item)
+                for page in row.get("detail_pages") or []:
+                    try:
+                        detail_pages.add(int(page))
+                    except (TypeError, ValueError):
+                        continue
+            if not flagged_items:
+                continue
+
+            full_images = shared_images
+            if image_pages and detail_pages:
+                # Any image of a flagged page qualifies, including pages the preview budget left out.
+                full_images = [
+                    image for image, page in zip(images, image_pages) if page in detail_pages
+                ] or shared_images
+            full_images = full_images[:self.vision_max_images_per_request]
+            if not full_images:
+                continue
+
+            escalations.append(({
+                "mode": "visual_escalation",
+                "filename": "document",
+                "content": task_data["content"],
+                "checklist": flagged_items,
+                "scope_label": f"Visual detail re-check ({task_data['scope_label']})",
+                "retrieved_pages": task_data.get("retrieved_pages") or [],
+            }, full_images))
+        return escalations
+
+    def _build_batch_event(
+        self,
+        task_index: int,
+        analysis_tasks: List[Dict[str, Any]],
+        task_result: Dict[str, Any],
+        is_car_analysis: bool,
+        total_pages: int,
+    ) -> Dict[str, Any]:
+        """Normalizes one batch result into a streamable progress payload.
+
+        Args:
+            task_index: Zero-based index of the completed task.
+            analysis_tasks: All dispatched analysis tasks.
+            task_result: Parsed model output for the task.
+            is_car_analysis: Whether chunk-level `Not Seen` statuses should be preserved.
+            total_pages: Page count used to drop out-of-range references; 0 disables references.
+
+        Returns:
+            A dictionary with task position, scope and normalized checklist items.
+        """
+        task_data = analysis_tasks[task_index]
+        task_result = task_result if isinstance(task_result, dict) else {}
+        checklist: List[Dict[str, Any]] = []
+        for item in task_result.get("checklist", []) or []:
+            if not isinstance(item, dict):
+                continue
+            item_text = str(item.get("item") or "").strip()
+            if not item_text:
+                continue
+
+            normalized_status = normalize_review_status(item.get("status"))
+            if normalized_status == "not_seen" and not is_car_analysis:
+                normalized_status = "fail"
+
+            page_references: List[int] = []
+            raw_refs = item.get("page_references", [])
+            if total_pages and isinstance(raw_refs, list):
+                for ref in raw_refs:
+                    try:
+                        page_number = int(ref)
+                    except (TypeError, ValueError):
+                        continue
+                    if 1 <= page_number <= total_pages and page_number not in page_references:
+                        page_references.append(page_number)
+
+            checklist.append({
+                "section": str(item.get("section") or "General").strip(),
+                "item": item_text,
+                "status": format_review_status(normalized_status),
+                "comment": str(item.get("comment") or "").strip(),
+                "page_references": sorted(page_references),
+            })
+
+        return {
+            "task_index": task_index + 1,
+            "task_count": len(analysis_tasks),
+            "mode": task_data["mode"],
+            "filename": task_data["filename"],
+            "filenames": task_data.get("filenames") or [task_data["filename"]],
+            "scope": task_data["scope_label"],
+            "checklist": checklist,
+            "error": task_result.get("error"),
+        }
+
     def _extract_comment_field(self, comment: str, label: str, next_labels: List[str]) -> str:
         if not comment:
             return ""
@@ -1164,23 +1695,6 @@ Custom Instructions: {custom_instructions}
 
         return keywords
 
-    def _build_page_text_index(self, text: str) -> Dict[int, str]:
-        page_sections = list(re.finditer(r'--- Page (\d+) (?:Text|Tables|Visual Metadata|OCR) ---', text))
-        if not page_sections:
-            return {}
-
-        page_chunks: Dict[int, List[str]] = {}
-        for index, match in enumerate(page_sections):
-            page_number = int(match.group(1))
-            chunk_start = match.end()
-            chunk_end = page_sections[index + 1].start() if index + 1 < len(page_sections) else len(text)
-            page_chunks.setdefault(page_number, []).append(text[chunk_start:chunk_end])
-
-        return {
-            page_number: "\n".join(chunks)
-            for page_number, chunks in page_chunks.items()
-        }
-
     def _extract_reference_candidates(self, item: Dict[str, Any]) -> List[str]:
         comment = str(item.get("comment") or "")
         candidates: List[str] = []
@@ -1214,13 +1728,13 @@ Custom Instructions: {custom_instructions}
     def _score_page_candidates(
         self,
         item: Dict[str, Any],
-        normalized_page_text_index: Dict[int, str],
+        page_index: PageReferenceIndex,
     ) -> Dict[int, int]:
         page_scores: Dict[int, int] = {}
 
         direct_page_numbers = []
         for candidate in self._extract_reference_candidates(item):
-            page_match = re.fullmatch(r'page\s+(\d+)', candidate.strip(), flags=re.IGNORECASE)
+            page_match = DIRECT_PAGE_CANDIDATE_PATTERN.fullmatch(candidate.strip())
             if page_match:
                 direct_page_numbers.append(int(page_match.group(1)))
                 continue
@@ -1229,41 +1743,48 @@ Custom Instructions: {custom_instructions}
             if len(normalized_candidate) < 4:
                 continue
 
-            for page_number, page_text in normalized_page_text_index.items():
-                if normalized_candidate in page_text:
-                    # Strong score for an exact normalized phrase match.
-                    page_scores[page_number] = page_scores.get(page_number, 0) + 12
-                else:
-                    candidate_words = normalized_candidate.split()
-                    if len(candidate_words) >= 3:
-                        overlap = sum(1 for word in candidate_words if word in page_text)
-                        if overlap >= 3:
-                            page_scores[page_number] = page_scores.get(page_number, 0) + overlap
+            phrase_pages = page_index.pages_containing(normalized_candidate)
+            for page_number in phrase_pages:
+                # Strong score for an exact normalized phrase match.
+                page_scores[page_number] = page_scores.get(page_number, 0) + 12
+
+            candidate_words = normalized_candidate.split()
+            if len(candidate_words) >= 3:
+                word_overlap: Dict[int, int] = {}
+                for word in candidate_words:
+                    for page_number in page_index.pages_containing(word):
+                        word_overlap[page_number] = word_overlap.get(page_number, 0) + 1
+                for page_number, overlap in word_overlap.items():
+                    if overlap >= 3 and page_number not in phrase_pages:
+                        page_scores[page_number] = page_scores.get(page_number, 0) + overlap
 
         for page_number in direct_page_numbers:
             page_scores[page_number] = page_scores.get(page_number, 0) + 50
 
-        keyword_terms = self._extract_keyword_terms(item)
-        if keyword_terms:
-            for page_number, page_text in normalized_page_text_index.items():
-                keyword_hits = sum(1 for keyword in keyword_terms if keyword in page_text)
-                if keyword_hits:
-                    page_scores[page_number] = page_scores.get(page_number, 0) + keyword_hits
+        for keyword in self._extract_keyword_terms(item):
+            for page_number in page_index.pages_containing(keyword):
+                page_scores[page_number] = page_scores.get(page_number, 0) + 1
 
         return page_scores
 
-    def _resolve_page_references(self, response: dict, text: str, reference_format: Optional[str]) -> dict:
+    def _resolve_page_references(
+        self,
+        response: dict,
+        text: str,
+        reference_format: Optional[str],
+        markers: Optional[DocumentMarkers] = None,
+    ) -> dict:
         if reference_format != "Page":
             return response
 
-        page_text_index = self._build_page_text_index(text)
+        page_text_index = (markers or scan_document_markers(text)).page_text_index()
         if not page_text_index:
             return response
 
-        normalized_page_text_index = {
+        page_index = PageReferenceIndex({
             page_number: self._normalize_locator_text(page_text)
             for page_number, page_text in page_text_index.items()
-        }
+        })
 
         for item in response.get("checklist", []):
             status = str(item.get("status") or "").strip().lower()
@@ -1285,7 +1806,7 @@ Custom Instructions: {custom_instructions}
                     except (TypeError, ValueError):
                         continue
 
-            page_scores = self._score_page_candidates(item, normalized_page_text_index)
+            page_scores = self._score_page_candidates(item, page_index)
             if page_scores:
                 ranked_pages = sorted(
                     page_scores.items(),
@@ -1355,16 +1876,8 @@ Custom Instructions: {custom_instructions}
             
         return response
 
-    async def analyze_code(self, files: List[dict]) -> dict:
-        """Performs a comprehensive code review on a list of files.
-
-        Args:
-            files: A list of dictionaries, each containing 'filename' and 'content'.
-
-        Returns:
-            A dictionary containing the overall score and individual file reviews.
-        """
-        system_prompt = """You are a Principal Software Engineer and an expert Code Reviewer.
+    def _code_review_system_prompt(self) -> str:
+        return """You are a Principal Software Engineer and an expert Code Reviewer.
         Your task is to analyze the provided source code files for formatting correctness, modularity, error handling, performance issues, and language-specific best practices.
 
         CRITICAL INSTRUCTIONS:
@@ -1395,41 +1908,148 @@ Custom Instructions: {custom_instructions}
             ]
         }}
         """
-        
-        # Batching files to prevent exceeding context limits
-        MAX_CHUNK_SIZE = 150000
-        batches = []
-        current_batch = []
-        current_batch_size = 0
-        
-        for f in files:
-            content_with_lines = "\n".join(f"{i+1} | {line}" for i, line in enumerate(f['content'].split('\n')))
-            file_str = f"=== BEGIN FILE: {f['filename']} ===\n{content_with_lines}\n=== END FILE: {f['filename']} ===\n\n"
-            
-            if current_batch_size + len(file_str) > MAX_CHUNK_SIZE and current_batch:
-                batches.append(current_batch)
-                current_batch = [file_str]
-                current_batch_size = len(file_str)
-            else:
-                current_batch.append(file_str)
-                current_batch_size += len(file_str)
-                
-        if current_batch:
-            batches.append(current_batch)
-            
+
+    async def analyze_code(
+        self,
+        files: List[dict],
+        static_analyses: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> dict:
+        """Performs a comprehensive code review on a list of files.
+
+        Args:
+            files: A list of dictionaries, each containing 'filename' and 'content'.
+            static_analyses: Pre-analysis from ``analyze_code_files``, possibly over
+                more files than are reviewed here; computed from ``files`` when omitted.
+
+        Returns:
+            A dictionary containing the overall score and individual file reviews.
+            Only per-file static findings are merged; cross-file findings are left
+            to the caller (see ``merge_cross_file_findings``).
+        """
+        # Token-aware batching: fewer, fuller calls, and no file larger than one call.
+        batching_settings = get_code_batching_settings()
+
+        # Mechanical facts are computed locally and shown ahead of each file instead of left for the model.
+        system_prompt = self._code_review_system_prompt()
+        if static_analyses is None:
+            static_analyses = analyze_code_files(files) if get_static_analysis_settings()["mode"] == "on" else {}
+        static_prefixes: Dict[str, str] = {}
+        if static_analyses:
+            system_prompt += CODE_STATIC_ANALYSIS_NOTE
+            for file_info in files:
+                analysis = static_analyses.get(file_info.get("filename"))
+                if analysis:
+                    static_prefixes[file_info["filename"]] = render_static_context(file_info["filename"], analysis)
+        # The static summaries count against the budget, so a file that just fits is split rather than overflowing.
+        segments = build_file_segments(files, count_tokens, batching_settings["max_batch_tokens"], static_prefixes)
+        static_findings = sum(
+            len(static_analyses[filename]["findings"])
+            for filename in {f.get("filename") for f in files}
+            if filename in static_analyses
+        )
+        batches = pack_segments(segments, batching_settings["max_batch_tokens"], batching_settings["max_files_per_batch"])
+        split_files = sorted({
+            segment["filename"] for batch in batches for segment in batch if segment["parts"] > 1
+        })
+        logger.info(
+            "Code review batching: "
+            f"files={len(files)} "
+            f"batches={len(batches)} "
+            f"batch_tokens={[sum(segment['tokens'] for segment in batch) for batch in batches]} "
+            f"split_files={split_files} "
+            f"static_findings={static_findings} "
+            f"max_batch_tokens={batching_settings['max_batch_tokens']} "
+            f"concurrency={batching_settings['concurrency']}"
+        )
+
+        user_intro = "Please review the following code files. Note that each line of code is prefixed with its line number (format: 'line_number | code'):\n\n"
+        submitted_filenames = [str(f.get("filename") or "") for f in files]
+        response = await self._run_code_review_batches(system_prompt, user_intro, batches, submitted_filenames)
+
+        for review in response.get("files", []):
+            analysis = static_analyses.get(review.get("filename"))
+            if not analysis:
+                continue
+            suggestions = list(review.get("suggestions") or [])
+            review["suggestions"] = suggestions + [
+                finding for finding in analysis["findings"] if finding not in suggestions
+            ]
+            review["metrics"] = analysis["metrics"]
+        return response
+
+    async def analyze_code_changes(self, segments: List[dict]) -> dict:
+        """Reviews only the changed regions of files.
+
+        Args:
+            segments: Change segments from ``services.code_diff.build_change_segments``.
+
+        Returns:
+            The same shape as ``analyze_code``; each file review also lists its
+            ``reviewed_ranges`` and keeps only suggestions inside them.
+        """
+        batching_settings = get_code_batching_settings()
+        for segment in segments:
+            segment["tokens"] = count_tokens(segment["text"])
+        # A change segment is never split; an oversized one simply gets a call of its own.
+        batches = pack_segments(segments, batching_settings["max_batch_tokens"], batching_settings["max_files_per_batch"])
+        logger.info(
+            "Code diff review batching: "
+            f"files={len(segments)} "
+            f"changed_lines={sum(segment['changed_line_count'] for segment in segments)} "
+            f"batches={len(batches)} "
+            f"batch_tokens={[sum(segment['tokens'] for segment in batch) for batch in batches]}"
+        )
+
+        user_intro = (
+            "Please review the changes in the following code files. Each line is prefixed with its head line number; "
+            "changed lines use the format 'line_number +| code' and context lines 'line_number  | code':\n\n"
+        )
+        submitted_filenames = [segment["filename"] for segment in segments]
+        response = await self._run_code_review_batches(
+            self._code_review_system_prompt() + CODE_DIFF_REVIEW_NOTE, user_intro, batches, submitted_filenames
+        )
+
+        regions_by_filename = {segment["filename"]: segment["regions"] for segment in segments}
+        for review in response.get("files", []):
+            regions = regions_by_filename.get(review.get("filename"))
+            if regions is None:
+                continue
+            # Suggestions about lines outside the shown regions cannot be grounded in the change.
+            review["suggestions"] = [
+                suggestion for suggestion in review.get("suggestions") or []
+                if suggestion_in_regions(suggestion, regions)
+            ]
+            review["reviewed_ranges"] = [{"start_line": start, "end_line": end} for start, end in regions]
+        return response
+
+    async def _run_code_review_batches(
+        self,
+        system_prompt: str,
+        user_intro: str,
+        batches: List[List[Dict[str, Any]]],
+        submitted_filenames: List[str],
+    ) -> dict:
+        """Runs planned code review batches concurrently and merges them into one response."""
+        batching_settings = get_code_batching_settings()
+
         async def process_batch(batch_files, semaphore):
             async with semaphore:
-                user_content = "Please review the following code files. Note that each line of code is prefixed with its line number (format: 'line_number | code'):\n\n"
-                user_content += "".join(batch_files)
-                
+                user_content = user_intro
+                if any(segment["parts"] > 1 for segment in batch_files):
+                    user_content += (
+                        "Some large files are split into parts labelled '(part N/M, lines A-B)'. Review each part on its own, "
+                        "report it under the plain filename without the part label, and keep the original line numbers shown.\n\n"
+                    )
+                user_content += "".join(segment["text"] for segment in batch_files)
+
                 messages = [
                     SystemMessage(content=system_prompt),
                     HumanMessage(content=user_content)
                 ]
-                
-                code_parser = JsonOutputParser(pydantic_object=CodeAnalysisResponse_Schema)
-                chain = self.llm | code_parser
-                
+
+                code_parser = RepairingJsonOutputParser(pydantic_object=CodeAnalysisResponse_Schema)
+                chain = self._schedule_chain(self.llm | code_parser)
+
                 try:
                     return await chain.ainvoke(messages)
                 except Exception as e:
@@ -1437,17 +2057,21 @@ Custom Instructions: {custom_instructions}
                     return {"files": [], "error": str(e)}
 
         try:
-            semaphore = asyncio.Semaphore(3)
+            semaphore = asyncio.Semaphore(batching_settings["concurrency"])
             tasks = [process_batch(b, semaphore) for b in batches]
             results = await asyncio.gather(*tasks)
-            
+
             merged_files = []
             for res in results:
                 if "files" in res:
                     merged_files.extend(res["files"])
-            
-            response = {"files": merged_files}
-            
+
+            response = {"files": merge_file_part_reviews(merged_files, submitted_filenames)}
+            reviewed_filenames = {review["filename"] for review in response["files"]}
+            missing_filenames = [name for name in submitted_filenames if name not in reviewed_filenames]
+            if missing_filenames:
+                logger.warning(f"Code review returned no result for files: {missing_filenames}")
+
             # Ensure the overall score calculation is accurate even if the LLM hallucinates the math slightly
             file_scores = [f.get("score", 0) for f in response.get("files", [])]
             if len(file_scores) > 0:
@@ -1455,7 +2079,7 @@ Custom Instructions: {custom_instructions}
                 response["overall_score"] = calculated_average
             else:
                 response["overall_score"] = 0
-                
+
             return response
         except Exception as e:
             logger.error(f"AI Code Analysis Error: {e}")
@@ -1472,7 +2096,264 @@ Custom Instructions: {custom_instructions}
             }
 
     async def auto_fix_code(self, filename: str, content: str, selected_suggestions: List[str]) -> dict:
-        """Applies selected suggestions to a code file.
+        """Applies selected suggestions to a code file and validates the result.
+
+        Args:
+            filename: The name of the file to fix.
+            content: The original source code.
+            selected_suggestions: A list of strings describing the improvements to apply.
+
+        Returns:
+            A dictionary containing the fixed_code, the fix_mode used and a
+            ``validation`` report (status "valid", "repaired", "invalid" or "skipped").
+        """
+        result = await self._generate_code_fix(filename, content, selected_suggestions)
+        if result.get("error") or not isinstance(result.get("fixed_code"), str):
+            return result
+        fixed_code, validation = await self._validate_and_repair_fix(filename, content, result["fixed_code"])
+        return {**result, "fixed_code": fixed_code, "validation": validation}
+
+    async def _validate_and_repair_fix(self, filename: str, original: str, fixed_code: str) -> tuple[str, dict]:
+        """Checks fixed code locally and, for a syntax error the fix introduced, asks for a repair of that region only."""
+        settings = get_validation_settings()
+        if not settings["enabled"] or not has_validator(filename):
+            return fixed_code, {"status": "skipped"}
+        error = validate_code(filename, fixed_code)
+        if error is None:
+            return fixed_code, {"status": "valid"}
+        if validate_code(filename, original) is not None:
+            # The file did not parse before the fix either; nothing to hold the fix to.
+            return fixed_code, {"status": "skipped", "error": error}
+
+        metrics.increment("auto_fix_validation_failures_total")
+        for attempt in range(settings["max_repair_attempts"]):
+            repaired = await self._repair_code_region(filename, fixed_code, error, settings["repair_context_lines"])
+            if repaired is None:
+                break
+            repaired_error = validate_code(filename, repaired)
+            if repaired_error is None:
+                metrics.increment("auto_fix_repairs_total")
+                logger.info(f"Auto-fix for {filename} repaired after {attempt + 1} attempt(s): {error['message']}")
+                return repaired, {"status": "repaired", "repaired_error": error}
+            fixed_code, error = repaired, repaired_error
+        logger.warning(f"Auto-fix for {filename} still fails validation: line {error['line']}: {error['message']}")
+        return fixed_code, {"status": "invalid", "error": error}
+
+    async def _repair_code_region(
+        self, filename: str, code: str, error: Dict[str, Any], context_lines: int
+    ) -> Optional[str]:
+        """Asks the model to fix a syntax error using only the lines around it; returns the repaired file or None."""
+        lines = code.split("\n")
+        error_line = min(max(1, int(error.get("line") or 1)), len(lines))
+        start = max(1, error_line - context_lines)
+        end = min(len(lines), error_line + context_lines)
+
+        system_prompt = """You are an expert Principal Software Engineer fixing a syntax error in an excerpt of a source file.
+        Change only what is needed to make the code syntactically valid, without altering its behaviour or formatting otherwise.
+        The excerpt is shown with line numbers ('line_number | code'). Return edits that only touch lines inside the excerpt.
+        Each edit replaces the original lines start_line..end_line (inclusive) with `replacement`; `original` is the exact original text of those lines without line numbers.
+        To insert without replacing, set end_line to start_line - 1 and leave `original` empty.
+
+        You must output a JSON object with the following exact structure:
+        {
+            "edits": [
+                {"start_line": 12, "end_line": 12, "original": "<original line 12>", "replacement": "<fixed code>"}
+            ]
+        }
+        """
+        user_content = (
+            f"Filename: {filename}\n"
+            f"Syntax error reported at line {error_line}: {error.get('message')}\n\n"
+            f"Excerpt (lines {start}-{end} of {len(lines)}):\n"
+            f"{render_numbered_lines(lines[start - 1:end], start)}\n"
+        )
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_content)
+        ]
+        chain = self._schedule_chain(self.llm | RepairingJsonOutputParser(pydantic_object=CodePatchResponse))
+        try:
+            response = await chain.ainvoke(messages)
+        except Exception as e:
+            logger.warning(f"Repair call for {filename} failed: {e}")
+            return None
+        edits = (response or {}).get("edits")
+        if not isinstance(edits, list) or not edits:
+            return None
+        for edit in edits:
+            try:
+                edit_start = int(edit.get("start_line"))
+                edit_end = int(edit.get("end_line", edit_start))
+            except (AttributeError, TypeError, ValueError):
+                return None
+            # Insertions may sit right after the excerpt's last line.
+            if edit_start < start or edit_end > end or edit_start > end + 1:
+                return None
+        repaired, failure = apply_line_edits(code, edits)
+        if repaired is None:
+            logger.warning(f"Repair edits for {filename} did not apply: {failure}")
+        return repaired
+
+    async def _generate_code_fix(self, filename: str, content: str, selected_suggestions: List[str]) -> dict:
+        """Produces the fixed code for one file.
+
+        In patch mode the model returns line-range edits that are applied
+        locally; if they do not apply cleanly the whole file is regenerated.
+        When every suggestion names its lines, only the enclosing functions or
+        classes are sent.
+
+        Returns:
+            A dictionary containing the fixed_code, the fix_mode and the input_scope used.
+        """
+        if get_auto_fix_output_mode() == "full":
+            return {**await self._auto_fix_code_full(filename, content, selected_suggestions), "fix_mode": "full"}
+
+        system_prompt = """You are an expert Principal Software Engineer.
+        Your task is to apply ONLY the specific improvements requested by the user to a given piece of source code, as a set of targeted line edits. Do not make unrelated stylistic changes or restructure code unless it is explicitly part of the selected suggestions.
+""" + CODE_PATCH_FORMAT_INSTRUCTIONS + """
+        You must output a JSON object with the following exact structure:
+        {
+            "edits": [
+                {"start_line": 12, "end_line": 13, "original": "<original lines 12-13>", "replacement": "<new code>"}
+            ]
+        }
+        """
+
+        lines = content.split("\n")
+        regions = None
+        region_settings = get_auto_fix_region_settings()
+        suggestion_ranges = parse_suggestion_ranges(selected_suggestions)
+        if (
+            region_settings["scope"] == "region"
+            and suggestion_ranges
+            and len(lines) >= region_settings["min_file_lines"]
+        ):
+            candidate_regions = build_fix_regions(filename, content, suggestion_ranges, region_settings["padding_lines"])
+            if sum(end - start + 1 for start, end in candidate_regions) <= region_settings["max_region_ratio"] * len(lines):
+                regions = candidate_regions
+
+        formatted_suggestions = "\n".join([f"- {s}" for s in selected_suggestions])
+        if regions:
+            source_text = (
+                f"Relevant Regions of the Source Code (the file has {len(lines)} lines; lines not shown stay unchanged "
+                "and must not be edited):\n"
+                + "\n".join(
+                    f"--- lines {start}-{end} ---\n{render_numbered_lines(lines[start - 1:end], start)}"
+                    for start, end in regions
+                )
+            )
+        else:
+            source_text = f"Original Source Code:\n{render_numbered_lines(lines)}"
+        user_content = (
+            f"Filename: {filename}\n\n"
+            f"Selected Suggestions to Apply:\n{formatted_suggestions}\n\n"
+            f"{source_text}\n"
+        )
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_content)
+        ]
+
+        patch_parser = RepairingJsonOutputParser(pydantic_object=CodePatchResponse)
+        chain = self._schedule_chain(self.llm | patch_parser)
+        try:
+            response = await chain.ainvoke(messages)
+            edits = (response or {}).get("edits")
+            if regions and not edits_within_regions(edits, regions):
+                fixed_code, failure = None, "edit outside the regions shown"
+            else:
+                fixed_code, failure = apply_line_edits(content, edits)
+        except Exception as e:
+            fixed_code, failure = None, str(e)
+        if fixed_code is not None:
+            metrics.increment("auto_fix_patch_applied_total")
+            if regions:
+                logger.info(
+                    f"Region-scoped auto-fix for {filename}: "
+                    f"lines_sent={sum(end - start + 1 for start, end in regions)}/{len(lines)} regions={regions}"
+                )
+            return {"fixed_code": fixed_code, "fix_mode": "patch", "input_scope": "region" if regions else "file"}
+
+        metrics.increment("auto_fix_patch_fallback_total")
+        logger.warning(f"Auto-fix edits for {filename} did not apply ({failure}); regenerating the full file.")
+        return {**await self._auto_fix_code_full(filename, content, selected_suggestions), "fix_mode": "full"}
+
+    async def auto_fix_code_batch(self, files: List[dict]) -> dict:
+        """Applies improvements to multiple code files.
+
+        Args:
+            files: A list of dictionaries with 'filename', 'content', and 'selected_suggestions'.
+
+        Returns:
+            A dictionary containing a list of fixed files in submitted order.
+        """
+        final_response: Dict[str, Any] = {"fixed_files": []}
+        async for event in self.auto_fix_code_batch_stream(files):
+            if event["event"] == "result":
+                final_response = event["data"]
+        return final_response
+
+    async def auto_fix_code_batch_stream(self, files: List[dict]):
+        """Fixes files with one call each, in parallel, yielding them as they finish.
+
+        A failure only affects its own file. Calls are bounded by
+        ``LLM_AUTO_FIX_CONCURRENCY`` on top of the shared LLM scheduler.
+
+        Yields:
+            A ``file`` event per file in completion order, then one ``result``
+            event with all files in submitted order. Each file carries
+            ``status`` ("fixed" or "failed"), ``fixed_code`` (the original
+            content when failed), ``fix_mode`` and, when failed, ``error``.
+        """
+        semaphore = asyncio.Semaphore(get_auto_fix_concurrency())
+
+        async def fix_file(index: int, file_data: dict) -> tuple[int, dict]:
+            async with semaphore:
+                try:
+                    result = await self.auto_fix_code(
+                        file_data["filename"], file_data["content"], file_data.get("selected_suggestions") or []
+                    )
+                    error = result.get("error")
+                except Exception as e:
+                    logger.error(f"Auto-fix failed for {file_data['filename']}: {e}")
+                    result, error = {}, str(e)
+            if error or not isinstance(result.get("fixed_code"), str):
+                return index, {
+                    "filename": file_data["filename"],
+                    "status": "failed",
+                    "fixed_code": file_data["content"],
+                    "fix_mode": result.get("fix_mode"),
+                    "error": error or "No fixed code returned",
+                }
+            return index, {
+                "filename": file_data["filename"],
+                "status": "fixed",
+                "fixed_code": result["fixed_code"],
+                "fix_mode": result.get("fix_mode"),
+                "validation": result.get("validation"),
+            }
+
+        fixed_files: List[Optional[dict]] = [None] * len(files)
+        pending_tasks = [asyncio.ensure_future(fix_file(i, file_data)) for i, file_data in enumerate(files)]
+        try:
+            for completed in asyncio.as_completed(pending_tasks):
+                index, fixed_file = await completed
+                fixed_files[index] = fixed_file
+                yield {"event": "file", "data": {"index": index, **fixed_file}}
+        finally:
+            # Client disconnects close the generator; do not leave orphaned LLM calls running.
+            for pending_task in pending_tasks:
+                if not pending_task.done():
+                    pending_task.cancel()
+
+        failed = sum(1 for fixed_file in fixed_files if fixed_file and fixed_file["status"] == "failed")
+        metrics.increment("auto_fix_files_total", len(files))
+        metrics.increment("auto_fix_files_failed_total", failed)
+        logger.info(f"Batch auto-fix: files={len(files)} failed={failed}")
+        yield {"event": "result", "data": {"fixed_files": [fixed_file for fixed_file in fixed_files if fixed_file]}}
+
+    async def _auto_fix_code_full(self, filename: str, content: str, selected_suggestions: List[str]) -> dict:
+        """Applies selected suggestions to a code file by regenerating the whole file.
 
         Args:
             filename: The name of the file to fix.
@@ -1514,8 +2395,8 @@ Custom Instructions: {custom_instructions}
             HumanMessage(content=user_content)
         ]
         
-        fix_parser = JsonOutputParser(pydantic_object=CodeAutoFixResponse)
-        chain = self.llm | fix_parser
+        fix_parser = RepairingJsonOutputParser(pydantic_object=CodeAutoFixResponse)
+        chain = self._schedule_chain(self.llm | fix_parser)
         
         try:
             response = await chain.ainvoke(messages)
@@ -1523,72 +2404,6 @@ Custom Instructions: {custom_instructions}
         except Exception as e:
             logger.error(f"AI Auto-Fix Error: {e}")
             return {
-                "fixed_code": f"// Error generating fixed code: {str(e)}\n\n" + content
-            }
-
-    async def auto_fix_code_batch(self, files: List[dict]) -> dict:
-        """Applies improvements to multiple code files in a single batch.
-
-        Args:
-            files: A list of dictionaries with 'filename', 'content', and 'selected_suggestions'.
-
-        Returns:
-            A dictionary containing a list of fixed files.
-        """
-        system_prompt = """You are an expert Principal Software Engineer.
-        Your task is to take multiple source code files and rewrite them by applying ONLY the specific improvements requested per file. Do not make unrelated stylistic changes or restructure code unless it is explicitly part of the selected suggestions.
-        
-        CRITICAL INSTRUCTIONS:
-        1. Apply the user's selected suggestions accurately and completely to the source code for each file.
-        2. Verify that the updated code remains valid and runnable.
-        3. Do NOT include markdown code blocks (like ```python) surrounding the code strings in your JSON response. The `fixed_code` values should strictly be raw code.
-        4. PRESERVE ALL ORIGINAL FORMATTING: You must strictly maintain the original indentation, whitespace, blank lines, and empty spaces for each file. Do not auto-format, align, or restructure any code that is outside the scope of the requested suggestions.
-
-        You must output a JSON object with the following exact structure:
-        {
-            "fixed_files": [
-                {
-                    "filename": "<original filename>",
-                    "fixed_code": "<the complete rewritten source code>"
-                }
-            ]
-        }
-        """
-        
-        file_payloads = []
-        for f in files:
-            formatted_suggestions = "\n".join([f"- {s}" for s in f.get('selected_suggestions', [])])
-            file_str = f"""
-            Filename: {f['filename']}
-            
-            Selected Suggestions to Apply:
-            {formatted_suggestions}
-            
-            Original Source Code:
-            {f['content']}
-            """
-            file_payloads.append(file_str)
-            
-        user_content = "\n\n---\n\n".join(file_payloads)
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_content)
-        ]
-        
-        fix_parser = JsonOutputParser(pydantic_object=CodeAutoFixBatchResponse)
-        chain = self.llm | fix_parser
-        
-        try:
-            response = await chain.ainvoke(messages)
-            return response
-        except Exception as e:
-            logger.error(f"AI Batch Auto-Fix Error: {e}")
-            return {
-                "fixed_files": [
-                    {
-                        "filename": f["filename"],
-                        "fixed_code": f"// Error generating fixed code: {str(e)}\n\n" + f["content"]
-                    } for f in files
-                ]
+                "fixed_code": f"// Error generating fixed code: {str(e)}\n\n" + content,
+                "error": str(e)
             }
@@ -0,0 +1,166 @@
+"""Routing of checklist items to relevant members of a CAR archive.
+
+In CAR analysis every chunk of every embedded file is reviewed separately.
+Routing sends each chunk only the checklist items its file can say something
+about: a ``.properties`` file is not asked about fault handlers and a lookup
+is not asked about connection security. Files are classified by path,
+extension and XML root element; items by keywords in their section and text.
+Unclassified files and unclassified items keep the old behavior of being
+paired with everything.
+"""
+import os
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from config.logging_config import get_logger
+from utils.env import is_truthy_env
+
+logger = get_logger(__name__)
+
+ROUTED_OUT_COMMENT = "No archive member relevant to this checklist item was found, so it was not reviewed against any file."
+
+ROOT_ELEMENT_PATTERN = re.compile(r'<([A-Za-z_][\w:.-]*)')
+
+EXTENSION_KINDS = {
+    ".jca": {"connection"},
+    ".xsl": {"mapping"},
+    ".xqy": {"mapping"},
+    ".wsdl": {"interface"},
+    ".xsd": {"interface"},
+    ".properties": {"properties"},
+    ".jpr": {"integration"},
+}
+
+# (path pattern, kinds) checked against the lowercased member path.
+PATH_KIND_RULES: List[Tuple["re.Pattern[str]", FrozenSet[str]]] = [
+    (re.compile(r'project-inf|(?:^|/)project\.xml$'), frozenset({"integration"})),
+    (re.compile(r'appinstances?/|connections?/'), frozenset({"connection"})),
+    (re.compile(r'dvms?/|lookups?/|\.dvm'), frozenset({"lookup"})),
+    (re.compile(r'processor_|orchestration'), frozenset({"orchestration"})),
+    (re.compile(r'schedul'), frozenset({"schedule"})),
+]
+
+# (root element pattern, kinds) checked against the lowercased local root name.
+ROOT_KIND_RULES: List[Tuple["re.Pattern[str]", FrozenSet[str]]] = [
+    (re.compile(r'^(?:icsproject|project|integration)$'), frozenset({"integration"})),
+    (re.compile(r'adapter-config|applicationinstance|connection'), frozenset({"connection"})),
+    (re.compile(r'^stylesheet$'), frozenset({"mapping"})),
+    (re.compile(r'^(?:definitions|schema)$'), frozenset({"interface"})),
+    (re.compile(r'^dvm$|lookup'), frozenset({"lookup"})),
+    (re.compile(r'orchestration|^flow$|process'), frozenset({"orchestration"})),
+    (re.compile(r'schedul'), frozenset({"schedule"})),
+]
+
+# Items that can be evidenced anywhere are never narrowed.
+UNRESTRICTED_ITEM_PATTERN = re.compile(r'hard-?cod|environment[- ]specific|environment-independent|test endpoint')
+
+# (item keyword pattern, file kinds that can hold evidence for it).
+ITEM_ROUTING_RULES: List[Tuple["re.Pattern[str]", FrozenSet[str]]] = [
+    (
+        re.compile(r'\bconnection|credential|authenticat|oauth|api key|\bssl\b|certificat|security polic'),
+        frozenset({"connection", "properties", "integration"}),
+    ),
+    (
+        re.compile(r'lookup|cross[- ]reference|\bdvm|_lkp'),
+        frozenset({"lookup", "mapping", "integration", "orchestration"}),
+    ),
+    (
+        re.compile(r'mapping|\bxsl|xml attribute|complex element|schema|type name|camel-case'),
+        frozenset({"mapping", "interface", "integration"}),
+    ),
+    (
+        re.compile(r'schedul|time zone|overlapping integration run'),
+        frozenset({"schedule", "integration", "properties"}),
+    ),
+    (
+        re.compile(r'\brest\b|\bsoap\b|fbdi|standard api|\bwsdl'),
+        frozenset({"interface", "connection", "integration", "orchestration"}),
+    ),
+    (
+        re.compile(
+            r'fault|error|retry|scope|switch|for-each|foreach|loop|orchestrat|notification|logg|'
+            r'tracking|payload|parallel|pagination|stage file|database call|external call|'
+            r'idempoten|data validation|business unit|assign|stitch|iterat|while'
+        ),
+        frozenset({"integration", "orchestration", "mapping"}),
+    ),
+    (
+        re.compile(r'documentation|document exist|design document|test ?case|unit test|tested|deployment|smoke test|migrat'),
+        frozenset({"integration"}),
+    ),
+]
+
+
+def is_car_routing_enabled() -> bool:
+    return is_truthy_env(os.getenv("LLM_CAR_ROUTING_ENABLED", "true"))
+
+
+def classify_archive_member(filename: str, content: str) -> FrozenSet[str]:
+    """Returns the artifact kinds of one archive member; empty when unrecognized."""
+    # Nested archive members are named "outer.iar -> inner/path".
+    path = str(filename or "").split(" -> ")[-1].strip().lower()
+    kinds = set(EXTENSION_KINDS.get(os.path.splitext(path)[1], ()))
+    for pattern, rule_kinds in PATH_KIND_RULES:
+        if pattern.search(path):
+            kinds.update(rule_kinds)
+
+    root_match = ROOT_ELEMENT_PATTERN.search((content or "")[:2000])
+    if root_match:
+        root_name = root_match.group(1).split(":")[-1].lower()
+        for pattern, rule_kinds in ROOT_KIND_RULES:
+            if pattern.search(root_name):
+                kinds.update(rule_kinds)
+    return frozenset(kinds)
+
+
+def route_checklist_item(item: Dict[str, Any]) -> Optional[FrozenSet[str]]:
+    """Returns the file kinds relevant to an item, or None when every file is relevant."""
+    text = f"{item.get('section') or ''} {item.get('checklist_item') or ''}".lower()
+    if UNRESTRICTED_ITEM_PATTERN.search(text):
+        return None
+
+    kinds = set()
+    for pattern, rule_kinds in ITEM_ROUTING_RULES:
+        if pattern.search(text):
+            kinds.update(rule_kinds)
+    return frozenset(kinds) if kinds else None
+
+
+class CarChecklistRouter:
+    """Selects, per archive member, the checklist items worth asking about it."""
+
+    def __init__(self, checklist: Sequence[Dict[str, Any]]):
+        """Classifies every checklist item once.
+
+        Args:
+            checklist: Normalized checklist items still needing a verdict.
+        """
+        self.checklist = list(checklist)
+        self.item_kinds = [route_checklist_item(item) for item in self.checklist]
+
+    def checklist_for_file(self, filename: str, content: str) -> List[Dict[str, Any]]:
+        file_kinds = classify_archive_member(filename, content)
+        if not file_kinds:
+            return list(self.checklist)
+        return [
+            item
+            for item, kinds in zip(self.checklist, self.item_kinds)
+            if kinds is None or kinds & file_kinds
+        ]
+
+
+def build_routed_out_result(items: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Builds a chunk-style result resolving items no file was routed to as Not Seen."""
+    return {
+        "checklist": [
+            {
+                "section": str(item.get("section") or "General"),
+                "item": str(item.get("checklist_item") or ""),
+                "status": "Not Seen",
+                "comment": ROUTED_OUT_COMMENT,
+                "page_references": [],
+            }
+            for item in items
+        ],
+        "suggestions": [],
+    }
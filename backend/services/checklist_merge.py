@@ -0,0 +1,315 @@
+"""Merging of per-batch checklist results into one document-level checklist.
+
+Batch and chunk results are matched to checklist items through hash indexes
+on the normalized (section, item) pair and on the item text alone, so a
+merge is linear in the number of returned rows even when CAR analysis
+produces hundreds of chunk results.
+
+Run ``python -m services.checklist_merge`` for a micro-benchmark.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MergeKey = Tuple[str, str]
+
+_MERGE_TEXT_STRIP_PATTERN = re.compile(r'[^a-z0-9]')
+
+NO_RESULT_COMMENT = "No result was returned for this checklist item."
+NO_EVIDENCE_COMMENT = "No supporting evidence was found anywhere in the analyzed document."
+DEFAULT_PASS_COMMENT = "Supporting evidence was found in the analyzed document."
+CONFLICTING_FINDINGS_COMMENT = (
+    "Conflicting chunk-level findings were returned. Evidence was found in at least one chunk, "
+    "but other chunks raised concerns."
+)
+
+_COMMENT_ORDER_BY_STATUS = {
+    "pass": ("pass", "warning", "fail"),
+    "warning": ("warning", "fail", "pass"),
+    "fail": ("fail", "warning", "pass"),
+}
+_DEFAULT_COMMENT_ORDER = ("na", "pass", "warning", "fail")
+
+
+def normalize_review_status(raw_status: Any) -> str:
+    status = str(raw_status or "").strip().lower()
+    if not status:
+        return "not_seen"
+    if "not applicable" in status or status in {"n/a", "na"}:
+        return "na"
+    if "not seen" in status:
+        return "not_seen"
+    if "warning" in status:
+        return "warning"
+    if "fail" in status:
+        return "fail"
+    if "pass" in status:
+        return "pass"
+    return "not_seen"
+
+
+def format_review_status(normalized_status: str) -> str:
+    if normalized_status == "pass":
+        return "Pass"
+    if normalized_status == "warning":
+        return "Warning"
+    if normalized_status == "fail":
+        return "Fail"
+    if normalized_status == "na":
+        return "Not Applicable"
+    return "Not Seen"
+
+
+def normalize_merge_text(value: Any) -> str:
+    """Removes punctuation, whitespace and case so reworded sections still match."""
+    return _MERGE_TEXT_STRIP_PATTERN.sub('', str(value).lower())
+
+
+class ChecklistKeyIndex:
+    """Resolves returned rows to merge keys in O(1).
+
+    An exact (section, item) match wins; otherwise the row joins the first
+    key registered with the same item text, which covers the model renaming
+    a section.
+    """
+
+    __slots__ = ("_keys", "_first_key_by_item")
+
+    def __init__(self):
+        """Initializes an empty index."""
+        self._keys: set = set()
+        self._first_key_by_item: Dict[str, MergeKey] = {}
+
+    def __contains__(self, key: MergeKey) -> bool:
+        return key in self._keys
+
+    def resolve(self, section: Any, item_text: Any) -> MergeKey:
+        """Returns the existing key for a row, or the exact key it would be stored under."""
+        exact_key = (normalize_merge_text(section), normalize_merge_text(item_text))
+        if exact_key in self._keys:
+            return exact_key
+        return self._first_key_by_item.get(exact_key[1], exact_key)
+
+    def add(self, key: MergeKey) -> None:
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        self._first_key_by_item.setdefault(key[1], key)
+
+
+class _ItemMergeState:
+    """Statuses, de-duplicated comments and page references seen for one item."""
+
+    __slots__ = ("item", "statuses", "comments_by_status", "page_references")
+
+    def __init__(self, item: Dict[str, Any]):
+        self.item = item
+        self.statuses: set = set()
+        # Dicts double as insertion-ordered sets for O(1) comment de-duplication.
+        self.comments_by_status: Dict[str, Dict[str, None]] = {}
+        self.page_references: set = set()
+
+    def add(self, normalized_status: str, comment: Any, page_references: Any) -> None:
+        self.statuses.add(normalized_status)
+        comment_text = str(comment or "").strip()
+        if comment_text:
+            self.comments_by_status.setdefault(normalized_status, {})[comment_text] = None
+        if isinstance(page_references, list):
+            for reference in page_references:
+                try:
+                    self.page_references.add(int(reference))
+                except (ValueError, TypeError):
+                    pass
+
+
+def _finalize_document_status(statuses: set) -> str:
+    meaningful_statuses = statuses - {"not_seen", "na"}
+    if "pass" in meaningful_statuses:
+        if meaningful_statuses == {"pass"}:
+            return "pass"
+        return "warning"
+    if "warning" in meaningful_statuses:
+        return "warning"
+    if "fail" in meaningful_statuses:
+        return "fail"
+    if "na" in statuses:
+        return "na"
+    return "fail"
+
+
+def _build_merged_comment(final_status: str, comments_by_status: Dict[str, Dict[str, None]]) -> str:
+    combined_comments: Dict[str, None] = {}
+    for status_name in _COMMENT_ORDER_BY_STATUS.get(final_status, _DEFAULT_COMMENT_ORDER):
+        for comment in comments_by_status.get(status_name, ()):
+            combined_comments.setdefault(comment, None)
+
+    comment_lines = list(combined_comments)
+    if (
+        final_status == "warning"
+        and comments_by_status.get("pass")
+        and (comments_by_status.get("warning") or comments_by_status.get("fail"))
+    ):
+        comment_lines.insert(0, CONFLICTING_FINDINGS_COMMENT)
+
+    if comment_lines:
+        return "\n".join(comment_lines)
+    if final_status == "fail":
+        return NO_EVIDENCE_COMMENT
+    if final_status == "warning":
+        return "Evidence is partial or conflicting across the analyzed document."
+    if final_status == "na":
+        return "This item appears not applicable to the analyzed document."
+    return DEFAULT_PASS_COMMENT
+
+
+def _iter_result_rows(results: Iterable[Dict[str, Any]]):
+    for result in results:
+        for item in result.get("checklist", []):
+            section = str(item.get("section") or "General").strip()
+            item_text = str(item.get("item") or "").strip()
+            if item_text:
+                yield section, item_text, item
+
+
+def merge_chunk_results(
+    results: Iterable[Dict[str, Any]],
+    expected_entries: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Combines chunk verdicts for the same item into one document-level verdict.
+
+    Used for CAR analysis, where every chunk is reviewed against the full
+    checklist and an item passes only if no chunk raised a concern.
+
+    Args:
+        results: Parsed batch responses, each with a ``checklist`` list.
+        expected_entries: Checklist items that were asked for; items never
+            returned are reported as Fail.
+
+    Returns:
+        Merged checklist rows in first-seen order, expected items first.
+    """
+    index = ChecklistKeyIndex()
+    states: Dict[MergeKey, _ItemMergeState] = {}
+
+    def ensure_state(section: str, item_text: str, template: Optional[Dict[str, Any]] = None) -> _ItemMergeState:
+        key = index.resolve(section, item_text)
+        state = states.get(key)
+        if state is None:
+            base_item = dict(template) if template else {}
+            base_item["section"] = section
+            base_item["item"] = item_text
+            state = _ItemMergeState(base_item)
+            states[key] = state
+            index.add(key)
+        return state
+
+    for expected_item in expected_entries:
+        ensure_state(expected_item["section"], expected_item["item"])
+
+    for section, item_text, item in _iter_result_rows(results):
+        # This matches the expected item bucket even if the section was modified by the model.
+        ensure_state(section, item_text, item).add(
+            normalize_review_status(item.get("status")),
+            item.get("comment", ""),
+            item.get("page_references", []),
+        )
+
+    merged_items: List[Dict[str, Any]] = []
+    for state in states.values():
+        merged_item = state.item
+        if not state.statuses:
+            merged_item["status"] = "Fail"
+            merged_item["comment"] = NO_RESULT_COMMENT
+            merged_items.append(merged_item)
+            continue
+
+        final_status = _finalize_document_status(state.statuses)
+        merged_item["status"] = format_review_status(final_status)
+        merged_item["comment"] = _build_merged_comment(final_status, state.comments_by_status)
+        merged_item["page_references"] = sorted(state.page_references)
+        merged_items.append(merged_item)
+    return merged_items
+
+
+def merge_batch_results(
+    results: Iterable[Dict[str, Any]],
+    expected_entries: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Collects batch verdicts where each item is reviewed by one batch.
+
+    A later row for the same item replaces an earlier one. Expected items
+    that no batch returned are reported as Fail.
+    """
+    index = ChecklistKeyIndex()
+    items_by_key: Dict[MergeKey, Dict[str, Any]] = {}
+
+    for section, item_text, item in _iter_result_rows(results):
+        key = index.resolve(section, item_text)
+        normalized_status = normalize_review_status(item.get("status"))
+        item_copy = dict(item)
+        item_copy["section"] = section
+        item_copy["item"] = item_text
+
+        if normalized_status == "not_seen":
+            item_copy["status"] = "Fail"
+            item_copy["comment"] = str(item_copy.get("comment") or "").strip() or NO_EVIDENCE_COMMENT
+        else:
+            item_copy["status"] = format_review_status(normalized_status)
+
+        items_by_key[key] = item_copy
+        index.add(key)
+
+    for expected_item in expected_entries:
+        key = index.resolve(expected_item["section"], expected_item["item"])
+        if key not in index:
+            items_by_key[key] = {
+                "section": expected_item["section"],
+                "item": expected_item["item"],
+                "status": "Fail",
+                "comment": NO_RESULT_COMMENT,
+            }
+            index.add(key)
+
+    return list(items_by_key.values())
+
+
+def _run_benchmark(chunk_count: int = 300, item_count: int = 60, repeats: int = 3) -> None:
+    import random
+    import time
+
+    rng = random.Random(7)
+    statuses = ["Pass", "Warning", "Fail", "Not Seen", "N/A"]
+    expected = [
+        {"section": f"Section {index // 10}", "item": f"Checklist item {index}: confirm requirement {index} is documented."}
+        for index in range(item_count)
+    ]
+    results = []
+    for chunk_index in range(chunk_count):
+        rows = []
+        for entry in expected:
+            # Roughly one row in five comes back under a reworded section.
+            section = entry["section"] if rng.random() > 0.2 else f"{entry['section']} (Revised)"
+            rows.append({
+                "section": section,
+                "item": entry["item"],
+                "status": rng.choice(statuses),
+                "comment": f"Finding {rng.randint(0, 20)} for chunk {chunk_index % 5}.",
+                "page_references": [rng.randint(1, 300)],
+            })
+        results.append({"checklist": rows})
+
+    row_count = chunk_count * item_count
+    for label, merge in (("chunk", merge_chunk_results), ("batch", merge_batch_results)):
+        timings = []
+        for _ in range(repeats):
+            started_at = time.perf_counter()
+            merged = merge(results, expected)
+            timings.append(time.perf_counter() - started_at)
+        best = min(timings)
+        print(
+            f"{label:>5} merge: rows={row_count} items={len(merged)} "
+            f"best={best * 1000:.1f}ms per_row={best / row_count * 1e6:.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    _run_benchmark()
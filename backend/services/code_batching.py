@@ -0,0 +1,306 @@
+"""Batch planning for code review calls.
+
+Files are rendered with line numbers, measured in tokens and packed into as
+few calls as fit the budget, largest first (first-fit decreasing). A file
+too large for one call is split into parts at function or class boundaries
+(via ``ast`` for Python, declaration patterns otherwise), and every part
+keeps the file's original line numbers so suggestions still point at the
+right lines.
+"""
+import ast
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.env import safe_int_env
+
+# Top-level declarations in common languages; used when a file cannot be parsed as Python.
+DECLARATION_PATTERN = re.compile(
+    r'^(?:@\w'
+    r'|(?:export\s+(?:default\s+)?)?(?:async\s+)?(?:function|class|interface|enum|type)\b'
+    r'|(?:export\s+)?(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:\(|function\b)'
+    r'|(?:(?:public|private|protected|internal|static|abstract|final|sealed|partial)\s+)+[\w<>\[\],\s]*[({]?'
+    r'|(?:async\s+)?def\s|func\s|fn\s|impl\b|struct\s|module\s|package\s'
+    r'|CREATE\s|ALTER\s|PROCEDURE\s|FUNCTION\s'
+    r'|<(?![?!/])[\w:.-]+'
+    r')',
+    re.IGNORECASE,
+)
+# Members one indentation level deep (methods inside classes) are secondary boundaries.
+MEMBER_PATTERN = re.compile(r'^[ \t]{1,8}(?:@\w|(?:async\s+)?def\s|(?:(?:public|private|protected|static|async)\s+)+\w)')
+
+
+def get_code_batching_settings() -> Dict[str, int]:
+    return {
+        "max_batch_tokens": max(1000, safe_int_env("LLM_CODE_BATCH_MAX_TOKENS", 36000)),
+        "max_files_per_batch": max(1, safe_int_env("LLM_CODE_BATCH_MAX_FILES", 25)),
+        "concurrency": max(1, safe_int_env("LLM_CODE_REVIEW_CONCURRENCY", 3)),
+    }
+
+
+def render_numbered_lines(lines: List[str], first_line: int = 1) -> str:
+    return "\n".join(f"{first_line + offset} | {line}" for offset, line in enumerate(lines))
+
+
+def _python_boundaries(source: str) -> Optional[List[int]]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    boundaries = set()
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", None) or []
+        boundaries.add(min([node.lineno] + [decorator.lineno for decorator in decorators]))
+        if isinstance(node, ast.ClassDef):
+            for member in node.body:
+                if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    member_decorators = member.decorator_list or []
+                    boundaries.add(min([member.lineno] + [decorator.lineno for decorator in member_decorators]))
+    return sorted(boundaries)
+
+
+def find_split_boundaries(filename: str, lines: List[str]) -> List[int]:
+    """Returns 1-based line numbers where a new part of the file may start."""
+    if filename.lower().endswith((".py", ".pyw")):
+        boundaries = _python_boundaries("\n".join(lines))
+        if boundaries is not None:
+            return boundaries
+
+    boundaries = []
+    previous_blank = True
+    for line_number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if DECLARATION_PATTERN.match(line) or (previous_blank and MEMBER_PATTERN.match(line)):
+            boundaries.append(line_number)
+        elif previous_blank and stripped and not line[:1].isspace():
+            # Any unindented line after a blank line starts a new top-level block.
+            boundaries.append(line_number)
+        previous_blank = not stripped
+    return boundaries
+
+
+# (start_line, end_line, character range of a single over-long line or None)
+LineRange = Tuple[int, int, Optional[Tuple[int, int]]]
+
+
+def _split_long_line(line: str, line_number: int, max_tokens: int, token_counter: Callable[[str], int]) -> List[LineRange]:
+    """Cuts one line that alone exceeds ``max_tokens`` (minified or generated code) into character windows."""
+    pieces: List[LineRange] = []
+    position = 0
+    while position < len(line):
+        remaining = line[position:]
+        remaining_tokens = max(1, token_counter(remaining))
+        window = max(1, len(remaining) * max_tokens // remaining_tokens)
+        while window > 1 and token_counter(render_numbered_lines([remaining[:window]], line_number)) > max_tokens:
+            window = max(1, window * 3 // 4)
+        pieces.append((line_number, line_number, (position, position + len(remaining[:window]))))
+        position += window
+    return pieces
+
+
+def _split_lines(
+    filename: str,
+    lines: List[str],
+    max_tokens: int,
+    token_counter: Callable[[str], int],
+) -> List[LineRange]:
+    """Splits a file into line ranges that each fit ``max_tokens``."""
+    boundaries = sorted(set([1] + [line for line in find_split_boundaries(filename, lines) if 1 <= line <= len(lines)]))
+    units = [
+        (start, (boundaries[index + 1] - 1) if index + 1 < len(boundaries) else len(lines))
+        for index, start in enumerate(boundaries)
+    ]
+
+    # Units that are still too large (one huge function) are cut on cumulative line tokens;
+    # a single line over the budget is cut into character windows.
+    fitted_units: List[Tuple[int, int, int, Optional[Tuple[int, int]]]] = []
+    for start, end in units:
+        unit_tokens = token_counter(render_numbered_lines(lines[start - 1:end], start))
+        if unit_tokens <= max_tokens:
+            fitted_units.append((start, end, unit_tokens, None))
+            continue
+        piece_start, piece_tokens = None, 0
+        for line_number in range(start, end + 1):
+            line_tokens = token_counter(render_numbered_lines([lines[line_number - 1]], line_number))
+            if piece_start is not None and piece_tokens + line_tokens > max_tokens:
+                fitted_units.append((piece_start, line_number - 1, piece_tokens, None))
+                piece_start, piece_tokens = None, 0
+            if line_tokens > max_tokens:
+                for window in _split_long_line(lines[line_number - 1], line_number, max_tokens, token_counter):
+                    fitted_units.append((window[0], window[1], max_tokens, window[2]))
+                continue
+            if piece_start is None:
+                piece_start = line_number
+            piece_tokens += line_tokens
+        if piece_start is not None:
+            fitted_units.append((piece_start, end, piece_tokens, None))
+
+    ranges: List[LineRange] = []
+    current_start, current_end, current_tokens = None, None, 0
+    for start, end, unit_tokens, characters in fitted_units:
+        if current_start is not None and (characters is not None or current_tokens + unit_tokens > max_tokens):
+            ranges.append((current_start, current_end, None))
+            current_start, current_tokens = None, 0
+        if characters is not None:
+            ranges.append((start, end, characters))
+            continue
+        if current_start is None:
+            current_start = start
+        current_end = end
+        current_tokens += unit_tokens
+    if current_start is not None:
+        ranges.append((current_start, current_end, None))
+    return ranges
+
+
+def _render_segment(
+    filename: str,
+    lines: List[str],
+    start: int,
+    end: int,
+    part: int,
+    parts: int,
+    characters: Optional[Tuple[int, int]] = None,
+) -> str:
+    if parts == 1:
+        label = filename
+    elif characters is not None:
+        label = f"{filename} (part {part}/{parts}, lines {start}-{end}, characters {characters[0] + 1}-{characters[1]})"
+    else:
+        label = f"{filename} (part {part}/{parts}, lines {start}-{end})"
+    body_lines = lines[start - 1:end] if characters is None else [lines[start - 1][characters[0]:characters[1]]]
+    return (
+        f"=== BEGIN FILE: {label} ===\n"
+        f"{render_numbered_lines(body_lines, start)}\n"
+        f"=== END FILE: {label} ===\n\n"
+    )
+
+
+def build_file_segments(
+    files: List[Dict[str, Any]],
+    token_counter: Callable[[str], int],
+    max_batch_tokens: int,
+    prefixes: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, Any]]:
+    """Renders whole files as segments, splitting any file larger than ``max_batch_tokens``.
+
+    ``prefixes`` (per filename, e.g. a static analysis summary) are placed
+    ahead of a file's first segment and counted against the budget; a split
+    file's prefix is dropped if it would take more than half of it.
+
+    Returns:
+        Segments with ``filename``, ``text`` (the rendered block), ``tokens``,
+        ``part``, ``parts``, ``start_line`` and ``end_line``.
+    """
+    segments: List[Dict[str, Any]] = []
+    for file_info in files:
+        filename = str(file_info.get("filename") or "")
+        lines = str(file_info.get("content") or "").split("\n")
+        prefix = (prefixes or {}).get(filename, "")
+        whole_text = prefix + _render_segment(filename, lines, 1, len(lines), 1, 1)
+        whole_tokens = token_counter(whole_text)
+        if whole_tokens <= max_batch_tokens:
+            segments.append({
+                "filename": filename,
+                "text": whole_text,
+                "tokens": whole_tokens,
+                "part": 1,
+                "parts": 1,
+                "start_line": 1,
+                "end_line": len(lines),
+            })
+            continue
+
+        # Leave room for the part header and footer, and for the prefix on the first part.
+        prefix_tokens = token_counter(prefix) if prefix else 0
+        if prefix_tokens > max_batch_tokens // 2:
+            # A prefix that crowds out the code itself is dropped rather than shrinking every part.
+            prefix, prefix_tokens = "", 0
+        ranges = _split_lines(filename, lines, max(1, max_batch_tokens - 64 - prefix_tokens), token_counter)
+        for part, (start, end, characters) in enumerate(ranges, start=1):
+            text = (prefix if part == 1 else "") + _render_segment(filename, lines, start, end, part, len(ranges), characters)
+            segments.append({
+                "filename": filename,
+                "text": text,
+                "tokens": token_counter(text),
+                "part": part,
+                "parts": len(ranges),
+                "start_line": start,
+                "end_line": end,
+            })
+    return segments
+
+
+def pack_segments(
+    segments: List[Dict[str, Any]],
+    max_batch_tokens: int,
+    max_files_per_batch: int,
+) -> List[List[Dict[str, Any]]]:
+    """Packs segments carrying a ``tokens`` count into batches, first-fit decreasing."""
+    # The largest segments claim bins first, small ones fill the gaps.
+    batches: List[List[Dict[str, Any]]] = []
+    batch_tokens: List[int] = []
+    for segment in sorted(segments, key=lambda item: -item["tokens"]):
+        for index, used in enumerate(batch_tokens):
+            if used + segment["tokens"] <= max_batch_tokens and len(batches[index]) < max_files_per_batch:
+                batches[index].append(segment)
+                batch_tokens[index] += segment["tokens"]
+                break
+        else:
+            batches.append([segment])
+            batch_tokens.append(segment["tokens"])
+    return batches
+
+
+def plan_code_batches(
+    files: List[Dict[str, Any]],
+    token_counter: Callable[[str], int],
+    max_batch_tokens: int,
+    max_files_per_batch: int,
+) -> List[List[Dict[str, Any]]]:
+    """Packs file segments into batches.
+
+    Args:
+        files: Files as ``{"filename": ..., "content": ...}`` dicts.
+        token_counter: Token counting function for rendered segments.
+        max_batch_tokens: Token budget for the file content of one call.
+        max_files_per_batch: Maximum number of segments in one call.
+
+    Returns:
+        Batches of segments as produced by ``build_file_segments``.
+    """
+    segments = build_file_segments(files, token_counter, max_batch_tokens)
+    return pack_segments(segments, max_batch_tokens, max_files_per_batch)
+
+
+def merge_file_part_reviews(reviews: List[Dict[str, Any]], filenames: List[str]) -> List[Dict[str, Any]]:
+    """Combines per-part reviews of split files and restores the submitted file order.
+
+    Parts of one file are reported under the file's own name; their scores
+    are averaged and highlights and suggestions concatenated without repeats.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    score_parts: Dict[str, List[int]] = {}
+    for review in reviews:
+        if not isinstance(review, dict):
+            continue
+        filename = str(review.get("filename") or "")
+        # Models sometimes echo the part label; map it back to the file name.
+        filename = re.sub(r'\s+\(part \d+/\d+, lines \d+-\d+(?:, characters \d+-\d+)?\)$', '', filename)
+        entry = merged.setdefault(filename, {"filename": filename, "score": 0, "highlights": [], "suggestions": []})
+        try:
+            score_parts.setdefault(filename, []).append(int(review.get("score", 0)))
+        except (TypeError, ValueError):
+            score_parts.setdefault(filename, []).append(0)
+        for key in ("highlights", "suggestions"):
+            for value in review.get(key) or []:
+                if value not in entry[key]:
+                    entry[key].append(value)
+        for key, value in review.items():
+            if key not in entry:
+                entry[key] = value
+
+    for filename, scores in score_parts.items():
+        merged[filename]["score"] = int(sum(scores) / len(scores))
+
+    order = {filename: index for index, filename in enumerate(filenames)}
+    return sorted(merged.values(), key=lambda review: order.get(review["filename"], len(order)))
@@ -0,0 +1,184 @@
+"""Changed-region extraction for diff-based code review.
+
+A pull-request review only needs the lines that changed. Changes come either
+from a unified diff or from comparing base and head file sets; either way
+they become, per head file, the set of changed head line numbers. Those are
+widened by a few lines of context, merged into regions, and rendered with
+head line numbers so the model's "Line N" suggestions point into the head
+file directly.
+"""
+import difflib
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.env import safe_int_env
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+LINE_REFERENCE_PATTERN = re.compile(r'^\s*Lines?\s+(\d+)(?:\s*[-–]\s*(\d+))?', re.IGNORECASE)
+
+
+def get_diff_context_lines() -> int:
+    return max(0, safe_int_env("LLM_CODE_DIFF_CONTEXT_LINES", 5))
+
+
+def _strip_diff_path(path: str) -> str:
+    path = path.strip().split("\t")[0]
+    if path == "/dev/null":
+        return ""
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+def parse_unified_diff(diff_text: str) -> List[Dict[str, Any]]:
+    """Parses a unified (git-style) diff.
+
+    Returns:
+        One entry per file with ``filename`` (head path, "" when deleted),
+        ``old_filename``, ``changed_lines`` (head line numbers added or next
+        to a deletion) and ``known_lines`` (head line number to text for every
+        line the diff shows).
+    """
+    files: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    new_line = 0
+    old_remaining = new_remaining = 0
+
+    for raw_line in (diff_text or "").splitlines():
+        in_hunk = old_remaining > 0 or new_remaining > 0
+        if in_hunk and current is not None:
+            if raw_line.startswith("+"):
+                current["known_lines"][new_line] = raw_line[1:]
+                current["changed_lines"].add(new_line)
+                new_line += 1
+                new_remaining -= 1
+            elif raw_line.startswith("-"):
+                # A deletion has no head line; flag the line now standing in its place.
+                current["changed_lines"].add(max(1, new_line))
+                old_remaining -= 1
+            elif raw_line.startswith("\\"):
+                pass
+            else:
+                # Context line; some tools strip the leading space from blank ones.
+                current["known_lines"][new_line] = raw_line[1:]
+                new_line += 1
+                old_remaining -= 1
+                new_remaining -= 1
+            continue
+
+        if raw_line.startswith("diff --git "):
+            current = None
+        elif raw_line.startswith("--- "):
+            current = {"filename": "", "old_filename": _strip_diff_path(raw_line[4:]), "changed_lines": set(), "known_lines": {}}
+            files.append(current)
+        elif raw_line.startswith("+++ ") and current is not None:
+            current["filename"] = _strip_diff_path(raw_line[4:])
+        elif current is not None:
+            header = HUNK_HEADER_PATTERN.match(raw_line)
+            if header:
+                new_line = int(header.group(3))
+                old_remaining = int(header.group(2)) if header.group(2) is not None else 1
+                new_remaining = int(header.group(4)) if header.group(4) is not None else 1
+
+    return [file_diff for file_diff in files if file_diff["filename"]]
+
+
+def diff_file_sets(base_files: List[Dict[str, str]], head_files: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Compares base and head file sets; unchanged head files are left out."""
+    base_by_name = {file_info["filename"]: file_info.get("content") or "" for file_info in base_files}
+    changes: List[Dict[str, Any]] = []
+    for head_file in head_files:
+        head_lines = (head_file.get("content") or "").split("\n")
+        base_content = base_by_name.get(head_file["filename"])
+        changed: Set[int] = set()
+        if base_content is None:
+            changed.update(range(1, len(head_lines) + 1))
+        else:
+            matcher = difflib.SequenceMatcher(None, base_content.split("\n"), head_lines, autojunk=False)
+            for tag, _, _, head_start, head_end in matcher.get_opcodes():
+                if tag in ("replace", "insert"):
+                    changed.update(range(head_start + 1, head_end + 1))
+                elif tag == "delete":
+                    changed.add(min(len(head_lines), head_start + 1))
+        if changed:
+            changes.append({
+                "filename": head_file["filename"],
+                "old_filename": head_file["filename"] if base_content is not None else "",
+                "changed_lines": changed,
+                "known_lines": {number: line for number, line in enumerate(head_lines, start=1)},
+            })
+    return changes
+
+
+def build_review_regions(changed_lines: Set[int], context_lines: int, line_count: int) -> List[Tuple[int, int]]:
+    """Widens changed lines by ``context_lines`` and merges overlapping or adjacent ranges."""
+    regions: List[Tuple[int, int]] = []
+    for line_number in sorted(changed_lines):
+        start = max(1, line_number - context_lines)
+        end = min(line_count, line_number + context_lines) if line_count else line_number + context_lines
+        if regions and start <= regions[-1][1] + 1:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def render_change_regions(
+    filename: str,
+    known_lines: Dict[int, str],
+    changed_lines: Set[int],
+    regions: List[Tuple[int, int]],
+) -> str:
+    """Renders regions with head line numbers, marking changed lines with ``+``."""
+    blocks = []
+    for start, end in regions:
+        rendered = [
+            f"{line_number} {'+' if line_number in changed_lines else ' '}| {known_lines[line_number]}"
+            for line_number in range(start, end + 1)
+            if line_number in known_lines
+        ]
+        if rendered:
+            blocks.append(f"--- lines {start}-{end} ---\n" + "\n".join(rendered))
+    body = "\n".join(blocks)
+    return f"=== BEGIN FILE: {filename} ===\n{body}\n=== END FILE: {filename} ===\n\n"
+
+
+def build_change_segments(
+    changes: List[Dict[str, Any]],
+    head_files: Optional[List[Dict[str, str]]],
+    context_lines: int,
+) -> List[Dict[str, Any]]:
+    """Turns per-file changes into review segments.
+
+    When head file contents are available they supply the context lines;
+    otherwise only the lines the diff itself shows can be rendered.
+    """
+    head_by_name = {file_info["filename"]: file_info.get("content") or "" for file_info in head_files or []}
+    segments: List[Dict[str, Any]] = []
+    for change in changes:
+        known_lines = dict(change["known_lines"])
+        head_content = head_by_name.get(change["filename"])
+        if head_content is not None:
+            known_lines = {number: line for number, line in enumerate(head_content.split("\n"), start=1)}
+        line_count = max(known_lines) if known_lines else 0
+        changed_lines = {line for line in change["changed_lines"] if not line_count or line <= line_count}
+        if not changed_lines:
+            continue
+        regions = build_review_regions(changed_lines, context_lines, line_count)
+        segments.append({
+            "filename": change["filename"],
+            "text": render_change_regions(change["filename"], known_lines, changed_lines, regions),
+            "part": 1,
+            "parts": 1,
+            "regions": regions,
+            "changed_line_count": len(changed_lines),
+        })
+    return segments
+
+
+def suggestion_in_regions(suggestion: str, regions: List[Tuple[int, int]]) -> bool:
+    """True for ``Global:`` suggestions and line references that fall inside a reviewed region."""
+    match = LINE_REFERENCE_PATTERN.match(str(suggestion or ""))
+    if not match:
+        return True
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    return any(first <= end and start <= last for start, end in regions)
@@ -0,0 +1,212 @@
+"""Line-range edit scripts for auto-fix.
+
+Regenerating a whole file to change three lines costs output tokens in
+proportion to the file, and output is the slowest part of a call. In patch
+mode the model returns only line-range replacements against the numbered
+original, each with the original text it replaces; they are applied here
+deterministically. An edit script that does not apply cleanly is rejected
+as a whole so the caller can fall back to a full-file rewrite.
+
+When every selected suggestion names its lines, the model is shown only
+the enclosing functions or classes of those lines instead of the whole file.
+"""
+import ast
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.code_batching import find_split_boundaries
+from services.code_diff import LINE_REFERENCE_PATTERN
+from utils.env import safe_int_env
+
+# How far an edit may have drifted from its stated line numbers and still be relocated by its original text.
+EDIT_RELOCATION_WINDOW = 3
+
+
+def get_auto_fix_concurrency() -> int:
+    return max(1, safe_int_env("LLM_AUTO_FIX_CONCURRENCY", 4))
+
+
+def get_auto_fix_output_mode() -> str:
+    mode = os.getenv("LLM_AUTO_FIX_OUTPUT_MODE", "patch").strip().lower()
+    return mode if mode in ("patch", "full") else "patch"
+
+
+def _text_lines(text: str) -> List[str]:
+    # A trailing newline ends the last line rather than adding an empty one.
+    if text.endswith("\n"):
+        text = text[:-1]
+    return text.split("\n") if text else []
+
+
+def _same_lines(expected: List[str], actual: List[str]) -> bool:
+    return [line.rstrip() for line in expected] == [line.rstrip() for line in actual]
+
+
+def _locate_edit(lines: List[str], start: int, end: int, original: Optional[List[str]]) -> Optional[Tuple[int, int]]:
+    """Returns the 1-based range the edit really targets, or None when its original text is not found."""
+    if original is None:
+        return (start, end) if 1 <= start <= end + 1 and end <= len(lines) else None
+    length = len(original)
+    for offset in [0] + [step * sign for step in range(1, EDIT_RELOCATION_WINDOW + 1) for sign in (-1, 1)]:
+        candidate = start + offset
+        if candidate < 1 or candidate + length - 1 > len(lines):
+            continue
+        if _same_lines(original, [line.rstrip("\r") for line in lines[candidate - 1:candidate - 1 + length]]):
+            return candidate, candidate + length - 1
+    return None
+
+
+def apply_line_edits(content: str, edits: Any) -> Tuple[Optional[str], str]:
+    """Applies ``{"start_line", "end_line", "original", "replacement"}`` edits to ``content``.
+
+    ``end_line = start_line - 1`` inserts before ``start_line``; an empty
+    ``replacement`` deletes the range.
+
+    Returns:
+        ``(new_content, "")`` on success, ``(None, reason)`` when there are no
+        edits or any edit is malformed, overlaps another or does not match the
+        original text.
+    """
+    if not isinstance(edits, list):
+        return None, "edits is not a list"
+    if not edits:
+        return None, "edit script is empty"
+    lines = content.split("\n")
+    line_ending = "\r" if content.count("\r\n") > content.count("\n") / 2 else ""
+
+    located: List[Tuple[int, int, List[str]]] = []
+    for index, edit in enumerate(edits, start=1):
+        if not isinstance(edit, dict):
+            return None, f"edit {index} is not an object"
+        try:
+            start = int(edit.get("start_line"))
+            end = int(edit.get("end_line", start))
+        except (TypeError, ValueError):
+            return None, f"edit {index} has no valid line range"
+        original = edit.get("original")
+        original_lines = _text_lines(original) if isinstance(original, str) else None
+        if original_lines is not None and not original_lines and end >= start:
+            # An empty "original" for a non-empty range says nothing; rely on the line numbers.
+            original_lines = None
+        target = _locate_edit(lines, start, end, original_lines)
+        if target is None:
+            return None, f"edit {index} (lines {start}-{end}) does not match the original content"
+        replacement = edit.get("replacement")
+        if not isinstance(replacement, str):
+            return None, f"edit {index} has no replacement text"
+        located.append((target[0], target[1], _text_lines(replacement)))
+
+    located.sort(key=lambda item: (item[0], item[1]))
+    for previous, current in zip(located, located[1:]):
+        if current[0] <= previous[1]:
+            return None, f"edits at lines {previous[0]}-{previous[1]} and {current[0]}-{current[1]} overlap"
+
+    # (text, takes_line_ending): replacement lines and the file's last line carry no "\r" of their own and
+    # get one only if another line follows them, so a file without a trailing newline keeps ending that way.
+    entries: List[Tuple[str, bool]] = [(line, False) for line in lines[:-1]] + [(lines[-1], True)]
+    # Bottom-up, so earlier line numbers stay valid while later ranges change length.
+    for start, end, replacement_lines in reversed(located):
+        entries[start - 1:end] = [(line, True) for line in replacement_lines]
+    last_index = len(entries) - 1
+    new_lines = [
+        text + line_ending if takes_line_ending and index < last_index and not text.endswith("\r") else text
+        for index, (text, takes_line_ending) in enumerate(entries)
+    ]
+    if new_lines and not lines[-1].endswith("\r") and new_lines[-1].endswith("\r"):
+        # Deleting the last line must not leave a bare "\r" behind.
+        new_lines[-1] = new_lines[-1][:-1]
+    return "\n".join(new_lines), ""
+
+
+def get_auto_fix_region_settings() -> Dict[str, Any]:
+    scope = os.getenv("LLM_AUTO_FIX_INPUT_SCOPE", "region").strip().lower()
+    return {
+        "scope": scope if scope in ("region", "file") else "region",
+        "padding_lines": max(0, safe_int_env("LLM_AUTO_FIX_REGION_PADDING", 3)),
+        "min_file_lines": max(1, safe_int_env("LLM_AUTO_FIX_REGION_MIN_FILE_LINES", 80)),
+        # Regions covering more than this share of the file are not worth the splicing.
+        "max_region_ratio": 0.6,
+    }
+
+
+def parse_suggestion_ranges(suggestions: List[str]) -> Optional[List[Tuple[int, int]]]:
+    """Line ranges referenced by ``Line N:`` / ``Lines A-B:`` suggestions.
+
+    Returns None when any suggestion is ``Global:`` or has no line reference,
+    since those need the whole file.
+    """
+    ranges: List[Tuple[int, int]] = []
+    for suggestion in suggestions:
+        match = LINE_REFERENCE_PATTERN.match(str(suggestion or ""))
+        if not match:
+            return None
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        ranges.append((min(first, last), max(first, last)))
+    return ranges or None
+
+
+def _enclosing_python_block(tree: ast.AST, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """Innermost function or class (decorators included) that contains lines ``start``-``end``."""
+    best: Optional[Tuple[int, int]] = None
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        node_start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        node_end = node.end_lineno or node.lineno
+        if node_start <= start and end <= node_end and (best is None or node_end - node_start < best[1] - best[0]):
+            best = (node_start, node_end)
+    return best
+
+
+def build_fix_regions(
+    filename: str,
+    content: str,
+    ranges: List[Tuple[int, int]],
+    padding_lines: int,
+) -> List[Tuple[int, int]]:
+    """Widens suggestion ranges to their enclosing function or class, pads and merges them."""
+    lines = content.split("\n")
+    line_count = len(lines)
+    tree = None
+    if filename.lower().endswith((".py", ".pyw")):
+        try:
+            tree = ast.parse(content)
+        except (SyntaxError, ValueError):
+            tree = None
+    boundaries = None if tree is not None else sorted(set([1] + find_split_boundaries(filename, lines)))
+
+    widened: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        start, end = max(1, min(start, line_count)), max(1, min(end, line_count))
+        if tree is not None:
+            block = _enclosing_python_block(tree, start, end) or (start, end)
+        else:
+            block_start = max(boundary for boundary in boundaries if boundary <= start)
+            following = [boundary for boundary in boundaries if boundary > end]
+            block = (block_start, (following[0] - 1) if following else line_count)
+        widened.append((max(1, block[0] - padding_lines), min(line_count, block[1] + padding_lines)))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(widened):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def edits_within_regions(edits: Any, regions: List[Tuple[int, int]]) -> bool:
+    """True when every edit stays inside one of the regions the model was shown."""
+    if not isinstance(edits, list):
+        return False
+    for edit in edits:
+        try:
+            start = int(edit.get("start_line"))
+            end = int(edit.get("end_line", start))
+        except (AttributeError, TypeError, ValueError):
+            return False
+        # An insertion (end = start - 1) may sit right after a region's last line.
+        if not any(region_start <= start and max(end, start - 1) <= region_end for region_start, region_end in regions):
+            return False
+    return True
@@ -0,0 +1,62 @@
+"""Key derivation for the per-file code review cache.
+
+A file's review is reusable when the same content, with the same file
+extension, is reviewed by the same model with the same code review prompt.
+Resubmitting a large review after editing a few files then only sends the
+edited files to the model.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, List
+
+CODE_REVIEW_CACHE_VERSION = "code_review_v1"
+
+
+def _sha256_text(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _canonical_json(value: object) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+
+
+def build_code_content_hash(content: str) -> str:
+    return _sha256_text(content or "")
+
+
+def build_code_review_cache_key(
+    content_hash: str,
+    filename: str,
+    provider: str,
+    model_name: str,
+    deterministic_profile: Dict[str, Any],
+    prompt_version: str,
+) -> str:
+    """Hashes everything a single file's review depends on."""
+    return _sha256_text(_canonical_json({
+        "cache_version": CODE_REVIEW_CACHE_VERSION,
+        "content_hash": content_hash,
+        "extension": os.path.splitext(str(filename or "").lower())[1],
+        "provider": provider,
+        "model_name": model_name,
+        "deterministic_profile": deterministic_profile,
+        "prompt_version": prompt_version,
+    }))
+
+
+def is_cacheable_file_review(review: Any) -> bool:
+    """Rejects error rows and reviews the model did not score."""
+    if not isinstance(review, dict) or review.get("error"):
+        return False
+    if not str(review.get("filename") or "").strip() or str(review.get("filename")) == "System Error":
+        return False
+    return isinstance(review.get("score"), (int, float)) and not isinstance(review.get("score"), bool)
+
+
+def compute_overall_score(file_reviews: List[Dict[str, Any]]) -> int:
+    """Integer average of the file scores, as the engine computes it."""
+    file_scores = [review.get("score", 0) for review in file_reviews]
+    if not file_scores:
+        return 0
+    return int(sum(file_scores) / len(file_scores))
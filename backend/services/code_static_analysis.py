@@ -0,0 +1,397 @@
+"""Local static pre-analysis for code review.
+
+Much of a review is mechanical: how long each function is, what a file
+declares, which blocks are copy-pasted, unused imports, bare ``except``
+clauses. Those facts are computed here (``ast`` for Python, a lightweight
+tokenizer for JS/TS, ``xml.etree`` for XML) and handed to the model as a
+compact summary so it can spend its answer on what static analysis cannot
+decide. The mechanical findings are merged into the review locally.
+"""
+import ast
+import hashlib
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.env import safe_int_env
+
+JS_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx")
+XML_EXTENSIONS = (".xml", ".xsd", ".xsl", ".xslt", ".wsdl", ".bpel", ".composite", ".pom")
+PYTHON_EXTENSIONS = (".py", ".pyw")
+
+DUPLICATE_WINDOW_LINES = 6
+MAX_OUTLINE_ENTRIES = 40
+MAX_FINDINGS_PER_FILE = 30
+
+# Strings, template literals and comments, so declarations and braces inside them are not counted.
+JS_NOISE_PATTERN = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    re.DOTALL,
+)
+JS_DECLARATION_PATTERN = re.compile(
+    r'^\s*(?:export\s+(?:default\s+)?)?(?:(?:async\s+)?function\s*\*?\s*(?P<function>\w+)'
+    r'|(?:abstract\s+)?class\s+(?P<class>\w+)'
+    r'|(?:const|let|var)\s+(?P<arrow>\w+)\s*(?::[^=]+)?=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|\w+\s*=>)'
+    r'|interface\s+(?P<interface>\w+))'
+)
+JS_METHOD_PATTERN = re.compile(
+    r'^\s+(?:(?:public|private|protected|static|async|readonly|get|set)\s+)*(?P<method>\w+)\s*\([^;]*\)\s*(?::[^{]+)?\{\s*$'
+)
+JS_CONTROL_WORDS = {"if", "for", "while", "switch", "catch", "function", "return"}
+
+
+def get_static_analysis_settings() -> Dict[str, Any]:
+    mode = os.getenv("LLM_CODE_STATIC_ANALYSIS", "on").strip().lower()
+    return {
+        "mode": mode if mode in ("on", "off") else "on",
+        "long_function_lines": max(10, safe_int_env("LLM_CODE_LONG_FUNCTION_LINES", 60)),
+        "max_parameters": max(2, safe_int_env("LLM_CODE_MAX_PARAMETERS", 6)),
+    }
+
+
+def _language(filename: str) -> str:
+    lowered = filename.lower()
+    if lowered.endswith(PYTHON_EXTENSIONS):
+        return "python"
+    if lowered.endswith(JS_EXTENSIONS):
+        return "typescript" if lowered.endswith((".ts", ".tsx")) else "javascript"
+    if lowered.endswith(XML_EXTENSIONS):
+        return "xml"
+    return "other"
+
+
+def _blank_noise(match: "re.Match[str]") -> str:
+    # Keep newlines so line numbers survive.
+    return re.sub(r'[^\n]', ' ', match.group(0))
+
+
+def _line_metrics(lines: List[str], comment_prefixes: Tuple[str, ...]) -> Dict[str, int]:
+    blank = sum(1 for line in lines if not line.strip())
+    comments = sum(1 for line in lines if comment_prefixes and line.strip().startswith(comment_prefixes))
+    return {
+        "lines": len(lines),
+        "code_lines": len(lines) - blank - comments,
+        "comment_lines": comments,
+        "long_lines": sum(1 for line in lines if len(line) > 120),
+    }
+
+
+def _python_analysis(source: str, lines: List[str], settings: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = _line_metrics(lines, ("#",))
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        line_number = getattr(e, "lineno", None) or 1
+        return {"metrics": metrics, "outline": [], "findings": [f"Line {line_number}: Syntax error: {getattr(e, 'msg', str(e))}"]}
+
+    outline: List[str] = []
+    findings: List[str] = []
+    function_count = 0
+    class_count = 0
+
+    def visit(node: ast.AST, prefix: str) -> None:
+        nonlocal function_count, class_count
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function_count += 1
+                length = (child.end_lineno or child.lineno) - child.lineno + 1
+                parameters = [arg.arg for arg in child.args.posonlyargs + child.args.args + child.args.kwonlyargs]
+                outline.append(f"L{child.lineno}-{child.end_lineno} def {prefix}{child.name}({', '.join(parameters)})")
+                if length > settings["long_function_lines"]:
+                    findings.append(
+                        f"Lines {child.lineno}-{child.end_lineno}: Function '{child.name}' is {length} lines long; consider splitting it."
+                    )
+                counted = [name for name in parameters if name not in ("self", "cls")]
+                if len(counted) > settings["max_parameters"]:
+                    findings.append(
+                        f"Line {child.lineno}: Function '{child.name}' takes {len(counted)} parameters; consider grouping them."
+                    )
+                for default in child.args.defaults + [d for d in child.args.kw_defaults if d is not None]:
+                    if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                        findings.append(
+                            f"Line {default.lineno}: Mutable default argument in '{child.name}'; use None and create it inside the function."
+                        )
+                visit(child, f"{prefix}{child.name}.")
+            elif isinstance(child, ast.ClassDef):
+                class_count += 1
+                outline.append(f"L{child.lineno}-{child.end_lineno} class {prefix}{child.name}")
+                visit(child, f"{prefix}{child.name}.")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+
+    imported: Dict[str, int] = {}
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imported[(alias.asname or alias.name).split(".")[0]] = node.lineno
+        elif isinstance(node, ast.ImportFrom) and node.module != "__future__":
+            for alias in node.names:
+                if alias.name != "*":
+                    imported[alias.asname or alias.name] = node.lineno
+    used_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    exported: set = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                exported.update(elt.value for elt in node.value.elts if isinstance(elt, ast.Constant))
+    for name, line_number in sorted(imported.items(), key=lambda item: item[1]):
+        # String annotations and re-exports can still use a name; only flag names never mentioned again.
+        if name not in used_names and name not in exported and source.count(name) <= 1:
+            findings.append(f"Line {line_number}: Unused import '{name}'.")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler) and node.type is None:
+            findings.append(f"Line {node.lineno}: Bare 'except:' also catches SystemExit and KeyboardInterrupt; catch a specific exception.")
+        elif isinstance(node, ast.Compare) and any(isinstance(op, (ast.Eq, ast.NotEq)) for op in node.ops):
+            if any(isinstance(value, ast.Constant) and value.value is None for value in node.comparators):
+                findings.append(f"Line {node.lineno}: Compare with None using 'is' / 'is not'.")
+
+    metrics.update({"functions": function_count, "classes": class_count})
+    return {"metrics": metrics, "outline": outline, "findings": findings}
+
+
+def _matching_brace_line(code: str, open_index: int) -> Optional[int]:
+    depth = 0
+    for index in range(open_index, len(code)):
+        if code[index] == "{":
+            depth += 1
+        elif code[index] == "}":
+            depth -= 1
+            if depth == 0:
+                return code.count("\n", 0, index) + 1
+    return None
+
+
+def _js_analysis(source: str, lines: List[str], settings: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = _line_metrics(lines, ("//", "/*", "*"))
+    code = JS_NOISE_PATTERN.sub(_blank_noise, source)
+    code_lines = code.split("\n")
+    line_offsets = [0]
+    for line in code_lines:
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    outline: List[str] = []
+    findings: List[str] = []
+    function_count = 0
+    class_count = 0
+    for line_number, line in enumerate(code_lines, start=1):
+        declaration = JS_DECLARATION_PATTERN.match(line)
+        method = None if declaration else JS_METHOD_PATTERN.match(line)
+        if method and method.group("method") in JS_CONTROL_WORDS:
+            method = None
+        if not declaration and not method:
+            continue
+        kind = "method" if method else next(key for key, value in declaration.groupdict().items() if value)
+        name = method.group("method") if method else declaration.group(kind)
+        brace_index = code.find("{", line_offsets[line_number - 1])
+        end_line = _matching_brace_line(code, brace_index) if brace_index != -1 else None
+        if end_line is None or brace_index >= line_offsets[min(len(code_lines), line_number + 2)]:
+            end_line = line_number
+        if kind in ("class", "interface"):
+            class_count += 1
+            outline.append(f"L{line_number}-{end_line} {kind} {name}")
+            continue
+        function_count += 1
+        outline.append(f"L{line_number}-{end_line} function {name}")
+        length = end_line - line_number + 1
+        if length > settings["long_function_lines"]:
+            findings.append(f"Lines {line_number}-{end_line}: Function '{name}' is {length} lines long; consider splitting it.")
+
+    for line_number, line in enumerate(code_lines, start=1):
+        if re.search(r'(?<![=!<>])==(?!=)|!=(?!=)', line):
+            findings.append(f"Line {line_number}: Loose equality; use '===' / '!==' unless coercion is intended.")
+        if re.search(r'\bvar\s+\w', line):
+            findings.append(f"Line {line_number}: 'var' declaration; prefer 'const' or 'let'.")
+        if re.search(r'\bdebugger\s*;?', line):
+            findings.append(f"Line {line_number}: Leftover 'debugger' statement.")
+        if re.search(r'\bconsole\.log\s*\(', line):
+            findings.append(f"Line {line_number}: Leftover 'console.log' call.")
+    for match in re.finditer(r'\bcatch\s*(?:\([^)]*\))?\s*\{\s*\}', code):
+        findings.append(f"Line {code.count(chr(10), 0, match.start()) + 1}: Empty catch block swallows errors.")
+
+    metrics.update({"functions": function_count, "classes": class_count})
+    return {"metrics": metrics, "outline": outline, "findings": findings}
+
+
+def _xml_analysis(source: str, lines: List[str]) -> Dict[str, Any]:
+    metrics = _line_metrics(lines, ())
+    try:
+        root = ET.fromstring(source.encode("utf-8"))
+    except ET.ParseError as e:
+        line_number = e.position[0] if getattr(e, "position", None) else 1
+        return {"metrics": metrics, "outline": [], "findings": [f"Line {line_number}: XML is not well-formed: {e}"]}
+
+    def local_name(tag: Any) -> str:
+        return str(tag).rsplit("}", 1)[-1]
+
+    def depth(element: ET.Element) -> int:
+        return 1 + max((depth(child) for child in element), default=0)
+
+    child_counts: Dict[str, int] = {}
+    for child in root:
+        child_counts[local_name(child.tag)] = child_counts.get(local_name(child.tag), 0) + 1
+    metrics.update({"elements": sum(1 for _ in root.iter()), "max_depth": depth(root)})
+    outline = [f"root <{local_name(root.tag)}>"] + [f"<{tag}> x{count}" for tag, count in child_counts.items()]
+    return {"metrics": metrics, "outline": outline, "findings": []}
+
+
+def _comment_findings(lines: List[str]) -> List[str]:
+    return [
+        f"Line {line_number}: Unresolved {marker.group(1)} comment."
+        for line_number, line in enumerate(lines, start=1)
+        for marker in [re.search(r'(?:#|//|/\*|<!--)\s*(TODO|FIXME|XXX)\b', line)]
+        if marker
+    ]
+
+
+def _block_fingerprints(lines: List[str]) -> List[Tuple[str, int, int]]:
+    """Hashes every window of ``DUPLICATE_WINDOW_LINES`` non-blank lines, whitespace-normalized."""
+    content_lines = [
+        (line_number, re.sub(r'\s+', ' ', line.strip()))
+        for line_number, line in enumerate(lines, start=1)
+        if len(line.strip()) > 2
+    ]
+    fingerprints = []
+    for start in range(len(content_lines) - DUPLICATE_WINDOW_LINES + 1):
+        window = content_lines[start:start + DUPLICATE_WINDOW_LINES]
+        digest = hashlib.sha1("\n".join(text for _, text in window).encode("utf-8")).hexdigest()[:16]
+        fingerprints.append((digest, window[0][0], window[-1][0]))
+    return fingerprints
+
+
+def _merge_duplicate_spans(
+    matches: List[Tuple[str, int, int, str, int, int]],
+) -> Dict[Tuple[str, str, int], List[int]]:
+    """Collapses overlapping windows of one repeated block into a single range per pair of locations.
+
+    ``matches`` holds ``(file, start, end, first_file, first_start, first_end)`` window pairs.
+    """
+    pairs: Dict[Tuple[str, str, int], List[int]] = {}
+    for filename, start, end, first_file, first_start, first_end in matches:
+        key = (filename, first_file, start - first_start)
+        span = pairs.setdefault(key, [start, end, first_start, first_end])
+        span[0], span[1] = min(span[0], start), max(span[1], end)
+        span[2], span[3] = min(span[2], first_start), max(span[3], first_end)
+    return pairs
+
+
+def _duplicate_findings(files: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """Reports blocks repeated within or across files, merged into ranges per occurrence.
+
+    Within-file duplicates are computed from each file's own fingerprints only,
+    so they do not change with the other files submitted alongside it.
+
+    Returns:
+        ``(within_file, cross_file)`` findings per filename.
+    """
+    within_file: Dict[str, List[str]] = {}
+    # Per digest, the first location in each file, in submission order.
+    first_by_file: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    for file_info in files:
+        filename = str(file_info.get("filename") or "")
+        local_first: Dict[str, Tuple[int, int]] = {}
+        matches: List[Tuple[str, int, int, str, int, int]] = []
+        for digest, start, end in _block_fingerprints(str(file_info.get("content") or "").split("\n")):
+            if digest in local_first:
+                matches.append((filename, start, end, filename, *local_first[digest]))
+            else:
+                local_first[digest] = (start, end)
+        for digest, location in local_first.items():
+            first_by_file.setdefault(digest, {}).setdefault(filename, location)
+
+        pairs = _merge_duplicate_spans(matches)
+        for start, end, first_start, first_end in sorted(pairs.values()):
+            if start <= first_end:
+                continue
+            within_file.setdefault(filename, []).append(
+                f"Lines {start}-{end}: Duplicates lines {first_start}-{first_end}; extract a shared function."
+            )
+
+    cross_matches: List[Tuple[str, int, int, str, int, int]] = []
+    for locations in first_by_file.values():
+        if len(locations) < 2:
+            continue
+        (first_file, (first_start, first_end)), *others = locations.items()
+        for filename, (start, end) in others:
+            cross_matches.append((filename, start, end, first_file, first_start, first_end))
+
+    cross_file: Dict[str, List[str]] = {}
+    pairs = _merge_duplicate_spans(cross_matches)
+    for (filename, first_file, _), (start, end, first_start, first_end) in sorted(pairs.items(), key=lambda item: (item[0][0], item[1][0])):
+        cross_file.setdefault(filename, []).append(
+            f"Lines {start}-{end}: Duplicates {first_file} lines {first_start}-{first_end}; extract a shared function."
+        )
+    return within_file, cross_file
+
+
+def analyze_code_files(files: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Runs the local pre-analysis.
+
+    Args:
+        files: Files as ``{"filename": ..., "content": ...}`` dicts.
+
+    Returns:
+        Per filename: ``language``, ``metrics``, ``outline`` (symbol lines
+        with their ranges), ``findings`` (``Line N:`` suggestions that depend
+        only on the file itself) and ``cross_file_findings`` (duplicates of
+        other submitted files, which change whenever those files do).
+    """
+    settings = get_static_analysis_settings()
+    duplicates, cross_file_duplicates = _duplicate_findings(files)
+    analyses: Dict[str, Dict[str, Any]] = {}
+    for file_info in files:
+        filename = str(file_info.get("filename") or "")
+        source = str(file_info.get("content") or "")
+        lines = source.split("\n")
+        language = _language(filename)
+        if language == "python":
+            analysis = _python_analysis(source, lines, settings)
+        elif language in ("javascript", "typescript"):
+            analysis = _js_analysis(source, lines, settings)
+        elif language == "xml":
+            analysis = _xml_analysis(source, lines)
+        else:
+            analysis = {"metrics": _line_metrics(lines, ("#", "//", "--")), "outline": [], "findings": []}
+        findings = sorted(
+            analysis["findings"] + _comment_findings(lines) + duplicates.get(filename, []),
+            key=lambda finding: int(re.match(r'Lines? (\d+)', finding).group(1)),
+        )
+        analyses[filename] = {
+            "language": language,
+            "metrics": analysis["metrics"],
+            "outline": analysis["outline"][:MAX_OUTLINE_ENTRIES],
+            "findings": list(dict.fromkeys(findings))[:MAX_FINDINGS_PER_FILE],
+            "cross_file_findings": cross_file_duplicates.get(filename, [])[:MAX_FINDINGS_PER_FILE],
+        }
+    return analyses
+
+
+def merge_cross_file_findings(reviews: List[Dict[str, Any]], analyses: Dict[str, Dict[str, Any]]) -> None:
+    """Appends each review's cross-file findings to its suggestions, in place.
+
+    Kept out of ``analyze_code_files``' per-file findings so cached per-file
+    reviews never carry references to other files.
+    """
+    for review in reviews:
+        analysis = analyses.get(review.get("filename"))
+        if not analysis or not analysis["cross_file_findings"]:
+            continue
+        suggestions = list(review.get("suggestions") or [])
+        review["suggestions"] = suggestions + [
+            finding for finding in analysis["cross_file_findings"] if finding not in suggestions
+        ]
+
+
+def render_static_context(filename: str, analysis: Dict[str, Any]) -> str:
+    """Compact text block placed ahead of a file in the review prompt."""
+    metrics = ", ".join(f"{key}={value}" for key, value in analysis["metrics"].items())
+    parts = [f"=== STATIC ANALYSIS: {filename} ({analysis['language']}) ===", f"Metrics: {metrics}"]
+    if analysis["outline"]:
+        parts.append("Outline: " + "; ".join(analysis["outline"]))
+    findings = analysis["findings"] + analysis.get("cross_file_findings", [])
+    if findings:
+        parts.append("Already reported (do not repeat):\n" + "\n".join(f"- {finding}" for finding in findings))
+    return "\n".join(parts) + "\n\n"
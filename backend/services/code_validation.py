@@ -0,0 +1,100 @@
+"""Local syntax validation for auto-fixed code.
+
+Auto-fixed code is checked before it is returned: ``compile`` for Python,
+the standard parsers for JSON and XML, and a bracket-balance check for
+JS/TS (comments and strings stripped). Further languages can be added with
+``register_validator``. Only errors the fix introduced count; a file that
+did not parse before the fix is not held against it.
+"""
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterable, Optional
+
+from services.code_static_analysis import JS_EXTENSIONS, JS_NOISE_PATTERN, XML_EXTENSIONS
+from utils.env import is_truthy_env, safe_int_env
+
+# A validator returns None for valid source, else {"line": int, "message": str}.
+Validator = Callable[[str], Optional[Dict[str, object]]]
+
+BRACKET_PAIRS = {")": "(", "]": "[", "}": "{"}
+
+
+def get_validation_settings() -> Dict[str, object]:
+    return {
+        "enabled": is_truthy_env(os.getenv("LLM_AUTO_FIX_VALIDATION", "true")),
+        "repair_context_lines": max(1, safe_int_env("LLM_AUTO_FIX_REPAIR_CONTEXT_LINES", 15)),
+        "max_repair_attempts": max(0, safe_int_env("LLM_AUTO_FIX_MAX_REPAIR_ATTEMPTS", 1)),
+    }
+
+
+def _validate_python(source: str) -> Optional[Dict[str, object]]:
+    try:
+        compile(source, "<auto-fix>", "exec", dont_inherit=True)
+    except SyntaxError as e:
+        return {"line": e.lineno or 1, "message": f"{type(e).__name__}: {e.msg}"}
+    except ValueError as e:
+        return {"line": 1, "message": str(e)}
+    return None
+
+
+def _validate_json(source: str) -> Optional[Dict[str, object]]:
+    try:
+        json.loads(source)
+    except json.JSONDecodeError as e:
+        return {"line": e.lineno, "message": f"Invalid JSON: {e.msg}"}
+    return None
+
+
+def _validate_xml(source: str) -> Optional[Dict[str, object]]:
+    try:
+        ET.fromstring(source.encode("utf-8"))
+    except ET.ParseError as e:
+        return {"line": e.position[0] if getattr(e, "position", None) else 1, "message": f"Malformed XML: {e}"}
+    return None
+
+
+def _validate_brackets(source: str) -> Optional[Dict[str, object]]:
+    code = JS_NOISE_PATTERN.sub(lambda match: re.sub(r'[^\n]', ' ', match.group(0)), source)
+    stack = []
+    line_number = 1
+    for character in code:
+        if character == "\n":
+            line_number += 1
+        elif character in "([{":
+            stack.append((character, line_number))
+        elif character in BRACKET_PAIRS:
+            if not stack or stack[-1][0] != BRACKET_PAIRS[character]:
+                return {"line": line_number, "message": f"Unexpected '{character}'"}
+            stack.pop()
+    if stack:
+        character, opened_at = stack[-1]
+        return {"line": opened_at, "message": f"Unclosed '{character}'"}
+    return None
+
+
+_VALIDATORS: Dict[str, Validator] = {}
+
+
+def register_validator(extensions: Iterable[str], validator: Validator) -> None:
+    """Registers ``validator`` for files ending in any of ``extensions``; later registrations win."""
+    for extension in extensions:
+        _VALIDATORS[extension.lower()] = validator
+
+
+register_validator((".py", ".pyw"), _validate_python)
+register_validator((".json",), _validate_json)
+register_validator(XML_EXTENSIONS, _validate_xml)
+register_validator(JS_EXTENSIONS, _validate_brackets)
+
+
+def validate_code(filename: str, source: str) -> Optional[Dict[str, object]]:
+    """Returns the first syntax error in ``source``, or None when valid or no validator applies."""
+    extension = os.path.splitext(str(filename or "").lower())[1]
+    validator = _VALIDATORS.get(extension)
+    return validator(source) if validator else None
+
+
+def has_validator(filename: str) -> bool:
+    return os.path.splitext(str(filename or "").lower())[1] in _VALIDATORS
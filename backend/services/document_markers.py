@@ -0,0 +1,123 @@
+"""Single-pass scanner for the structural markers the parser writes into text.
+
+Parsed documents carry page, paragraph, slide, sheet and file markers plus a
+trailing ``[CAR_METADATA]`` block. Analysis needs all of them (page counts,
+CAR file splits, per-page text for retrieval and reference resolution), so
+the text is scanned once per request and every consumer reads the result.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+# One alternation so the text is swept once. Page markers are matched loosely
+# (kind and closing dashes optional) for page counting; ``page_kind`` and
+# ``page_close`` tell whether a marker is a full section header.
+DOCUMENT_MARKER_PATTERN = re.compile(
+    r'\n--- File: (?P<file>.+?) ---\n'
+    r'|--- Page (?P<page>\d+) (?P<page_kind>Text|Tables|Visual Metadata|OCR)?(?P<page_close> ---)?'
+    r'|--- Slide (?P<slide>\d+) ---'
+    r'|--- Excel Sheet: (?P<sheet>.+?) ---'
+    r'|\[CAR_METADATA\] total_size=(?P<car_size>\d+), file_count=(?P<car_files>\d+) \[/CAR_METADATA\]'
+    r'|(?:(?<![\s\S])|(?<=[\n ]))P(?P<paragraph>\d+): '
+)
+
+# (page number, marker start, marker end, segment end)
+PageSection = Tuple[int, int, int, int]
+
+
+class DocumentMarkers:
+    """Marker positions, counts and segments found in one parsed document."""
+
+    def __init__(self, text: str):
+        """Scans ``text`` once and records every marker.
+
+        Args:
+            text: Parsed document text as produced by the document parser.
+        """
+        self.text = text
+        self.page_numbers: List[int] = []
+        self.page_sections: List[PageSection] = []
+        self.paragraph_numbers: List[int] = []
+        self.slide_numbers: List[int] = []
+        self.sheet_names: List[str] = []
+        self.car_total_size: Optional[int] = None
+        self.car_file_count: Optional[int] = None
+        self.files: List[Tuple[str, str]] = []
+        self._page_text_index: Optional[Dict[int, str]] = None
+        self._scan()
+
+    def _scan(self) -> None:
+        text = self.text
+        open_sections: List[Tuple[int, int, int]] = []
+        file_markers: List[Tuple[str, int, int]] = []
+
+        for match in DOCUMENT_MARKER_PATTERN.finditer(text):
+            kind = match.lastgroup
+            if match.group("page") is not None:
+                page_number = int(match.group("page"))
+                self.page_numbers.append(page_number)
+                if match.group("page_kind") and match.group("page_close"):
+                    open_sections.append((page_number, match.start(), match.end()))
+            elif kind == "file":
+                file_markers.append((match.group("file"), match.start(), match.end()))
+            elif kind == "slide":
+                self.slide_numbers.append(int(match.group("slide")))
+            elif kind == "sheet":
+                self.sheet_names.append(match.group("sheet"))
+            elif match.group("car_files") is not None:
+                if self.car_file_count is None:
+                    self.car_total_size = int(match.group("car_size"))
+                    self.car_file_count = int(match.group("car_files"))
+            elif kind == "paragraph":
+                self.paragraph_numbers.append(int(match.group("paragraph")))
+
+        for index, (page_number, start, end) in enumerate(open_sections):
+            segment_end = open_sections[index + 1][1] if index + 1 < len(open_sections) else len(text)
+            self.page_sections.append((page_number, start, end, segment_end))
+
+        for index, (filename, start, end) in enumerate(file_markers):
+            content_end = file_markers[index + 1][1] if index + 1 < len(file_markers) else len(text)
+            self.files.append((filename, text[end:content_end]))
+
+    @property
+    def has_car_metadata(self) -> bool:
+        return self.car_file_count is not None
+
+    @property
+    def max_page_number(self) -> int:
+        return max(self.page_numbers, default=0)
+
+    @property
+    def max_paragraph_number(self) -> int:
+        return max(self.paragraph_numbers, default=0)
+
+    @property
+    def max_slide_number(self) -> int:
+        return max(self.slide_numbers, default=0)
+
+    @property
+    def preamble(self) -> str:
+        """Text before the first page section header."""
+        return self.text[:self.page_sections[0][1]] if self.page_sections else ""
+
+    def page_segments(self) -> Dict[int, List[str]]:
+        """Returns each page's sections, headers included, in first-seen page order."""
+        segments: Dict[int, List[str]] = {}
+        for page_number, start, _, segment_end in self.page_sections:
+            segments.setdefault(page_number, []).append(self.text[start:segment_end])
+        return segments
+
+    def page_text_index(self) -> Dict[int, str]:
+        """Returns each page's section bodies, headers stripped, joined by newlines."""
+        if self._page_text_index is None:
+            page_chunks: Dict[int, List[str]] = {}
+            for page_number, _, end, segment_end in self.page_sections:
+                page_chunks.setdefault(page_number, []).append(self.text[end:segment_end])
+            self._page_text_index = {
+                page_number: "\n".join(chunks)
+                for page_number, chunks in page_chunks.items()
+            }
+        return self._page_text_index
+
+
+def scan_document_markers(text: str) -> DocumentMarkers:
+    return DocumentMarkers(text or "")
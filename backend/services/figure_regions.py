@@ -0,0 +1,144 @@
+"""Figure regions on PDF pages, for sending crops instead of full-page renders.
+
+A page whose only visual is a small diagram is mostly text the parser has
+already extracted. The visual objects pdfplumber reports (embedded images,
+rects, curves) are clustered into regions; each region is cropped from the
+page render and sent on its own, which cuts payload bytes and keeps more of
+the model's image resolution on the diagram. Pages whose visuals cover most
+of the page, or are too scattered to crop, keep the full-page render.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from utils.env import safe_float_env, safe_int_env
+
+# (x0, top, x1, bottom) in PDF points, origin at the top-left corner.
+BBox = Tuple[float, float, float, float]
+
+# Rects thinner than this are rules, underlines and table borders, not figures.
+MIN_OBJECT_SIDE_PT = 2.0
+# Objects covering nearly the whole page are backgrounds or page frames.
+MAX_OBJECT_PAGE_RATIO = 0.9
+
+
+def get_figure_crop_settings() -> Dict[str, Any]:
+    """Settings that change which images are produced for a PDF."""
+    mode = os.getenv("PDF_FIGURE_CROP_MODE", "auto").strip().lower()
+    return {
+        "mode": mode if mode in {"auto", "off"} else "auto",
+        "render_dpi": max(72, safe_int_env("PDF_FIGURE_RENDER_DPI", 220)),
+        "merge_gap_pt": max(0.0, safe_float_env("PDF_FIGURE_MERGE_GAP_PT", 12.0)),
+        "padding_pt": max(0.0, safe_float_env("PDF_FIGURE_PADDING_PT", 8.0)),
+        "min_area_ratio": max(0.0, safe_float_env("PDF_FIGURE_MIN_AREA_RATIO", 0.02)),
+        "max_area_ratio": min(1.0, max(0.0, safe_float_env("PDF_FIGURE_MAX_AREA_RATIO", 0.6))),
+        "max_regions_per_page": max(1, safe_int_env("PDF_FIGURE_MAX_REGIONS_PER_PAGE", 4)),
+    }
+
+
+def _area(box: BBox) -> float:
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def _union(first: BBox, second: BBox) -> BBox:
+    return (min(first[0], second[0]), min(first[1], second[1]), max(first[2], second[2]), max(first[3], second[3]))
+
+
+def _near(first: BBox, second: BBox, gap: float) -> bool:
+    return (
+        first[0] - gap <= second[2] and second[0] - gap <= first[2]
+        and first[1] - gap <= second[3] and second[1] - gap <= first[3]
+    )
+
+
+def _center_inside(box: BBox, container: BBox) -> bool:
+    center_x = (box[0] + box[2]) / 2
+    center_y = (box[1] + box[3]) / 2
+    return container[0] <= center_x <= container[2] and container[1] <= center_y <= container[3]
+
+
+def object_bbox(obj: Dict[str, Any]) -> BBox:
+    return (float(obj["x0"]), float(obj["top"]), float(obj["x1"]), float(obj["bottom"]))
+
+
+def cluster_figure_regions(
+    object_boxes: Iterable[BBox],
+    page_width: float,
+    page_height: float,
+    table_boxes: Sequence[BBox] = (),
+    settings: Optional[Dict[str, Any]] = None,
+) -> Optional[List[BBox]]:
+    """Groups visual objects into figure regions.
+
+    Args:
+        object_boxes: Bounding boxes of images, rects and curves on the page.
+        page_width: Page width in points.
+        page_height: Page height in points.
+        table_boxes: Detected table boxes; objects inside them are table cells.
+        settings: Crop settings; read from the environment when omitted.
+
+    Returns:
+        Regions in reading order, ``[]`` when the page has no figure, or None
+        when the page should be sent whole (figures cover too much of the page
+        or are too scattered to crop usefully).
+    """
+    settings = settings or get_figure_crop_settings()
+    page_area = max(1.0, page_width * page_height)
+    gap = settings["merge_gap_pt"]
+
+    candidates: List[BBox] = []
+    for box in object_boxes:
+        if box[2] - box[0] < MIN_OBJECT_SIDE_PT or box[3] - box[1] < MIN_OBJECT_SIDE_PT:
+            continue
+        if _area(box) / page_area >= MAX_OBJECT_PAGE_RATIO:
+            continue
+        if any(_center_inside(box, table_box) for table_box in table_boxes):
+            continue
+        candidates.append(box)
+    if not candidates:
+        return []
+
+    # Diagrams hold thousands of curves but only a few regions, so each box is
+    # merged into the small list of regions until no two regions touch.
+    regions: List[BBox] = sorted(candidates)
+    while True:
+        merged: List[BBox] = []
+        for box in regions:
+            for index, region in enumerate(merged):
+                if _near(region, box, gap):
+                    merged[index] = _union(region, box)
+                    break
+            else:
+                merged.append(box)
+        if len(merged) == len(regions):
+            break
+        regions = merged
+
+    regions = [region for region in regions if _area(region) / page_area >= settings["min_area_ratio"]]
+    if not regions:
+        return []
+    if (
+        len(regions) > settings["max_regions_per_page"]
+        or sum(_area(region) for region in regions) / page_area > settings["max_area_ratio"]
+    ):
+        return None
+    return sorted(regions, key=lambda region: (region[1], region[0]))
+
+
+def crop_region(page_image: Image.Image, region: BBox, page_width: float, page_height: float, padding_pt: float) -> Image.Image:
+    """Crops a region given in page points out of a render of that page."""
+    scale_x = page_image.width / max(1.0, page_width)
+    scale_y = page_image.height / max(1.0, page_height)
+    left = max(0, int((region[0] - padding_pt) * scale_x))
+    top = max(0, int((region[1] - padding_pt) * scale_y))
+    right = min(page_image.width, int((region[2] + padding_pt) * scale_x + 0.5))
+    bottom = min(page_image.height, int((region[3] + padding_pt) * scale_y + 0.5))
+    return page_image.crop((left, top, max(left + 1, right), max(top + 1, bottom)))
+
+
+def describe_image_source(source: Dict[str, Any]) -> str:
+    """Short provenance label for an attached image, e.g. ``Page 7, figure region``."""
+    page = source.get("page")
+    label = f"Page {page}" if page else "Document image"
+    return f"{label}, figure region" if source.get("region") == "figure" else f"{label}, full page"
@@ -0,0 +1,90 @@
+"""Low/high resolution renditions of extracted images.
+
+Analysis sends low-resolution previews of the document's images first and
+re-asks only the checklist items the model flags as needing visual detail
+with the full-resolution images of just the pages involved. Previews are
+derived here from the full renditions the request carries, so the full image
+is always at hand no matter which worker serves the request; derived
+previews are cached by content hash.
+"""
+import base64
+import binascii
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+from PIL import Image
+
+from services.vision_prepass import hash_image
+from utils.env import safe_int_env
+
+
+def get_image_pyramid_settings() -> Dict[str, Any]:
+    """Settings for preview renditions; ``mode`` is ``on`` or ``off``."""
+    mode = os.getenv("VISION_IMAGE_PYRAMID_MODE", "on").strip().lower()
+    return {
+        "mode": mode if mode in {"on", "off"} else "on",
+        "preview_max_dim": max(128, safe_int_env("VISION_PREVIEW_MAX_DIM", 768)),
+        "preview_jpeg_quality": max(30, min(95, safe_int_env("VISION_PREVIEW_JPEG_QUALITY", 60))),
+        "max_escalation_calls": max(0, safe_int_env("LLM_VISION_ESCALATION_MAX_CALLS", 3)),
+    }
+
+
+def build_preview(full_b64: str, max_dim: int, jpeg_quality: int) -> str:
+    """Returns a base64 JPEG preview of ``full_b64``, or ``full_b64`` itself when it is already small or unreadable."""
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(full_b64))) as image:
+            if max(image.size) <= max_dim:
+                return full_b64
+            preview = image.convert("RGB")
+    except (binascii.Error, OSError, ValueError):
+        return full_b64
+    preview.thumbnail((max_dim, max_dim), Image.LANCZOS)
+    buffered = io.BytesIO()
+    preview.save(buffered, format="JPEG", quality=jpeg_quality, optimize=True)
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+class ImagePreviewCache:
+    """Bounded LRU mapping a full-resolution image to its preview rendition."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get_preview(self, full_b64: str) -> str:
+        """Returns the preview of ``full_b64``, building it on a cache miss.
+
+        Returns ``full_b64`` unchanged when previews are disabled or the image
+        is already no larger than a preview.
+        """
+        settings = get_image_pyramid_settings()
+        if settings["mode"] == "off":
+            return full_b64
+        key = f"{settings['preview_max_dim']}:{settings['preview_jpeg_quality']}:{hash_image(full_b64)}"
+        with self._lock:
+            preview = self._entries.get(key)
+            if preview is not None:
+                self._entries.move_to_end(key)
+                return preview
+
+        preview = build_preview(full_b64, settings["preview_max_dim"], settings["preview_jpeg_quality"])
+        if 0 < len(preview) <= self.max_chars:
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._chars -= len(previous)
+                self._entries[key] = preview
+                self._chars += len(preview)
+                while self._chars > self.max_chars:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._chars -= len(evicted)
+        return preview
+
+
+# Singleton instance
+image_previews = ImagePreviewCache(max(0, safe_int_env("VISION_PREVIEW_CACHE_MAX_MB", 64)) * 1024 * 1024)
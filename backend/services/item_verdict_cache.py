@@ -0,0 +1,85 @@
+"""Key derivation for the checklist-item-granularity verdict cache.
+
+A verdict is reusable when the same document is reviewed against the same
+checklist item with the same model profile, independent of which other items
+were selected or how the rest of the checklist file changed.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+ITEM_VERDICT_CACHE_VERSION = "item_verdict_v1"
+
+# Stub comments produced when the model returned nothing usable for an item.
+UNCACHEABLE_COMMENTS = {
+    "no result was returned for this checklist item.",
+}
+
+
+def _sha256_text(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _canonical_json(value: object) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+
+
+def normalize_item_text(value: Any) -> str:
+    """Collapses case, punctuation and whitespace so cosmetic edits keep the same key."""
+    return re.sub(r'[^a-z0-9]+', ' ', str(value or "").lower()).strip()
+
+
+def build_item_key(section: Any, item_text: Any) -> str:
+    """Returns the stable key for a checklist item from its section and wording."""
+    return _sha256_text(_canonical_json([normalize_item_text(section), normalize_item_text(item_text)]))
+
+
+def build_document_hash(
+    text: str,
+    images: Optional[List[str]],
+    file_type: Optional[str],
+    custom_instructions: Optional[str],
+    pagination_metadata: Optional[Dict[str, Any]],
+) -> str:
+    """Hashes every request input that can change a single item's verdict."""
+    return _sha256_text(_canonical_json({
+        "text_hash": _sha256_text(text or ""),
+        "images_hashes": [_sha256_text(image or "") for image in images or []],
+        "file_type": (file_type or "").lower().strip("."),
+        "custom_instructions": custom_instructions or "",
+        "pagination_metadata": pagination_metadata or {},
+    }))
+
+
+def build_profile_hash(
+    provider: str,
+    model_name: str,
+    deterministic_profile: Dict[str, Any],
+    analysis_version: str,
+) -> str:
+    """Hashes the model and prompt configuration a verdict was produced with."""
+    return _sha256_text(_canonical_json({
+        "cache_version": ITEM_VERDICT_CACHE_VERSION,
+        "analysis_version": analysis_version,
+        "provider": provider,
+        "model_name": model_name,
+        "deterministic_profile": deterministic_profile,
+    }))
+
+
+def build_verdict_cache_key(document_hash: str, item_key: str, profile_hash: str) -> str:
+    return _sha256_text(f"{document_hash}:{item_key}:{profile_hash}")
+
+
+def is_cacheable_verdict(item: Any) -> bool:
+    """Rejects error rows and placeholder verdicts that should be re-asked next time."""
+    if not isinstance(item, dict):
+        return False
+    item_text = str(item.get("item") or "").strip()
+    comment = str(item.get("comment") or "").strip().lower()
+    if not item_text or not str(item.get("status") or "").strip():
+        return False
+    if item_text.lower() == "ai analysis" and comment.startswith("error:"):
+        return False
+    return comment not in UNCACHEABLE_COMMENTS
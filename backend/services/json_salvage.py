@@ -0,0 +1,244 @@
+"""Local repair and incremental parsing of LLM JSON output.
+
+A response that is cut off or slightly malformed (markdown fences, trailing
+commas, a missing closing bracket) used to fail parsing and send the whole
+prompt again. ``parse_llm_json`` repairs such defects locally, and
+``IncrementalJsonParser`` reads a streamed response as it arrives, keeping
+every complete object of one array (the checklist) so a truncated answer
+only costs a follow-up call for the items that are missing.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+
+from services.metrics import metrics
+from utils.env import is_truthy_env
+
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*)$')
+DANGLING_KEY_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"\s*:?\s*$')
+COMPLETE_SCALAR_PATTERN = re.compile(r'(?:true|false|null|-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|"|[\]}])\s*$')
+PARTIAL_SCALAR_PATTERN = re.compile(r'[\w.+-]+$')
+
+
+def get_json_salvage_settings() -> Dict[str, bool]:
+    return {
+        "enabled": is_truthy_env(os.getenv("LLM_JSON_SALVAGE", "true")),
+        "followup": is_truthy_env(os.getenv("LLM_JSON_SALVAGE_FOLLOWUP", "true")),
+    }
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.rstrip().endswith("```"):
+        text = text.rstrip()[:-3]
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    return text[min(starts):] if starts else text
+
+
+def repair_json_text(text: str) -> Tuple[str, bool]:
+    """Fixes fences, trailing commas and truncation.
+
+    Returns:
+        ``(repaired_text, truncated)``; ``truncated`` is True when brackets or
+        a string had to be closed, i.e. the tail of the answer is missing.
+    """
+    source = _strip_fences(text)
+    output: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    expect_key = False
+    key_start: Optional[int] = None
+
+    for character in source:
+        if in_string:
+            output.append(character)
+            if escape:
+                escape = False
+            elif character == "\\":
+                escape = True
+            elif character == '"':
+                in_string = False
+            continue
+        if character == '"':
+            if stack and stack[-1] == "{" and expect_key:
+                key_start = len(output)
+            in_string = True
+            output.append(character)
+        elif character in "{[":
+            stack.append(character)
+            expect_key = character == "{"
+            key_start = None
+            output.append(character)
+        elif character in "}]":
+            # Drop a trailing comma before the closer.
+            joined = TRAILING_COMMA_PATTERN.sub(r'\1', "".join(output))
+            output = list(joined)
+            if stack:
+                stack.pop()
+            expect_key = False
+            output.append(character)
+            if not stack:
+                break
+        elif character == ",":
+            expect_key = bool(stack) and stack[-1] == "{"
+            key_start = None
+            output.append(character)
+        elif character == ":":
+            expect_key = False
+            output.append(character)
+        else:
+            output.append(character)
+
+    truncated = in_string or bool(stack)
+    if not truncated:
+        return "".join(output), False
+
+    if expect_key and key_start is not None:
+        # A key without its value (complete or cut off) is useless; drop it.
+        output = output[:key_start]
+    elif in_string:
+        if escape:
+            output.pop()
+        output.append('"')
+    repaired = "".join(output).rstrip()
+    # Peel off dangling separators, keys without values and half-written literals until the tail is complete.
+    for _ in range(8):
+        previous = repaired
+        if repaired.endswith(","):
+            repaired = repaired[:-1].rstrip()
+        elif repaired.endswith(":"):
+            repaired = DANGLING_KEY_PATTERN.sub("", repaired).rstrip()
+        elif not COMPLETE_SCALAR_PATTERN.search(repaired) and not repaired.endswith(("{", "[")):
+            repaired = PARTIAL_SCALAR_PATTERN.sub("", repaired).rstrip()
+        if repaired == previous:
+            break
+    closers = "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+    return repaired + closers, True
+
+
+def parse_llm_json(text: str) -> Tuple[Any, bool, bool]:
+    """Parses model output, repairing it locally when needed.
+
+    Returns:
+        ``(value, repaired, truncated)``.
+
+    Raises:
+        ValueError: If the output cannot be parsed even after repair.
+    """
+    try:
+        return json.loads(text.strip()), False, False
+    except ValueError:
+        pass
+    repaired, truncated = repair_json_text(text)
+    try:
+        return json.loads(repaired), True, truncated
+    except ValueError as e:
+        raise ValueError(f"Unrepairable JSON output: {e}") from e
+
+
+class IncrementalJsonParser:
+    """Consumes streamed JSON text and collects each complete object of one array as soon as it closes."""
+
+    def __init__(self, array_key: str = "checklist"):
+        self.array_key = array_key
+        self.text = ""
+        self.items: List[Dict[str, Any]] = []
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._array_closed = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk or ""
+        text = self.text
+        while self._position < len(text):
+            index = self._position
+            character = text[index]
+            self._position += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif character == "\\":
+                    self._escape = True
+                elif character == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads(text[self._string_start:index + 1])
+                    except ValueError:
+                        self._last_string = None
+                continue
+            if character == '"':
+                self._in_string = True
+                self._string_start = index
+                self._pending_key = None
+            elif character == ":":
+                self._pending_key = self._last_string
+            elif character in "{[":
+                self._depth += 1
+                if (
+                    character == "["
+                    and self._array_depth is None
+                    and not self._array_closed
+                    and self._pending_key == self.array_key
+                ):
+                    self._array_depth = self._depth
+                elif character == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = index
+                self._pending_key = None
+            elif character in "}]":
+                if (
+                    character == "}"
+                    and self._item_start is not None
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth + 1
+                ):
+                    self._collect(text[self._item_start:index + 1])
+                    self._item_start = None
+                elif character == "]" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._array_depth = None
+                    self._array_closed = True
+                self._depth -= 1
+                self._pending_key = None
+            elif not character.isspace() and character != ",":
+                self._pending_key = None
+
+    def _collect(self, item_text: str) -> None:
+        try:
+            item, _, _ = parse_llm_json(item_text)
+        except ValueError:
+            return
+        if isinstance(item, dict):
+            self.items.append(item)
+
+
+class RepairingJsonOutputParser(JsonOutputParser):
+    """``JsonOutputParser`` that repairs malformed output locally before giving up."""
+
+    def parse_result(self, result: List[Any], *, partial: bool = False) -> Any:
+        try:
+            return super().parse_result(result, partial=partial)
+        except OutputParserException:
+            if partial or not get_json_salvage_settings()["enabled"]:
+                raise
+            text = result[0].text
+            try:
+                value, _, truncated = parse_llm_json(text)
+            except ValueError:
+                raise OutputParserException(f"Invalid json output: {text}", llm_output=text)
+            if truncated:
+                # A closed-off fragment would pass for a complete answer; let the caller retry instead.
+                raise OutputParserException(f"Invalid json output (truncated): {text}", llm_output=text)
+            metrics.increment("llm_json_repairs_total")
+            return value
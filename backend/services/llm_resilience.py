@@ -0,0 +1,275 @@
+"""Error classification, retry timing and circuit breaking for LLM calls.
+
+Provider errors are sorted into categories so only transient failures are
+retried, retry waits honor provider ``Retry-After`` hints with jitter, and a
+per provider/model circuit breaker fails calls fast while a provider is down.
+"""
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from config.logging_config import get_logger
+from services.metrics import metrics
+from utils.env import safe_float_env, safe_int_env
+
+logger = get_logger(__name__)
+
+RETRYABLE_CATEGORIES = {"rate_limit", "timeout", "server", "connection", "parse", "unknown"}
+# Categories that say something about provider health and feed the circuit breaker.
+BREAKER_CATEGORIES = {"timeout", "server", "connection"}
+
+CONTEXT_OVERFLOW_INDICATORS = [
+    "context_length_exceeded",
+    "maximum context length",
+    "context window",
+    "too many tokens",
+    "input token count",
+    "prompt is too long",
+]
+AUTH_INDICATORS = [
+    "invalid api key",
+    "incorrect api key",
+    "invalid_api_key",
+    "api key not valid",
+    "unauthorized",
+    "permission denied",
+    "authentication",
+]
+RATE_LIMIT_INDICATORS = ["rate limit", "rate_limit", "ratelimit", "too many requests", "resource exhausted", "quota"]
+TIMEOUT_INDICATORS = ["timed out", "timeout", "deadline exceeded"]
+CONNECTION_INDICATORS = ["connection refused", "connection reset", "connection error", "connecterror", "name resolution"]
+SERVER_INDICATORS = ["internal server error", "bad gateway", "service unavailable", "overloaded", "server error"]
+PARSE_INDICATORS = ["outputparserexception", "invalid json", "failed to parse", "jsondecodeerror", "expecting value"]
+
+RETRY_AFTER_MESSAGE_PATTERN = re.compile(
+    r'(?:retry[- ]after|retry in|try again in)\s*:?\s*(\d+(?:\.\d+)?)\s*(ms|milliseconds|s|sec|seconds)?',
+    re.IGNORECASE,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, key: str, retry_in_seconds: float):
+        self.key = key
+        self.retry_in_seconds = retry_in_seconds
+        super().__init__(
+            f"LLM provider circuit open for {key}; failing fast for another {retry_in_seconds:.0f}s"
+        )
+
+
+def _get_status_code(exc: Exception) -> Optional[int]:
+    for candidate in (exc, getattr(exc, "response", None)):
+        if candidate is None:
+            continue
+        for attribute in ("status_code", "status", "code"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int) and 100 <= value <= 599:
+                return value
+    return None
+
+
+def classify_llm_error(exc: Exception) -> str:
+    """Maps a provider exception to a coarse failure category."""
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+
+    status_code = _get_status_code(exc)
+    message = f"{type(exc).__name__}: {exc}".lower()
+
+    if any(indicator in message for indicator in CONTEXT_OVERFLOW_INDICATORS):
+        return "context_overflow"
+    if status_code in {401, 403} or any(indicator in message for indicator in AUTH_INDICATORS):
+        return "auth"
+    if status_code == 429 or any(indicator in message for indicator in RATE_LIMIT_INDICATORS):
+        return "rate_limit"
+    if status_code in {408, 504} or any(indicator in message for indicator in TIMEOUT_INDICATORS):
+        return "timeout"
+    if status_code is not None and status_code >= 500:
+        return "server"
+    if status_code in {400, 404, 413, 415, 422}:
+        return "bad_request"
+    if any(indicator in message for indicator in CONNECTION_INDICATORS):
+        return "connection"
+    if any(indicator in message for indicator in SERVER_INDICATORS):
+        return "server"
+    if any(indicator in message for indicator in PARSE_INDICATORS):
+        return "parse"
+    return "unknown"
+
+
+def is_retryable(category: str) -> bool:
+    return category in RETRYABLE_CATEGORIES
+
+
+def get_retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Extracts a provider retry hint from response headers or the error message."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            retry_after_ms = headers.get("retry-after-ms")
+            if retry_after_ms:
+                return max(0.0, float(retry_after_ms) / 1000.0)
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    return max(0.0, retry_at.timestamp() - time.time())
+        except Exception:
+            pass
+
+    match = RETRY_AFTER_MESSAGE_PATTERN.search(str(exc))
+    if match:
+        value = float(match.group(1))
+        unit = (match.group(2) or "s").lower()
+        return value / 1000.0 if unit in {"ms", "milliseconds"} else value
+    return None
+
+
+def compute_retry_delay(attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+    """Returns the wait before the next attempt, or None when it exceeds the allowed maximum.
+
+    Exponential backoff uses equal jitter (half fixed, half random) so
+    concurrent batches that failed together do not retry in lockstep.
+    """
+    base_delay = max(0.0, safe_float_env("LLM_RETRY_BASE_DELAY_SEC", 2.0))
+    backoff_cap = max(base_delay, safe_float_env("LLM_RETRY_BACKOFF_CAP_SEC", 30.0))
+    max_delay = max(0.0, safe_float_env("LLM_RETRY_MAX_DELAY_SEC", 60.0))
+
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, min(1.0, base_delay))
+    else:
+        exponential = min(backoff_cap, base_delay * (2 ** attempt))
+        delay = exponential / 2 + random.uniform(0, exponential / 2)
+
+    if delay > max_delay:
+        return None
+    return delay
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    def __init__(self, key: str, failure_threshold: int, open_seconds: float):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.last_failure_category: Optional[str] = None
+        self.total_failures = 0
+        self.total_rejections = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError when the call should not reach the provider."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            remaining = (self.opened_at or now) + self.open_seconds - now
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self.probe_in_flight = False
+                logger.info(f"LLM circuit half-open for {self.key}; allowing one probe call")
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return
+            self.total_rejections += 1
+        metrics.increment("llm_circuit_rejections_total", circuit=self.key)
+        raise CircuitOpenError(self.key, max(0.0, remaining))
+
+    def release_probe(self) -> None:
+        """Frees the half-open probe slot when a call ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"LLM circuit closed for {self.key}")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self, category: str) -> None:
+        """Counts provider-health failures; other categories mean the provider answered."""
+        if category not in BREAKER_CATEGORIES:
+            if category != "circuit_open":
+                self.record_success()
+            return
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_failure_category = category
+            should_open = self.state == "half_open" or (
+                self.failure_threshold > 0 and self.consecutive_failures >= self.failure_threshold
+            )
+            if should_open:
+                if self.state != "open":
+                    logger.warning(
+                        f"LLM circuit opened for {self.key} after {self.consecutive_failures} "
+                        f"consecutive failures (last={category}); failing fast for {self.open_seconds:.0f}s"
+                    )
+                    metrics.increment("llm_circuit_opened_total", circuit=self.key)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == "open" and self.opened_at is not None:
+                retry_in = max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "open_seconds": self.open_seconds,
+                "retry_in_seconds": round(retry_in, 3),
+                "last_failure_category": self.last_failure_category,
+                "total_failures": self.total_failures,
+                "total_rejections": self.total_rejections,
+            }
+
+
+class CircuitBreakerRegistry:
+    """Holds one circuit breaker per provider/model pair."""
+
+    def __init__(self):
+        """Initializes an empty registry; breakers are created on first use."""
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model_name: str) -> CircuitBreaker:
+        key = f"{provider}/{model_name}"
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    key,
+                    failure_threshold=max(0, safe_int_env("LLM_CIRCUIT_FAILURE_THRESHOLD", 5)),
+                    open_seconds=max(1.0, safe_float_env("LLM_CIRCUIT_OPEN_SECONDS", 30.0)),
+                )
+                self._breakers[key] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.key: breaker.snapshot() for breaker in breakers}
+
+
+# Singleton instance
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,237 @@
+"""Process-wide scheduler for outbound LLM calls.
+
+Every chain invocation is admitted through a per provider/model budget that
+caps concurrent calls, requests per minute and tokens per minute. Calls that
+would exceed a budget wait in FIFO order instead of triggering provider 429s.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+from config.logging_config import get_logger
+from services.llm_resilience import circuit_breakers, classify_llm_error
+from services.metrics import metrics
+from utils.env import safe_int_env
+
+logger = get_logger(__name__)
+
+BUDGET_WINDOW_SECONDS = 60.0
+
+
+def get_provider_budget(provider: str) -> Dict[str, int]:
+    """Resolves RPM/TPM/concurrency limits for a provider; 0 means unlimited.
+
+    Provider-specific variables (e.g. ``LLM_TPM_LIMIT_OPENAI``) override the
+    global ``LLM_RPM_LIMIT`` / ``LLM_TPM_LIMIT`` / ``LLM_SCHEDULER_MAX_CONCURRENCY``.
+    """
+    suffix = str(provider or "default").upper()
+    return {
+        "rpm": max(0, safe_int_env(f"LLM_RPM_LIMIT_{suffix}", safe_int_env("LLM_RPM_LIMIT", 0))),
+        "tpm": max(0, safe_int_env(f"LLM_TPM_LIMIT_{suffix}", safe_int_env("LLM_TPM_LIMIT", 0))),
+        "max_concurrency": max(0, safe_int_env(
+            f"LLM_SCHEDULER_MAX_CONCURRENCY_{suffix}",
+            safe_int_env("LLM_SCHEDULER_MAX_CONCURRENCY", 4)
+        )),
+    }
+
+
+class _BudgetBucket:
+    """Sliding one-minute request/token window plus a concurrency cap for one model."""
+
+    def __init__(self, key: str, rpm: int, tpm: int, max_concurrency: int):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.get_running_loop()
+        self.window: Deque[Tuple[float, int]] = deque()
+        self.window_tokens = 0
+        # asyncio.Lock wakes waiters in FIFO order, which keeps admission fair.
+        self.admission_lock = asyncio.Lock()
+        self.concurrency = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.queued = 0
+        self.inflight = 0
+
+    def purge(self, now: float) -> None:
+        while self.window and now - self.window[0][0] >= BUDGET_WINDOW_SECONDS:
+            _, tokens = self.window.popleft()
+            self.window_tokens -= tokens
+
+    def seconds_until_admissible(self, now: float, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm and len(self.window) >= self.rpm:
+            oldest_index = len(self.window) - self.rpm
+            wait = max(wait, self.window[oldest_index][0] + BUDGET_WINDOW_SECONDS - now)
+
+        if self.tpm and self.window and self.window_tokens + tokens > self.tpm:
+            # A single call larger than the whole budget runs alone once the window drains.
+            needed = self.window_tokens + min(tokens, self.tpm) - self.tpm
+            freed = 0
+            for started_at, entry_tokens in self.window:
+                freed += entry_tokens
+                if freed >= needed:
+                    wait = max(wait, started_at + BUDGET_WINDOW_SECONDS - now)
+                    break
+        return wait
+
+    def record(self, now: float, tokens: int) -> None:
+        self.window.append((now, tokens))
+        self.window_tokens += tokens
+
+    def publish_gauges(self) -> None:
+        metrics.set_gauge("llm_scheduler_queued", self.queued, bucket=self.key)
+        metrics.set_gauge("llm_scheduler_inflight", self.inflight, bucket=self.key)
+        metrics.set_gauge("llm_scheduler_window_tokens", self.window_tokens, bucket=self.key)
+        metrics.set_gauge("llm_scheduler_window_requests", len(self.window), bucket=self.key)
+
+
+class LLMCallScheduler:
+    """Admits LLM calls against per provider/model budgets shared by all requests."""
+
+    def __init__(self):
+        """Initializes the scheduler with no buckets; buckets are created lazily."""
+        self._buckets: Dict[str, _BudgetBucket] = {}
+
+    def _get_bucket(self, provider: str, model_name: str) -> _BudgetBucket:
+        key = f"{provider}/{model_name}"
+        bucket = self._buckets.get(key)
+        # asyncio primitives are loop-bound; rebuild if a new event loop is running.
+        if bucket is None or bucket.loop is not asyncio.get_running_loop():
+            budget = get_provider_budget(provider)
+            bucket = _BudgetBucket(key, budget["rpm"], budget["tpm"], budget["max_concurrency"])
+            self._buckets[key] = bucket
+        return bucket
+
+    async def _admit(self, bucket: _BudgetBucket, tokens: int) -> None:
+        async with bucket.admission_lock:
+            while True:
+                now = time.monotonic()
+                bucket.purge(now)
+                wait = bucket.seconds_until_admissible(now, tokens)
+                if wait <= 0:
+                    bucket.record(now, tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    async def run(
+        self,
+        provider: str,
+        model_name: str,
+        estimated_tokens: int,
+        call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Waits for budget, then runs ``call``.
+
+        Args:
+            provider: Provider name used to resolve the budget.
+            model_name: Model name; each provider/model pair has its own bucket.
+            estimated_tokens: Pre-computed input plus expected output tokens.
+            call: Zero-argument coroutine function performing the provider call.
+
+        Returns:
+            Whatever ``call`` returns.
+        """
+        bucket = self._get_bucket(provider, model_name)
+        tokens = max(1, int(estimated_tokens))
+        enqueued_at = time.monotonic()
+        bucket.queued += 1
+        bucket.publish_gauges()
+        acquired = False
+        try:
+            if bucket.concurrency:
+                await bucket.concurrency.acquire()
+                acquired = True
+            await self._admit(bucket, tokens)
+        except BaseException:
+            if acquired:
+                bucket.concurrency.release()
+            raise
+        finally:
+            bucket.queued -= 1
+
+        queue_wait = time.monotonic() - enqueued_at
+        metrics.observe("llm_scheduler_queue_wait_seconds", queue_wait, bucket=bucket.key)
+        metrics.increment("llm_scheduler_calls_total", bucket=bucket.key)
+        metrics.increment("llm_scheduler_estimated_tokens_total", tokens, bucket=bucket.key)
+        if queue_wait >= 1.0:
+            logger.info(
+                f"LLM scheduler: bucket={bucket.key} queue_wait={queue_wait:.2f}s "
+                f"estimated_tokens={tokens} window_tokens={bucket.window_tokens} "
+                f"window_requests={len(bucket.window)}"
+            )
+
+        bucket.inflight += 1
+        bucket.publish_gauges()
+        try:
+            return await call()
+        finally:
+            bucket.inflight -= 1
+            if acquired:
+                bucket.concurrency.release()
+            bucket.publish_gauges()
+
+
+class ScheduledChain:
+    """Wraps a LangChain runnable so every ``ainvoke`` is admitted by the scheduler.
+
+    Calls are also gated by the provider/model circuit breaker, which fails
+    them fast with CircuitOpenError while the provider is considered down.
+    """
+
+    def __init__(
+        self,
+        chain: Any,
+        scheduler: LLMCallScheduler,
+        provider: str,
+        model_name: str,
+        estimate_tokens: Callable[[Any], int],
+    ):
+        self.chain = chain
+        self.scheduler = scheduler
+        self.provider = provider
+        self.model_name = model_name
+        self.estimate_tokens = estimate_tokens
+
+    async def ainvoke(self, chain_input: Any, *args: Any, **kwargs: Any) -> Any:
+        breaker = circuit_breakers.get(self.provider, self.model_name)
+        breaker.before_call()
+        estimated_tokens = self.estimate_tokens(chain_input)
+        try:
+            result = await self.scheduler.run(
+                self.provider,
+                self.model_name,
+                estimated_tokens,
+                lambda: self.chain.ainvoke(chain_input, *args, **kwargs),
+            )
+        except Exception as exc:
+            breaker.record_failure(classify_llm_error(exc))
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+    async def astream_into(self, chain_input: Any, on_chunk: Callable[[Any], None]) -> None:
+        """Like ``ainvoke``, but streams the chain and hands each chunk to ``on_chunk`` as it arrives."""
+        async def consume() -> None:
+            async for chunk in self.chain.astream(chain_input):
+                on_chunk(chunk)
+
+        breaker = circuit_breakers.get(self.provider, self.model_name)
+        breaker.before_call()
+        estimated_tokens = self.estimate_tokens(chain_input)
+        try:
+            await self.scheduler.run(self.provider, self.model_name, estimated_tokens, consume)
+        except Exception as exc:
+            breaker.record_failure(classify_llm_error(exc))
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+
+
+# Singleton instance
+llm_scheduler = LLMCallScheduler()
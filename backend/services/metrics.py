@@ -0,0 +1,80 @@
+"""In-process metrics registry for request and LLM call instrumentation.
+
+Counters, gauges and summaries are kept in memory per worker process and
+exposed as JSON through the ``/api/metrics`` route.
+"""
+import threading
+from typing import Any, Dict, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((str(key), str(value)) for key, value in labels.items()))
+
+
+def _format_metric_name(name: str, label_key: LabelKey) -> str:
+    if not label_key:
+        return name
+    rendered = ",".join(f"{key}={value}" for key, value in label_key)
+    return f"{name}{{{rendered}}}"
+
+
+class MetricsRegistry:
+    """Thread-safe store of named counters, gauges and value summaries."""
+
+    def __init__(self):
+        """Initializes an empty registry."""
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        self._summaries: Dict[Tuple[str, LabelKey], Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Adds ``value`` to a monotonically increasing counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Records the current value of a point-in-time measurement."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Adds one observation to a count/sum/max summary."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns a JSON-serializable copy of every recorded metric."""
+        with self._lock:
+            summaries = {}
+            for (name, label_key), summary in self._summaries.items():
+                count = summary["count"]
+                summaries[_format_metric_name(name, label_key)] = {
+                    "count": count,
+                    "sum": round(summary["sum"], 6),
+                    "avg": round(summary["sum"] / count, 6) if count else 0.0,
+                    "max": round(summary["max"], 6),
+                }
+            return {
+                "counters": {
+                    _format_metric_name(name, label_key): value
+                    for (name, label_key), value in self._counters.items()
+                },
+                "gauges": {
+                    _format_metric_name(name, label_key): value
+                    for (name, label_key), value in self._gauges.items()
+                },
+                "summaries": summaries,
+            }
+
+
+# Singleton instance
+metrics = MetricsRegistry()
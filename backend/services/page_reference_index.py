@@ -0,0 +1,104 @@
+"""Per-document index for locating checklist evidence on pages.
+
+Page reference resolution asks, for every checklist item, which pages contain
+each evidence phrase and keyword. Answering that with a substring search of
+every page is O(items x candidates x pages x page length); this index answers
+the same question from token postings, built once per document.
+"""
+from bisect import bisect_right
+from typing import Dict, FrozenSet, List, Set
+
+
+class PageReferenceIndex:
+    """Answers "which pages contain this normalized fragment" without scanning pages.
+
+    Page texts must already be normalized to lowercase alphanumeric tokens
+    separated by single spaces. Lookups keep plain substring semantics:
+    ``pages_containing("test")`` includes a page that only says "testing",
+    exactly like ``"test" in page_text``.
+    """
+
+    def __init__(self, normalized_pages: Dict[int, str]):
+        """Builds token postings and a vocabulary blob for substring lookups.
+
+        Args:
+            normalized_pages: Page number to normalized page text.
+        """
+        self.normalized_pages = normalized_pages
+        self.postings: Dict[str, Set[int]] = {}
+        for page_number, page_text in normalized_pages.items():
+            for token in set(page_text.split()):
+                self.postings.setdefault(token, set()).add(page_number)
+
+        self._vocabulary: List[str] = list(self.postings)
+        self._token_starts: List[int] = []
+        offset = 0
+        for token in self._vocabulary:
+            self._token_starts.append(offset)
+            offset += len(token) + 1
+        # Tokens never contain "\n", so a search of the blob cannot match across two tokens.
+        self._vocabulary_blob = "\n".join(self._vocabulary)
+        self._all_pages = frozenset(normalized_pages)
+        self._cache: Dict[str, FrozenSet[int]] = {}
+
+    def _pages_with_token_substring(self, word: str) -> FrozenSet[int]:
+        pages: Set[int] = set()
+        blob = self._vocabulary_blob
+        token_count = len(self._vocabulary)
+        search_from = 0
+        while True:
+            position = blob.find(word, search_from)
+            if position < 0:
+                break
+            token_index = bisect_right(self._token_starts, position) - 1
+            pages |= self.postings[self._vocabulary[token_index]]
+            if len(pages) == len(self._all_pages):
+                break
+            # Each token only needs to be counted once; resume at the next token.
+            if token_index + 1 >= token_count:
+                break
+            search_from = self._token_starts[token_index + 1]
+        return frozenset(pages)
+
+    def _pages_with_phrase(self, words: List[str], fragment: str) -> FrozenSet[int]:
+        # Inside a phrase match the first word ends a token, the last word starts one
+        # and every word in between is a whole token.
+        candidate_pages = set(self.pages_containing(words[0]))
+        candidate_pages &= self.pages_containing(words[-1])
+        for word in words[1:-1]:
+            if not candidate_pages:
+                break
+            candidate_pages &= self.postings.get(word, set())
+        return frozenset(
+            page_number
+            for page_number in candidate_pages
+            if fragment in self.normalized_pages[page_number]
+        )
+
+    def pages_containing(self, fragment: str) -> FrozenSet[int]:
+        """Returns the pages whose normalized text contains ``fragment``."""
+        cached = self._cache.get(fragment)
+        if cached is not None:
+            return cached
+
+        words = fragment.split()
+        if not words:
+            pages = self._all_pages if not fragment else frozenset(
+                page_number
+                for page_number, page_text in self.normalized_pages.items()
+                if fragment in page_text
+            )
+        elif " ".join(words) != fragment:
+            # Not in normalized form; fall back to a direct scan.
+            pages = frozenset(
+                page_number
+                for page_number, page_text in self.normalized_pages.items()
+                if fragment in page_text
+            )
+        elif len(words) == 1:
+            pages = self._pages_with_token_substring(fragment)
+        else:
+            pages = self._pages_with_phrase(words, fragment)
+
+        self._cache[fragment] = pages
+        return pages
@@ -0,0 +1,224 @@
+"""Lexical page retrieval for long paginated documents.
+
+Builds an in-process BM25 index over the per-page segments marked by
+``--- Page N <Kind> ---`` headers so each checklist batch can be sent only the
+pages most likely to contain its evidence instead of the whole document.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config.logging_config import get_logger
+from services.document_markers import DocumentMarkers, scan_document_markers
+from utils.env import safe_int_env
+
+logger = get_logger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Query terms that carry no retrieval signal for checklist wording.
+RETRIEVAL_STOP_WORDS = {
+    "a", "all", "an", "and", "any", "are", "as", "at", "be", "been", "by", "can",
+    "clear", "clearly", "defined", "described", "does", "document", "documented",
+    "each", "for", "from", "has", "have", "if", "in", "include", "included",
+    "includes", "is", "it", "its", "of", "on", "or", "provided", "should", "that",
+    "the", "there", "these", "this", "to", "was", "were", "where", "which", "with",
+}
+
+# Synonym expansion mirrors the equivalences the review prompt already accepts.
+# Terms are single tokens: the parser's "image_objects=N" page lines index as
+# "image" and "objects".
+RETRIEVAL_SYNONYMS = {
+    "author": ["authors", "prepared", "owner"],
+    "approver": ["approved", "approval", "signoff"],
+    "approval": ["approved", "approver", "signoff"],
+    "revision": ["change", "version", "history", "rev"],
+    "version": ["revision", "rev"],
+    "history": ["revision", "change"],
+    "diagram": ["flow", "figure", "architecture", "image", "objects", "curve"],
+    "screenshot": ["screen", "figure", "image", "objects"],
+    "flow": ["diagram", "process", "workflow"],
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokenization shared by indexing and querying."""
+    return TOKEN_PATTERN.findall(str(text or "").lower())
+
+
+class PageRetrievalIndex:
+    """BM25 index over page segments of a single parsed document."""
+
+    def __init__(self, text: str, markers: Optional[DocumentMarkers] = None):
+        """Splits the document on page markers and indexes each page.
+
+        Args:
+            text: Parsed document text containing ``--- Page N ... ---`` markers.
+            markers: Markers already scanned from ``text``; scanned here if omitted.
+        """
+        self.preamble = ""
+        self.page_segments: Dict[int, List[str]] = {}
+        self.page_order: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.page_lengths: Dict[int, int] = {}
+        self.average_page_length = 0.0
+        self._build(markers or scan_document_markers(text))
+
+    def _build(self, markers: DocumentMarkers) -> None:
+        if not markers.page_sections:
+            return
+
+        self.preamble = markers.preamble
+        self.page_segments = markers.page_segments()
+        self.page_order = list(self.page_segments)
+
+        for page_number, segments in self.page_segments.items():
+            tokens = tokenize("\n".join(segments))
+            self.page_lengths[page_number] = len(tokens)
+            for term, term_frequency in Counter(tokens).items():
+                self.postings.setdefault(term, {})[page_number] = term_frequency
+
+        total_length = sum(self.page_lengths.values())
+        self.average_page_length = total_length / len(self.page_lengths) if self.page_lengths else 0.0
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_order)
+
+    def _idf(self, term: str) -> float:
+        document_count = self.page_count
+        frequency = len(self.postings.get(term, {}))
+        return math.log(1 + (document_count - frequency + 0.5) / (frequency + 0.5))
+
+    def build_query_terms(self, text: str) -> List[str]:
+        """Tokenizes query text, drops stop words and applies synonym expansion."""
+        terms: List[str] = []
+        seen: Set[str] = set()
+        for token in tokenize(text):
+            if len(token) < 3 or token in RETRIEVAL_STOP_WORDS:
+                continue
+            for term in [token] + RETRIEVAL_SYNONYMS.get(token, []):
+                if term not in seen:
+                    seen.add(term)
+                    terms.append(term)
+        return terms
+
+    def score(self, query_terms: Iterable[str]) -> Dict[int, float]:
+        """Returns BM25 scores for every page with at least one matching term."""
+        scores: Dict[int, float] = {}
+        if not self.page_count:
+            return scores
+
+        average_length = self.average_page_length or 1.0
+        for term in query_terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for page_number, term_frequency in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * (self.page_lengths[page_number] / average_length)
+                scores[page_number] = scores.get(page_number, 0.0) + idf * (
+                    term_frequency * (BM25_K1 + 1) / (term_frequency + BM25_K1 * length_norm)
+                )
+        return scores
+
+    def top_pages(self, query_text: str, top_k: int) -> List[int]:
+        """Returns up to ``top_k`` page numbers ranked by BM25 relevance."""
+        scores = self.score(self.build_query_terms(query_text))
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+        return [page_number for page_number, _ in ranked[:max(0, top_k)]]
+
+    def select_pages_for_checklist(
+        self,
+        checklist_items: List[Dict[str, Any]],
+        top_k: int,
+        front_matter_pages: int,
+    ) -> List[int]:
+        """Unions the per-item top-k pages with the document's front matter pages."""
+        selected: Set[int] = set(self.page_order[:max(0, front_matter_pages)])
+        for checklist_item in checklist_items:
+            query_text = " ".join([
+                str(checklist_item.get("section") or ""),
+                str(checklist_item.get("checklist_item") or ""),
+            ])
+            selected.update(self.top_pages(query_text, top_k))
+        return [page_number for page_number in self.page_order if page_number in selected]
+
+    def build_context(self, page_numbers: Iterable[int]) -> str:
+        """Reassembles the original marked segments for the selected pages in page order."""
+        wanted = set(page_numbers)
+        parts = [self.preamble] if self.preamble.strip() else []
+        for page_number in self.page_order:
+            if page_number in wanted:
+                parts.extend(self.page_segments[page_number])
+        return "".join(parts)
+
+
+def get_page_retrieval_settings() -> Dict[str, Any]:
+    """Settings that change model input and therefore belong in cache fingerprints."""
+    mode = os.getenv("LLM_PAGE_RETRIEVAL_MODE", "auto").strip().lower()
+    if mode not in {"auto", "on", "off"}:
+        mode = "auto"
+    return {
+        "mode": mode,
+        "top_k": max(1, safe_int_env("LLM_RETRIEVAL_TOP_K_PAGES", 3)),
+        "front_matter_pages": max(0, safe_int_env("LLM_RETRIEVAL_FRONT_MATTER_PAGES", 2)),
+        "min_document_tokens": max(0, safe_int_env("LLM_RETRIEVAL_MIN_DOC_TOKENS", 12000)),
+        "max_page_ratio_pct": max(1, min(100, safe_int_env("LLM_RETRIEVAL_MAX_PAGE_RATIO_PCT", 70))),
+    }
+
+
+class PageRetrievalPlanner:
+    """Decides per checklist batch whether to send a retrieved subset of pages."""
+
+    def __init__(self, text: str, document_tokens: int, markers: Optional[DocumentMarkers] = None):
+        """Initializes the planner from environment configuration.
+
+        Args:
+            text: Full parsed document text.
+            document_tokens: Token estimate for the full document text.
+            markers: Markers already scanned from ``text``, if available.
+        """
+        settings = get_page_retrieval_settings()
+        self.mode = settings["mode"]
+        self.top_k = settings["top_k"]
+        self.front_matter_pages = settings["front_matter_pages"]
+        self.min_document_tokens = settings["min_document_tokens"]
+        self.max_page_ratio = settings["max_page_ratio_pct"] / 100.0
+        self.document_tokens = document_tokens
+        self.index: Optional[PageRetrievalIndex] = None
+
+        if self.mode == "off":
+            return
+        if self.mode != "on" and document_tokens < self.min_document_tokens:
+            return
+        index = PageRetrievalIndex(text, markers)
+        if index.page_count > self.front_matter_pages:
+            self.index = index
+
+    @property
+    def enabled(self) -> bool:
+        return self.index is not None
+
+    def build_batch_context(self, checklist_batch: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Returns the reduced context for a batch, or None to send the full document."""
+        if not self.index or not checklist_batch:
+            return None
+
+        pages = self.index.select_pages_for_checklist(
+            checklist_batch,
+            top_k=self.top_k,
+            front_matter_pages=self.front_matter_pages,
+        )
+        if len(pages) >= self.index.page_count * self.max_page_ratio:
+            return None
+
+        return {
+            "pages": pages,
+            "content": self.index.build_context(pages),
+        }
@@ -27,6 +27,13 @@ from typing import Tuple, List, Dict, Any
 import xml.etree.ElementTree as ET
 import zipfile
 from config.logging_config import get_logger
+from services.figure_regions import (
+    cluster_figure_regions,
+    crop_region,
+    get_figure_crop_settings,
+    object_bbox,
+)
+from utils.env import is_truthy_env, safe_int_env
 
 logger = get_logger(__name__)
 
@@ -66,12 +73,8 @@ ALLOWED_MIME_TYPES = {
 }
 
 
-def _is_truthy_env(value: str) -> bool:
-    return value.strip().lower() in {"1", "true", "yes", "on"}
-
-
 def _docx_pagination_required() -> bool:
-    return _is_truthy_env(os.getenv("DOCX_PAGINATION_REQUIRED", "false"))
+    return is_truthy_env(os.getenv("DOCX_PAGINATION_REQUIRED", "false"))
 
 
 def _default_pagination_metadata() -> Dict[str, Any]:
@@ -107,14 +110,6 @@ def _extract_total_pages(text: str) -> int:
     return max(int(page) for page in matches)
 
 
-def _safe_int_env(name: str, default: int) -> int:
-    raw = os.getenv(name, str(default))
-    try:
-        return int(raw)
-    except (TypeError, ValueError):
-        return default
-
-
 def _safe_str(value: Any) -> str:
     if value is None:
         return ""
@@ -158,7 +153,7 @@ def _normalize_image_for_model(image: Image.Image) -> Image.Image:
     elif normalized.mode != "RGB":
         normalized = normalized.convert("RGB")
 
-    max_dimension = max(256, _safe_int_env("VISION_IMAGE_MAX_DIM", 1600))
+    max_dimension = max(256, safe_int_env("VISION_IMAGE_MAX_DIM", 1600))
     width, height = normalized.size
     longest_side = max(width, height)
     if longest_side > max_dimension:
@@ -175,7 +170,7 @@ def _normalize_image_for_model(image: Image.Image) -> Image.Image:
 def _prepare_image_for_model(image: Image.Image) -> tuple[Image.Image, str, int]:
     """Return normalized PIL image plus encoded JPEG payload details."""
     normalized = _normalize_image_for_model(image)
-    jpeg_quality = max(40, min(95, _safe_int_env("VISION_IMAGE_JPEG_QUALITY", 80)))
+    jpeg_quality = max(40, min(95, safe_int_env("VISION_IMAGE_JPEG_QUALITY", 80)))
     buffered = io.BytesIO()
     normalized.save(
         buffered,
@@ -377,7 +372,7 @@ async def parse_file(file: UploadFile) -> dict:
 
     try:
         if filename.endswith(".pdf"):
-            text_content, images = await _parse_pdf_from_bytes(content)
+            text_content, images, image_sources = await _parse_pdf_from_bytes(content)
             total_pages = _extract_total_pages(text_content)
             pagination_metadata = _build_pagination_metadata(
                 enabled=total_pages > 0,
@@ -386,6 +381,7 @@ async def parse_file(file: UploadFile) -> dict:
                 provider="native_pdf",
                 warning=None
             )
+            pagination_metadata["image_sources"] = image_sources
         elif filename.endswith(".docx"):
             text_content, images, pagination_metadata = await _parse_docx_from_bytes(content)
             logger.info(
@@ -430,19 +426,26 @@ async def parse_file(file: UploadFile) -> dict:
         raise HTTPException(status_code=500, detail="Error parsing file. Please check the file format and try again.")
 
 # Helper functions to handle bytes instead of UploadFile to avoid double reading
-async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
+async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str], List[Dict[str, Any]]]:
     """Extracts text and images from a PDF provided as bytes.
 
+    Pages with a compact figure contribute crops of the figure regions instead
+    of the full-page render; ``image_sources`` records the page (and region)
+    each image came from.
+
     Args:
         content: The raw PDF file content.
 
     Returns:
-        A tuple of (extracted_text, list_of_base64_images).
+        A tuple of (extracted_text, list_of_base64_images, image_sources).
     """
     text_parts: List[str] = []
     base64_images: List[str] = []
+    image_sources: List[Dict[str, Any]] = []
     page_text_lengths: List[int] = []
     page_visual_counts: List[Dict[str, int]] = []
+    page_figure_regions: List[List[Tuple[float, float, float, float]] | None] = []
+    page_sizes: List[Tuple[float, float]] = []
     table_rows = 0
     ocr_blocks = 0
     image_bytes_total = 0
@@ -450,10 +453,12 @@ async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
     ocr_mode = os.getenv("PDF_OCR_MODE", "always").strip().lower()
     if ocr_mode not in {"always", "auto", "off"}:
         ocr_mode = "always"
-    ocr_min_text_chars = _safe_int_env("PDF_OCR_MIN_TEXT_CHARS_PER_PAGE", 50)
-    ocr_max_pages = _safe_int_env("PDF_OCR_MAX_PAGES", 100)
-    ocr_visual_object_threshold = max(1, _safe_int_env("PDF_OCR_VISUAL_OBJECT_THRESHOLD", 8))
-    render_dpi = max(72, _safe_int_env("PDF_RENDER_DPI", 160))
+    ocr_min_text_chars = safe_int_env("PDF_OCR_MIN_TEXT_CHARS_PER_PAGE", 50)
+    ocr_max_pages = safe_int_env("PDF_OCR_MAX_PAGES", 100)
+    ocr_visual_object_threshold = max(1, safe_int_env("PDF_OCR_VISUAL_OBJECT_THRESHOLD", 8))
+    render_dpi = max(72, safe_int_env("PDF_RENDER_DPI", 160))
+    figure_settings = get_figure_crop_settings()
+    figure_crops = 0
 
     try:
         with pdfplumber.open(io.BytesIO(content)) as pdf:
@@ -466,7 +471,19 @@ async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
                 if page_text_clean:
                     text_parts.append(f"\n--- Page {i+1} Text ---\n{page_text}\n")
 
-                tables = page.extract_tables()
+                found_tables = page.find_tables()
+                tables = [table.extract() for table in found_tables]
+                page_sizes.append((float(page.width), float(page.height)))
+                if figure_settings["mode"] == "off":
+                    page_figure_regions.append(None)
+                else:
+                    page_figure_regions.append(cluster_figure_regions(
+                        (object_bbox(obj) for obj in page.images + page.rects + page.curves),
+                        float(page.width),
+                        float(page.height),
+                        [table.bbox for table in found_tables],
+                        figure_settings,
+                    ))
                 if tables:
                     text_parts.append(f"\n--- Page {i+1} Tables ---\n")
                     for table_idx, table in enumerate(tables):
@@ -479,12 +496,42 @@ async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
 
                 text_parts.append(_format_pdf_visual_metadata(i + 1, visual_counts))
 
+        # Crops are taken from a sharper render so small diagram labels stay legible. The document is
+        # rendered once at that resolution and pages are scaled down for page images and OCR.
+        page_dpi = render_dpi
+        if any(page_figure_regions) and figure_settings["render_dpi"] > render_dpi:
+            page_dpi = figure_settings["render_dpi"]
+
         # Process images with OCR in non-blocking manner
-        images = convert_from_bytes(content, dpi=render_dpi)
-        for i, img in enumerate(images):
-            normalized_img, img_b64, image_bytes = _prepare_image_for_model(img)
-            base64_images.append(img_b64)
-            image_bytes_total += image_bytes
+        images = convert_from_bytes(content, dpi=page_dpi)
+        for i, rendered_img in enumerate(images):
+            img = rendered_img
+            if page_dpi != render_dpi:
+                scale = render_dpi / float(page_dpi)
+                img = rendered_img.resize(
+                    (max(1, round(rendered_img.width * scale)), max(1, round(rendered_img.height * scale))),
+                    Image.LANCZOS,
+                )
+            regions = page_figure_regions[i] if i < len(page_figure_regions) else None
+            if regions:
+                figure_img = rendered_img
+                page_width, page_height = page_sizes[i]
+                for region in regions:
+                    crop = crop_region(figure_img, region, page_width, page_height, figure_settings["padding_pt"])
+                    _, crop_b64, crop_bytes = _prepare_image_for_model(crop)
+                    base64_images.append(crop_b64)
+                    image_sources.append({
+                        "page": i + 1,
+                        "region": "figure",
+                        "bbox": [round(value, 1) for value in region],
+                    })
+                    image_bytes_total += crop_bytes
+                    figure_crops += 1
+            else:
+                _, img_b64, image_bytes = _prepare_image_for_model(img)
+                base64_images.append(img_b64)
+                image_sources.append({"page": i + 1, "region": "page"})
+                image_bytes_total += image_bytes
 
             if ocr_mode == "off":
                 should_ocr = False
@@ -519,6 +566,7 @@ async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
         f"pages={len(page_text_lengths)} "
         f"tables_rows={table_rows} "
         f"images_extracted={len(base64_images)} "
+        f"figure_crops={figure_crops} "
         f"image_bytes_total={image_bytes_total} "
         f"ocr_blocks={ocr_blocks} "
         f"ocr_mode={ocr_mode} "
@@ -526,7 +574,7 @@ async def _parse_pdf_from_bytes(content: bytes) -> Tuple[str, List[str]]:
         f"render_dpi={render_dpi} "
         f"text_chars={len(text)}"
     )
-    return text, base64_images
+    return text, base64_images, image_sources
 
 
 async def _parse_docx_from_bytes(content: bytes) -> Tuple[str, List[str], Dict[str, Any]]:
@@ -544,7 +592,7 @@ async def _parse_docx_from_bytes(content: bytes) -> Tuple[str, List[str], Dict[s
     logger.info("DOCX pagination: attempting LibreOffice conversion for page-accurate references.")
     try:
         converted_pdf_bytes = await _convert_docx_to_pdf_with_libreoffice(content)
-        text, base64_images = await _parse_pdf_from_bytes(converted_pdf_bytes)
+        text, base64_images, image_sources = await _parse_pdf_from_bytes(converted_pdf_bytes)
         total_pages = _extract_total_pages(text)
         if total_pages <= 0:
             conversion_error = "Converted PDF did not contain usable page markers."
@@ -557,6 +605,7 @@ async def _parse_docx_from_bytes(content: bytes) -> Tuple[str, List[str], Dict[s
             provider="libreoffice_pdf",
             warning=None,
         )
+        pagination_metadata["image_sources"] = image_sources
         logger.info(
             f"DOCX pagination enabled via LibreOffice PDF conversion. total_pages={total_pages}, "
             f"images_extracted={len(base64_images)}"
@@ -0,0 +1,95 @@
+"""Single-flight coalescing of identical in-flight async work.
+
+When several requests ask for the same result at the same time, the first
+caller (the leader) does the work and every other caller (a follower) awaits
+the leader's result instead of repeating it.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config.logging_config import get_logger
+from services.metrics import metrics
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution."""
+
+    def __init__(self, name: str):
+        """Initializes an empty flight group.
+
+        Args:
+            name: Label used in logs and metrics to tell flight groups apart.
+        """
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> Optional[asyncio.Future]:
+        """Returns the in-flight future for ``key``, if any."""
+        return self._inflight.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Registers the caller as leader for ``key`` and returns the future to resolve.
+
+        Used when the leader produces its result incrementally (for example a
+        streamed response) and resolves it with `finish` or `abandon`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future)
+        return future
+
+    def finish(self, key: str, future: asyncio.Future, result: Any) -> None:
+        """Publishes the leader's result to all followers."""
+        if not future.done():
+            future.set_result(result)
+
+    def abandon(self, key: str, future: asyncio.Future) -> None:
+        """Marks a leader as gone without a result; followers will retry on their own."""
+        if not future.done():
+            future.cancel()
+
+    def _register(self, key: str, future: asyncio.Future) -> None:
+        self._inflight[key] = future
+        metrics.increment("single_flight_leaders_total", flight=self.name)
+        metrics.set_gauge("single_flight_inflight", len(self._inflight), flight=self.name)
+
+        def _release(done_future: asyncio.Future) -> None:
+            if self._inflight.get(key) is done_future:
+                del self._inflight[key]
+            metrics.set_gauge("single_flight_inflight", len(self._inflight), flight=self.name)
+
+        future.add_done_callback(_release)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Runs ``factory`` once per key across concurrent callers.
+
+        The work runs in its own task so a leader that disconnects does not
+        cancel it for followers.
+
+        Args:
+            key: Identity of the work, e.g. a request fingerprint.
+            factory: Zero-argument coroutine function producing the result.
+
+        Returns:
+            A tuple of (result, coalesced), where coalesced is True for followers.
+            Followers receive the same object as the leader and must copy it
+            before mutating.
+        """
+        while True:
+            existing = self._inflight.get(key)
+            if existing is None:
+                task = asyncio.ensure_future(factory())
+                self._register(key, task)
+                return await asyncio.shield(task), False
+
+            metrics.increment("single_flight_coalesced_total", flight=self.name)
+            logger.info(f"single_flight={self.name} coalesced request key={key[:12]}")
+            try:
+                return await asyncio.shield(existing), True
+            except asyncio.CancelledError:
+                if existing.cancelled():
+                    # The leader abandoned the work; loop to lead or follow a new flight.
+                    metrics.increment("single_flight_abandoned_total", flight=self.name)
+                    continue
+                raise
@@ -0,0 +1,251 @@
+"""Global symbol map for CAR archive analysis.
+
+Every CAR chunk is reviewed with a short map of all embedded files and their
+key symbols so the model can reason about cross-file references. Per-file
+symbols are cached by content hash, so re-analyzing an archive (for example
+against another checklist category) reuses them. Large uncached archives are
+extracted in a worker process pool; workers are spawned rather than forked
+from the server process and only receive the head of each file they scan.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from config.logging_config import get_logger
+from services.metrics import metrics
+from utils.env import safe_int_env
+
+logger = get_logger(__name__)
+
+SYMBOL_EXTRACTOR_VERSION = "symbols_v2"
+# Only the head of a file is scanned; OIC artifacts declare their identity up front.
+SYMBOL_SCAN_CHARS = 200_000
+XML_ELEMENT_SCAN_CHARS = 5000
+MAX_VALUES_PER_KIND = 5
+MAX_VALUE_CHARS = 80
+MAX_FILE_SUMMARY_CHARS = 400
+
+GLOBAL_CONTEXT_HEADER = "GLOBAL CONTEXT (The following files and symbols exist across the entire document/archive):"
+
+XML_ELEMENT_PATTERN = re.compile(r'<([\w:-]+)')
+CLASS_PATTERN = re.compile(r'class\s+([\w\d_]+)')
+FUNCTION_PATTERN = re.compile(r'def\s+([\w\d_]+)')
+
+
+def _named_value_pattern(names: str) -> "re.Pattern[str]":
+    """Matches ``<name>value</name>`` elements, ``name="value"`` attributes and ``name=value`` properties."""
+    return re.compile(
+        rf'<(?:[\w-]+:)?(?:{names})>\s*([^<\s][^<]*?)\s*</'
+        rf'|\b(?:{names})\s*=\s*["\']([^"\']+)["\']'
+        rf'|^[ \t]*(?:{names})[ \t]*[=:][ \t]*([^\s"\'<>]+)',
+        re.IGNORECASE | re.MULTILINE,
+    )
+
+
+INTEGRATION_PATTERN = _named_value_pattern(
+    r'projectName|projectCode|integrationName|integrationCode|flowName'
+)
+CONNECTION_PATTERN = _named_value_pattern(
+    r'connectionId|connectionName|connectionRef|connection-factory\s+location|adapter-config\s+name'
+)
+LOOKUP_PATTERN = re.compile(
+    r'lookupValue\s*\(\s*["\']([^"\']+)["\']'
+    r'|\blookupName\s*=\s*["\']([^"\']+)["\']'
+    r'|<(?:[\w-]+:)?lookupName>\s*([^<\s][^<]*?)\s*</',
+    re.IGNORECASE,
+)
+
+
+def _unique_values(pattern: "re.Pattern[str]", content: str) -> List[str]:
+    values: List[str] = []
+    seen = set()
+    for match in pattern.finditer(content):
+        value = next((group for group in match.groups() if group), "").strip()
+        if not value:
+            continue
+        value = value[:MAX_VALUE_CHARS]
+        if value not in seen:
+            seen.add(value)
+            values.append(value)
+            if len(values) >= MAX_VALUES_PER_KIND:
+                break
+    return values
+
+
+def extract_file_symbols(content: str) -> Dict[str, List[str]]:
+    """Extracts bounded symbol lists from one archive member.
+
+    Runs in worker processes, so it must stay a module-level pure function.
+    """
+    content = content or ""
+    head = content[:SYMBOL_SCAN_CHARS]
+    xml_elements = XML_ELEMENT_PATTERN.findall(content[:XML_ELEMENT_SCAN_CHARS])
+    return {
+        "root": xml_elements[:1],
+        "xml_elements": sorted(set(xml_elements))[:10],
+        "integrations": _unique_values(INTEGRATION_PATTERN, head),
+        "connections": _unique_values(CONNECTION_PATTERN, head),
+        "lookups": _unique_values(LOOKUP_PATTERN, head),
+        "classes": CLASS_PATTERN.findall(head)[:MAX_VALUES_PER_KIND],
+        "functions": FUNCTION_PATTERN.findall(head)[:MAX_VALUES_PER_KIND],
+    }
+
+
+def format_file_summary(filename: str, symbols: Dict[str, List[str]]) -> str:
+    file_summary = f"- File: {filename}"
+    for label, key in (
+        ("Root", "root"),
+        ("XML Elements", "xml_elements"),
+        ("Integration", "integrations"),
+        ("Connections", "connections"),
+        ("Lookups", "lookups"),
+        ("Classes", "classes"),
+        ("Functions", "functions"),
+    ):
+        values = symbols.get(key) or []
+        if values:
+            file_summary += f" [{label}: {', '.join(values)}]"
+    if len(file_summary) > MAX_FILE_SUMMARY_CHARS:
+        file_summary = file_summary[:MAX_FILE_SUMMARY_CHARS - 3] + "..."
+    return file_summary
+
+
+class SymbolSummaryCache:
+    """Bounded LRU of per-file symbols keyed by content hash."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_key(content: str) -> str:
+        digest = hashlib.sha256((content or "").encode("utf-8", errors="replace")).hexdigest()
+        return f"{SYMBOL_EXTRACTOR_VERSION}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, List[str]]]:
+        with self._lock:
+            symbols = self._entries.get(key)
+            if symbols is not None:
+                self._entries.move_to_end(key)
+            return symbols
+
+    def put(self, key: str, symbols: Dict[str, List[str]]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = symbols
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class GlobalSymbolMapBuilder:
+    """Builds the global context map, reusing cached per-file symbols."""
+
+    def __init__(self):
+        """Reads cache and pool sizing from the environment; the pool starts lazily."""
+        self.cache = SymbolSummaryCache(max(0, safe_int_env("LLM_SYMBOL_CACHE_MAX_ENTRIES", 4096)))
+        self.max_workers = max(0, safe_int_env("LLM_SYMBOL_MAP_WORKERS", min(4, os.cpu_count() or 1)))
+        self.parallel_min_chars = max(0, safe_int_env("LLM_SYMBOL_MAP_PARALLEL_MIN_CHARS", 500_000))
+        self.max_map_chars = max(0, safe_int_env("LLM_SYMBOL_MAP_MAX_CHARS", 24_000))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 1:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                # Forking a process that runs an event loop and threads can copy held locks; spawn clean workers.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset_executor(self) -> None:
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _extract_missing(self, contents: Dict[str, str]) -> Dict[str, Dict[str, List[str]]]:
+        # Extraction never looks past the head, so neither the pool decision nor the workers need the rest.
+        contents = {key: (content or "")[:SYMBOL_SCAN_CHARS] for key, content in contents.items()}
+        total_chars = sum(len(content) for content in contents.values())
+        executor = (
+            self._get_executor()
+            if len(contents) > 1 and total_chars >= self.parallel_min_chars
+            else None
+        )
+        if executor is None:
+            return {key: extract_file_symbols(content) for key, content in contents.items()}
+
+        loop = asyncio.get_running_loop()
+        keys = list(contents)
+        try:
+            extracted = await asyncio.gather(*[
+                loop.run_in_executor(executor, extract_file_symbols, contents[key])
+                for key in keys
+            ])
+        except BrokenProcessPool as exc:
+            logger.warning(f"Symbol map worker pool failed ({str(exc)}); extracting inline")
+            self._reset_executor()
+            return {key: extract_file_symbols(content) for key, content in contents.items()}
+        return dict(zip(keys, extracted))
+
+    async def build(self, files: List[Dict[str, str]]) -> str:
+        """Returns the global context block for ``files``, or "" when there are none.
+
+        Args:
+            files: Archive members as ``{"filename": ..., "content": ...}`` dicts.
+        """
+        if not files:
+            return ""
+
+        file_keys: List[str] = []
+        symbols_by_key: Dict[str, Dict[str, List[str]]] = {}
+        missing: Dict[str, str] = {}
+        for file_info in files:
+            content = file_info.get("content", "")
+            key = self.cache.build_key(content)
+            file_keys.append(key)
+            if key in symbols_by_key or key in missing:
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                symbols_by_key[key] = cached
+            else:
+                missing[key] = content
+
+        metrics.increment("symbol_map_cache_hits_total", len(symbols_by_key))
+        metrics.increment("symbol_map_cache_misses_total", len(missing))
+        if missing:
+            extracted = await self._extract_missing(missing)
+            for key, symbols in extracted.items():
+                self.cache.put(key, symbols)
+            symbols_by_key.update(extracted)
+
+        summary_parts = [GLOBAL_CONTEXT_HEADER]
+        used_chars = len(GLOBAL_CONTEXT_HEADER)
+        for index, (file_info, key) in enumerate(zip(files, file_keys)):
+            file_summary = format_file_summary(file_info.get("filename", "unknown"), symbols_by_key[key])
+            if self.max_map_chars and used_chars + len(file_summary) + 1 > self.max_map_chars:
+                summary_parts.append(f"- ... {len(files) - index} more files not listed")
+                break
+            summary_parts.append(file_summary)
+            used_chars += len(file_summary) + 1
+
+        return "\n".join(summary_parts) + "\n\n"
+
+
+# Singleton instance
+global_symbol_maps = GlobalSymbolMapBuilder()
@@ -0,0 +1,153 @@
+"""Choice of which rendered pages to send when a document has more than the image budget.
+
+PDF parsing renders each page (or crops its figures) and records per-page
+visual object counts and OCR text. Sending the first N pages spends the budget on title
+pages and revision tables; this module ranks pages by how much they look
+like figures (embedded images, shapes, curves), by how much text only OCR
+could read (text drawn inside pictures and screenshots), and by how well
+they match checklist items that ask about diagrams or screenshots.
+"""
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from services.document_markers import DocumentMarkers
+
+VISUAL_COUNT_PATTERN = re.compile(r'^(image|line|rect|curve)_objects=(\d+)\s*$', re.MULTILINE)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+VISUAL_ITEM_PATTERN = re.compile(
+    r'diagram|screenshot|screen ?shot|architecture|flow ?chart|figure|illustrat|'
+    r'wireframe|mock-?up|visual|image|chart|graph|topology|swim ?lane'
+)
+# Words on a page that usually caption or introduce a figure.
+FIGURE_CUE_WORDS = frozenset({
+    "figure", "fig", "diagram", "screenshot", "architecture", "flowchart", "chart", "topology", "illustration",
+})
+ITEM_STOP_WORDS = frozenset({
+    "about", "above", "should", "there", "their", "these", "those", "which", "where", "whether",
+    "document", "documented", "provided", "include", "included", "includes", "clearly", "defined",
+})
+MIN_ITEM_TERM_CHARS = 5
+MAX_ITEM_TERM_MATCHES = 5
+
+IMAGE_OBJECT_WEIGHT = 2.0
+SHAPE_OBJECT_WEIGHT = 1.0
+LINE_OBJECT_WEIGHT = 0.25
+OCR_ONLY_TOKEN_WEIGHT = 0.5
+FIGURE_CUE_WEIGHT = 1.0
+ITEM_TERM_WEIGHT = 0.3
+# Visual evidence counts for more when the checklist actually asks about visuals.
+VISUAL_CHECKLIST_MULTIPLIER = 1.5
+
+
+def get_vision_page_selection_mode() -> str:
+    """Returns ``density`` (rank pages) or ``first`` (first N pages, the old behavior)."""
+    mode = os.getenv("LLM_VISION_PAGE_SELECTION", "density").strip().lower()
+    return mode if mode in {"density", "first"} else "density"
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(TOKEN_PATTERN.findall((text or "").lower()))
+
+
+def _collect_page_features(markers: DocumentMarkers) -> Dict[int, Dict[str, Any]]:
+    features: Dict[int, Dict[str, Any]] = {}
+    text = markers.text
+    for page_number, start, end, segment_end in markers.page_sections:
+        page = features.setdefault(page_number, {"counts": {}, "text_tokens": set(), "ocr_tokens": set()})
+        header = text[start:end]
+        body = text[end:segment_end]
+        if header.endswith("Visual Metadata ---"):
+            for name, value in VISUAL_COUNT_PATTERN.findall(body):
+                page["counts"][name] = int(value)
+        elif header.endswith("OCR ---"):
+            page["ocr_tokens"] |= _tokens(body)
+        else:
+            page["text_tokens"] |= _tokens(body)
+    return features
+
+
+def _item_terms(items: Sequence[Dict[str, Any]]) -> Set[str]:
+    terms: Set[str] = set()
+    for item in items:
+        for token in _tokens(f"{item.get('section') or ''} {item.get('checklist_item') or ''}"):
+            if len(token) >= MIN_ITEM_TERM_CHARS and token not in ITEM_STOP_WORDS:
+                terms.add(token)
+    return terms
+
+
+def score_pages(markers: DocumentMarkers, checklist: Sequence[Dict[str, Any]]) -> Dict[int, float]:
+    """Scores every page carrying visual metadata; higher means more worth sending as an image."""
+    visual_items = [
+        item for item in checklist
+        if VISUAL_ITEM_PATTERN.search(f"{item.get('section') or ''} {item.get('checklist_item') or ''}".lower())
+    ]
+    item_terms = _item_terms(visual_items)
+    visual_multiplier = VISUAL_CHECKLIST_MULTIPLIER if visual_items else 1.0
+
+    scores: Dict[int, float] = {}
+    for page_number, page in _collect_page_features(markers).items():
+        counts = page["counts"]
+        if not counts:
+            continue
+        visual_score = (
+            IMAGE_OBJECT_WEIGHT * math.log1p(counts.get("image", 0))
+            + SHAPE_OBJECT_WEIGHT * math.log1p(counts.get("rect", 0) + counts.get("curve", 0))
+            + LINE_OBJECT_WEIGHT * math.log1p(counts.get("line", 0))
+        )
+        # Words OCR read that the text layer does not have were drawn inside a picture.
+        ocr_only_tokens = page["ocr_tokens"] - page["text_tokens"]
+        visual_score += OCR_ONLY_TOKEN_WEIGHT * math.log1p(len(ocr_only_tokens))
+        score = visual_score * visual_multiplier
+
+        if visual_items:
+            page_tokens = page["text_tokens"] | page["ocr_tokens"]
+            if page_tokens & FIGURE_CUE_WORDS:
+                score += FIGURE_CUE_WEIGHT
+            score += ITEM_TERM_WEIGHT * min(MAX_ITEM_TERM_MATCHES, len(page_tokens & item_terms))
+        scores[page_number] = score
+    return scores
+
+
+def select_page_images(
+    markers: DocumentMarkers,
+    image_count: int,
+    budget: int,
+    checklist: Sequence[Dict[str, Any]],
+    image_pages: Optional[Sequence[Optional[int]]] = None,
+) -> List[int]:
+    """Returns the 0-based indexes of the images to send, in document order.
+
+    Ranking applies when every image can be tied to a page: either through
+    ``image_pages`` (the parser's image sources, where a page may contribute
+    several figure crops) or because there is exactly one image per page
+    marker. Embedded-image lists from other formats, and ``first`` mode, keep
+    the first ``budget`` images.
+
+    Args:
+        markers: Markers of the parsed document the images belong to.
+        image_count: Number of images extracted for the document.
+        budget: Maximum number of images to send.
+        checklist: Checklist items still needing a verdict.
+        image_pages: Optional page number of each image.
+    """
+    budget = max(0, budget)
+    if image_count <= budget:
+        return list(range(image_count))
+    first_pages = list(range(budget))
+    if get_vision_page_selection_mode() != "density":
+        return first_pages
+    if image_pages is not None and len(image_pages) == image_count and all(image_pages):
+        pages = [int(page) for page in image_pages]
+    elif markers.max_page_number == image_count:
+        pages = [index + 1 for index in range(image_count)]
+    else:
+        return first_pages
+
+    scores = score_pages(markers, checklist)
+    if not scores:
+        return first_pages
+    ranked = sorted(range(image_count), key=lambda index: (-scores.get(pages[index], 0.0), index))
+    return sorted(ranked[:budget])
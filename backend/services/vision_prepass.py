@@ -0,0 +1,137 @@
+"""Vision pre-pass: describe page images once and reuse the text across batches.
+
+Without it, the same shared page images are attached to every checklist
+batch of a document. With ``LLM_VISION_PREPASS_MODE`` enabled, one vision call
+per image batch turns the images into structured text descriptions, which are
+injected into every batch instead. Descriptions are cached by image hash per
+provider/model, so re-analyzing a document does not describe its images again.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config.logging_config import get_logger
+from utils.env import safe_int_env
+
+logger = get_logger(__name__)
+
+VISION_PREPASS_VERSION = "vision_prepass_v1"
+
+VISION_DESCRIPTION_PROMPT = """You describe document page images for an auditor who cannot see them.
+For every attached image, in order, report only what is actually visible. Do not guess at content that is not shown.
+
+Return a JSON object:
+{
+    "images": [
+        {
+            "image_index": <1-based position of the image in this message>,
+            "visual_type": "<diagram | flowchart | architecture | screenshot | table | chart | form | text_only | other>",
+            "title": "<visible title or heading, or empty>",
+            "labels": ["<text labels on shapes, boxes, arrows, axes or UI elements>"],
+            "tables": [{"caption": "<caption or empty>", "columns": ["<column headers>"], "row_count": <approximate number of rows>}],
+            "summary": "<two or three factual sentences on what the image shows>"
+        }
+    ]
+}"""
+
+MAX_LABELS_PER_IMAGE = 40
+MAX_TABLES_PER_IMAGE = 5
+
+
+def get_vision_prepass_mode() -> str:
+    """Returns ``off``, ``on`` (always describe) or ``auto`` (only when images would be re-sent)."""
+    mode = os.getenv("LLM_VISION_PREPASS_MODE", "off").strip().lower()
+    return mode if mode in {"off", "on", "auto"} else "off"
+
+
+def hash_image(image_b64: str) -> str:
+    return hashlib.sha256((image_b64 or "").encode("utf-8")).hexdigest()
+
+
+def normalize_image_description(raw: Any) -> Dict[str, Any]:
+    """Coerces one model-produced description into a bounded, predictable shape."""
+    raw = raw if isinstance(raw, dict) else {}
+    labels = [str(label).strip() for label in raw.get("labels") or [] if str(label).strip()]
+    tables = []
+    for table in (raw.get("tables") or [])[:MAX_TABLES_PER_IMAGE]:
+        if not isinstance(table, dict):
+            continue
+        tables.append({
+            "caption": str(table.get("caption") or "").strip(),
+            "columns": [str(column).strip() for column in table.get("columns") or [] if str(column).strip()],
+            "row_count": table.get("row_count"),
+        })
+    return {
+        "visual_type": str(raw.get("visual_type") or "other").strip().lower(),
+        "title": str(raw.get("title") or "").strip(),
+        "labels": labels[:MAX_LABELS_PER_IMAGE],
+        "tables": tables,
+        "summary": str(raw.get("summary") or "").strip(),
+    }
+
+
+def format_image_descriptions(descriptions: List[Dict[str, Any]], sources: Optional[List[str]] = None) -> str:
+    """Renders descriptions as a text block that stands in for the attached images.
+
+    Args:
+        descriptions: Normalized descriptions, one per image.
+        sources: Optional provenance label per image (for example the page it came from).
+    """
+    parts = [
+        "--- Page Image Descriptions ---",
+        "The page images for this document were described by a separate vision pass. "
+        "Treat these descriptions as the attached page images when judging visual artifacts.",
+    ]
+    for index, description in enumerate(descriptions, start=1):
+        source = f" [{sources[index - 1]}]" if sources and index <= len(sources) and sources[index - 1] else ""
+        lines = [f"Image {index}{source}: type={description.get('visual_type') or 'other'}"]
+        if description.get("title"):
+            lines.append(f"  Title: {description['title']}")
+        if description.get("labels"):
+            lines.append(f"  Labels: {', '.join(description['labels'])}")
+        for table in description.get("tables") or []:
+            table_line = f"  Table: {table.get('caption') or 'untitled'}"
+            if table.get("columns"):
+                table_line += f" | Columns: {', '.join(table['columns'])}"
+            if table.get("row_count") not in (None, ""):
+                table_line += f" | Rows: {table['row_count']}"
+            lines.append(table_line)
+        if description.get("summary"):
+            lines.append(f"  Summary: {description['summary']}")
+        parts.append("\n".join(lines))
+    return "\n".join(parts)
+
+
+class ImageDescriptionCache:
+    """Bounded LRU of image descriptions keyed by model and image hash."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_key(provider: str, model_name: str, image_hash: str) -> str:
+        return f"{VISION_PREPASS_VERSION}:{provider}/{model_name}:{image_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            description = self._entries.get(key)
+            if description is not None:
+                self._entries.move_to_end(key)
+            return description
+
+    def put(self, key: str, description: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = description
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Singleton instance
+image_descriptions = ImageDescriptionCache(max(0, safe_int_env("LLM_VISION_PREPASS_CACHE_MAX_ENTRIES", 2048)))
@@ -0,0 +1,25 @@
+"""Helpers for reading typed settings from environment variables."""
+import os
+
+
+def is_truthy_env(value: str) -> bool:
+    """Returns True for the usual spellings of an enabled flag ("1", "true", "yes", "on")."""
+    return str(value).strip().lower() in {"1", "true", "yes", "on"}
+
+
+def safe_int_env(name: str, default: int) -> int:
+    """Reads an integer environment variable, falling back to ``default`` when unset or invalid."""
+    raw = os.getenv(name, str(default))
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        return default
+
+
+def safe_float_env(name: str, default: float) -> float:
+    """Reads a float environment variable, falling back to ``default`` when unset or invalid."""
+    raw = os.getenv(name, str(default))
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return default
@@ -33,6 +33,13 @@ export interface PaginationMetadata {
   total_pages: number | null;
   provider: string;
   warning: string | null;
+  image_sources?: ImageSource[];
+}
+
+export interface ImageSource {
+  page: number;
+  region: "page" | "figure";
+  bbox?: number[];
 }
 
 export interface AnalysisMetadata {
@@ -60,11 +67,20 @@ export interface CodeFileReview {
   score: number;
   highlights: string[];
   suggestions: string[];
+  reviewed_ranges?: { start_line: number; end_line: number }[];
+  metrics?: Record<string, number>;
 }
 
 export interface CodeAnalysisResponse {
   overall_score: number;
   files: CodeFileReview[];
+  analysis_metadata?: {
+    cache_hits?: number;
+    files_reviewed?: number;
+    files_changed?: number;
+    changed_lines?: number;
+    context_lines?: number;
+  };
 }
 
 export interface AnalyzeDocumentRequest {
@@ -81,6 +97,14 @@ export interface AnalyzeDocumentRequest {
 
 export interface AnalyzeCodeRequest {
   files: { filename: string; content: string }[];
+  force_refresh?: boolean;
+}
+
+export interface AnalyzeCodeDiffRequest {
+  diff?: string;
+  base_files?: { filename: string; content: string }[];
+  head_files?: { filename: string; content: string }[];
+  context_lines?: number;
 }
 
 export interface AutoFixRequest {
@@ -89,8 +113,17 @@ export interface AutoFixRequest {
     selected_suggestions: string[];
 }
 
+export interface AutoFixValidation {
+    status: 'valid' | 'repaired' | 'invalid' | 'skipped';
+    error?: { line: number; message: string };
+    repaired_error?: { line: number; message: string };
+}
+
 export interface AutoFixResponse {
     fixed_code: string;
+    fix_mode?: 'patch' | 'full';
+    input_scope?: 'region' | 'file';
+    validation?: AutoFixValidation;
 }
 
 export interface BatchAutoFixRequest {
@@ -105,5 +138,9 @@ export interface BatchAutoFixResponse {
     fixed_files: {
         filename: string;
         fixed_code: string;
+        fix_mode?: 'patch' | 'full';
+        status?: 'fixed' | 'failed' | 'unchanged';
+        error?: string;
+        validation?: AutoFixValidation;
     }[];
 }